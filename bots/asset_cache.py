@@ -0,0 +1,126 @@
+# external packages
+import json
+import os
+import threading
+import time
+from typing import Callable
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("asset_cache")
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".tabot", "asset_cache")
+# asset lists barely change - a day old is fine, and a stale copy is still used while refreshing
+DEFAULT_TTL_SECONDS = 24 * 60 * 60
+
+
+class AssetCache:
+    """TTL'd on-disk cache of a broker's asset metadata
+
+    loader is whatever downloads the asset list from the broker and returns something json
+    serialisable. On startup a cached copy is used if there is one (even if it's stale, in which
+    case a refresh is kicked off in the background), so only the very first run pays for the
+    download. on_refresh is called with the new payload whenever a background refresh finishes
+    """
+
+    def __init__(
+        self,
+        broker_name: str,
+        loader: Callable,
+        on_refresh: Callable = None,
+        cache_dir: str = DEFAULT_CACHE_DIR,
+        ttl: float = DEFAULT_TTL_SECONDS,
+        clock: Callable = time.time,
+    ):
+        self.broker_name = broker_name
+        self.loader = loader
+        self.on_refresh = on_refresh
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self.clock = clock
+        self.path = os.path.join(cache_dir, f"{broker_name}_assets.json")
+        self.saved_at = None
+        self._refresh_thread = None
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path, "r") as f:
+                cached = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError) as e:
+            log_wp.warning(f"{self.broker_name}: Ignoring unreadable asset cache {self.path}: {e}")
+            return None
+
+        self.saved_at = cached["saved_at"]
+        return cached["payload"]
+
+    def _write(self, payload):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        saved_at = self.clock()
+        # write then rename so a crash mid-write never leaves a half baked cache behind
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump({"saved_at": saved_at, "payload": payload}, f)
+        os.replace(temp_path, self.path)
+        self.saved_at = saved_at
+
+    def is_stale(self) -> bool:
+        if self.saved_at is None:
+            return True
+        return self.clock() - self.saved_at > self.ttl
+
+    def load(self):
+        """Returns the cached payload, downloading it first if there is nothing on disk"""
+        payload = self._read()
+        if payload is None:
+            log_wp.debug(f"{self.broker_name}: No cached asset list, downloading it")
+            return self.refresh()
+
+        log_wp.log(9, f"{self.broker_name}: Loaded asset list from {self.path}")
+        self.refresh_if_stale()
+        return payload
+
+    def refresh(self):
+        start_time = time.time()
+        payload = self.loader()
+        self._write(payload)
+        log_wp.debug(
+            f"{self.broker_name}: Refreshed asset list in {round(time.time() - start_time,1)}s"
+        )
+        return payload
+
+    def _background_refresh(self):
+        try:
+            payload = self.refresh()
+        except Exception as e:
+            log_wp.error(f"{self.broker_name}: Background asset list refresh failed: {e}")
+            return
+
+        if self.on_refresh:
+            self.on_refresh(payload)
+
+    def refresh_if_stale(self) -> bool:
+        """Kicks off a background refresh if the cache is past its TTL, returns True if it did"""
+        if not self.is_stale():
+            return False
+
+        with self._lock:
+            if self._refresh_thread is not None and self._refresh_thread.is_alive():
+                return False
+
+            self._refresh_thread = threading.Thread(
+                target=self._background_refresh,
+                name=f"{self.broker_name}_asset_refresh",
+                daemon=True,
+            )
+            self._refresh_thread.start()
+
+        return True
+
+    def wait_for_refresh(self, timeout: float = None):
+        thread = self._refresh_thread
+        if thread is not None:
+            thread.join(timeout)
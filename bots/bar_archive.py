@@ -0,0 +1,273 @@
+# external packages
+import argparse
+import glob
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("bar_archive")
+
+# years of bars on disk, read through np.memmap so only what's asked for gets paged into memory.
+# yahoo only goes back ~59 days for 5m bars (6 for 1m), so deep back tests need bars we've been
+# keeping ourselves. each symbol/interval is a directory of fixed width columns:
+#
+#   {root}/{interval}/{symbol}/index.bin      int64 UTC nanoseconds, sorted
+#   {root}/{interval}/{symbol}/{column}.bin   one per column - strings are stored as int16 codes
+#   {root}/{interval}/{symbol}/meta.json      rows, dtypes and the string columns' categories
+#
+# meta.json is written last, and readers never go past its row count - so a half finished append
+# is just ignored (and cut off by the next one). a rewrite writes a whole new generation of files
+# (index.1.bin, Close.1.bin...) next to the old ones and only switches meta.json over once they're
+# done, so one that doesn't finish leaves the old bars as they were
+#
+#   archive = BarArchive("/data/archive", "5m")
+#   archive.append("BTC-USD", new_bars)                   # only writes the new rows
+#   archive.read("BTC-USD", start, end, lookback=300)     # binary search, then a slice
+#
+#   python bar_archive.py --bars_path ./bars --archive_path /data/archive --interval 5m
+
+INDEX_COLUMN = "index"
+META_FILE = "meta.json"
+CODES_DTYPE = np.dtype("<i2")
+
+
+class BarArchive:
+    def __init__(self, root: str, interval: str):
+        self.root = root
+        self.interval = interval
+        self._meta = {}
+
+    def _path(self, symbol: str, file_name: str = "") -> str:
+        return os.path.join(self.root, self.interval, symbol, file_name)
+
+    def symbols(self) -> list:
+        directory = os.path.join(self.root, self.interval)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(
+            symbol
+            for symbol in os.listdir(directory)
+            if os.path.exists(self._path(symbol, META_FILE))
+        )
+
+    def meta(self, symbol: str) -> dict:
+        if symbol not in self._meta:
+            try:
+                with open(self._path(symbol, META_FILE)) as f:
+                    self._meta[symbol] = json.load(f)
+            except FileNotFoundError:
+                return None
+        return self._meta[symbol]
+
+    def _write_meta(self, symbol: str, meta: dict):
+        temp_path = self._path(symbol, META_FILE + ".tmp")
+        with open(temp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, self._path(symbol, META_FILE))
+        self._meta[symbol] = meta
+
+    def _memmap(self, symbol: str, file_name: str, dtype, rows: int) -> np.ndarray:
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(symbol, file_name), dtype=dtype, mode="r", shape=(rows,))
+
+    def index(self, symbol: str) -> np.ndarray:
+        """The symbol's timestamps (int64 UTC nanoseconds), memory mapped"""
+        meta = self.meta(symbol)
+        if meta is None:
+            return np.empty(0, dtype="<i8")
+        return self._memmap(symbol, _file_name(INDEX_COLUMN, meta), "<i8", meta["rows"])
+
+    def date_range(self, symbol: str) -> tuple:
+        index = self.index(symbol)
+        if len(index) == 0:
+            return None, None
+        return pd.Timestamp(index[0], tz="UTC"), pd.Timestamp(index[-1], tz="UTC")
+
+    def position(self, symbol: str, timestamp: pd.Timestamp, side: str = "left") -> int:
+        # binary search on the memory mapped index - only touches log(n) pages
+        return int(np.searchsorted(self.index(symbol), _to_nanoseconds(timestamp), side=side))
+
+    def read(
+        self,
+        symbol: str,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        lookback: int = 0,
+    ) -> pd.DataFrame:
+        """Bars from start to end (both included), plus lookback bars before start for anything
+        that needs warming up. Returns None if the symbol isn't archived"""
+        meta = self.meta(symbol)
+        if meta is None:
+            return None
+
+        first = 0 if start is None else max(0, self.position(symbol, start) - lookback)
+        last = meta["rows"] if end is None else self.position(symbol, end, side="right")
+        last = max(first, last)
+
+        index = pd.DatetimeIndex(
+            np.array(self.index(symbol)[first:last]).view("M8[ns]"), name=meta["index_name"]
+        ).tz_localize("UTC")
+
+        columns = {}
+        for column in meta["columns"]:
+            dtype = np.dtype(meta["dtypes"][column])
+            values = self._memmap(symbol, _file_name(column, meta), dtype, meta["rows"])
+            values = np.array(values[first:last])
+            if column in meta["categories"]:
+                values = pd.Categorical.from_codes(values, categories=meta["categories"][column])
+                values = np.asarray(values, dtype=object)
+            columns[column] = values
+
+        return pd.DataFrame(columns, index=index, columns=meta["columns"])
+
+    def chunks(self, symbol: str, chunk_bars: int, lookback: int = 0):
+        """Reads the whole archive chunk_bars at a time, each with lookback bars of warm up"""
+        rows = len(self.index(symbol))
+        for first in range(0, rows, chunk_bars):
+            index = self.index(symbol)
+            start = pd.Timestamp(index[first], tz="UTC")
+            end = pd.Timestamp(index[min(first + chunk_bars, rows) - 1], tz="UTC")
+            yield self.read(symbol, start, end, lookback=lookback)
+
+    def append(self, symbol: str, bars: pd.DataFrame) -> int:
+        """Adds bars after the last archived one to the end of each column file. Bars at or before
+        it are ignored unless they fill a gap, in which case the symbol gets rewritten in order.
+        Returns how many bars were added"""
+        if len(bars) == 0:
+            return 0
+        bars = bars.sort_index()
+        bars = bars.loc[~bars.index.duplicated(keep="last")]
+        meta = self.meta(symbol)
+
+        if meta is None:
+            os.makedirs(self._path(symbol), exist_ok=True)
+            meta = {
+                "rows": 0,
+                "index_name": bars.index.name,
+                "columns": list(bars.columns),
+                "dtypes": {},
+                "categories": {},
+            }
+            for column in bars.columns:
+                dtype = bars[column].dtype
+                if dtype == object or isinstance(dtype, pd.CategoricalDtype):
+                    meta["categories"][column] = []
+                    meta["dtypes"][column] = CODES_DTYPE.str
+                else:
+                    meta["dtypes"][column] = dtype.str
+            new_bars = bars
+        else:
+            if list(bars.columns) != meta["columns"]:
+                raise ValueError(
+                    f"{symbol}: archived columns are {meta['columns']}, can't append "
+                    f"{list(bars.columns)}"
+                )
+            # binary search rather than isin, so appending doesn't read the whole index
+            archived = self.index(symbol)
+            timestamps = _to_nanoseconds(bars.index)
+            positions = np.searchsorted(archived, timestamps)
+            found = positions < len(archived)
+            found[found] = archived[positions[found]] == timestamps[found]
+            is_new = ~found
+            if len(archived) > 0 and (timestamps[is_new] < archived[-1]).any():
+                return self._rewrite(symbol, bars)
+            new_bars = bars.loc[is_new]
+
+        if len(new_bars) == 0:
+            return 0
+
+        self._append_rows(symbol, meta, new_bars)
+        return len(new_bars)
+
+    def _append_rows(self, symbol: str, meta: dict, bars: pd.DataFrame):
+        rows = meta["rows"]
+        files = [(_file_name(INDEX_COLUMN, meta), np.dtype("<i8"), _to_nanoseconds(bars.index))]
+        for column in meta["columns"]:
+            dtype = np.dtype(meta["dtypes"][column])
+            if column in meta["categories"]:
+                values = self._codes(meta["categories"][column], bars[column])
+            else:
+                values = bars[column].to_numpy().astype(dtype)
+            files.append((_file_name(column, meta), dtype, values))
+
+        for file_name, dtype, values in files:
+            with open(self._path(symbol, file_name), "ab") as f:
+                # anything past meta's row count is from an append that didn't finish
+                f.truncate(rows * dtype.itemsize)
+                f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+        self._write_meta(symbol, {**meta, "rows": rows + len(bars)})
+
+    def _codes(self, categories: list, values: pd.Series) -> np.ndarray:
+        # new strings get added to the end of the categories, so old codes never change
+        values = values.astype(object).where(values.notna(), None)
+        for value in pd.unique(values.dropna()):
+            if value not in categories:
+                categories.append(value)
+        return pd.Categorical(values, categories=categories).codes.astype(CODES_DTYPE)
+
+    def _rewrite(self, symbol: str, bars: pd.DataFrame) -> int:
+        # late bars in the middle of the archive - rare enough to just start the symbol again
+        archived = self.read(symbol)
+        merged = pd.concat([archived, bars.loc[~bars.index.isin(archived.index)]]).sort_index()
+        log_wp.warning(f"{symbol}: Rewriting {len(merged):,} archived bars to fit in late bars")
+
+        # into a new generation of files - the old ones are what's read until meta.json says
+        # otherwise, so a rewrite that dies part way loses nothing
+        old_meta = self.meta(symbol)
+        meta = {
+            **old_meta,
+            "rows": 0,
+            "generation": old_meta.get("generation", 0) + 1,
+            # copied - new strings get added to these, and the old generation still needs its own
+            "categories": {
+                column: list(categories) for column, categories in old_meta["categories"].items()
+            },
+        }
+        self._append_rows(symbol, meta, merged)
+
+        for column in [INDEX_COLUMN] + old_meta["columns"]:
+            try:
+                os.remove(self._path(symbol, _file_name(column, old_meta)))
+            except FileNotFoundError:
+                pass
+        return len(merged) - len(archived)
+
+
+def _file_name(column: str, meta: dict) -> str:
+    generation = meta.get("generation", 0)
+    return f"{column}.bin" if generation == 0 else f"{column}.{generation}.bin"
+
+
+def _to_nanoseconds(timestamps):
+    if isinstance(timestamps, pd.DatetimeIndex):
+        if timestamps.tz is None:
+            timestamps = timestamps.tz_localize("UTC")
+        return timestamps.tz_convert("UTC").asi8
+    timestamp = pd.Timestamp(timestamps)
+    if timestamp.tz is None:
+        timestamp = timestamp.tz_localize("UTC")
+    return timestamp.value
+
+
+def main(args):
+    archive = BarArchive(args.archive_path, args.interval)
+    for csv_path in sorted(glob.glob(os.path.join(args.bars_path, "*.csv"))):
+        symbol = os.path.basename(csv_path)[:-4]
+        bars = pd.read_csv(csv_path, index_col=0)
+        bars.index = pd.to_datetime(bars.index, utc=True)
+        added = archive.append(symbol, bars)
+        print(f"{symbol}: archived {added:,} new bars ({archive.meta(symbol)['rows']:,} in total)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add saved {symbol}.csv bars to a bar archive")
+    parser.add_argument("--bars_path", required=True)
+    parser.add_argument("--archive_path", required=True)
+    parser.add_argument("--interval", default="5m")
+    main(parser.parse_args())
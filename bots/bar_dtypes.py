@@ -0,0 +1,67 @@
+# external packages
+import numpy as np
+import pandas as pd
+
+# opt in (--compact_bars) smaller dtypes for bar frames. out of add_signals every symbol holds
+# float64 everything, bools that a concat has turned into objects and macd_cycle as python strings,
+# which adds up across a whole universe of symbols. compact() gives:
+#   - macd_cycle as a category
+#   - the crossover/above signal flags as plain bools (1 byte each)
+#   - with float32=True (--float32_bars), prices and indicators as float32. a float32 holds about
+#     7 significant digits, so each value is within FLOAT32_RTOL of its float64 original. signals
+#     are worked out in float64 before they're compacted, but anything recalculated from float32
+#     bars later (add_signals on new bars, stop losses) can differ by about that much
+#
+#   bars = bar_dtypes.compact(bars, float32=True)
+#   log_wp.info(bar_dtypes.memory_report({"BTC-USD": bars}))
+
+FLOAT32_RTOL = 1e-6
+
+CYCLE_DTYPE = pd.CategoricalDtype(["", "blue", "red"])
+FLAG_COLUMNS = ["macd_crossover", "macd_signal_crossover", "macd_above_signal"]
+FLOAT_COLUMNS = [
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "macd_macd",
+    "macd_signal",
+    "macd_histogram",
+    "sma_200",
+]
+
+
+def compact(bars: pd.DataFrame, float32: bool = False) -> pd.DataFrame:
+    """Returns bars with the compact dtypes. Columns it doesn't know about are left alone"""
+    bars = bars.copy()
+
+    # saved bars with a mix of UTC offsets come back from read_csv with an object index
+    if not isinstance(bars.index, pd.DatetimeIndex):
+        bars.index = pd.to_datetime(bars.index, utc=True)
+
+    if "macd_cycle" in bars.columns:
+        bars["macd_cycle"] = bars["macd_cycle"].astype(CYCLE_DTYPE)
+
+    for column in FLAG_COLUMNS:
+        if column in bars.columns:
+            bars[column] = bars[column].fillna(False).astype(bool)
+
+    float_dtype = np.float32 if float32 else np.float64
+    for column in FLOAT_COLUMNS:
+        if column in bars.columns:
+            bars[column] = pd.to_numeric(bars[column]).astype(float_dtype)
+
+    return bars
+
+
+def memory_report(bars_by_symbol: dict) -> pd.DataFrame:
+    """Rows, bytes and bytes per bar for each symbol's frame (deep, so strings are counted)"""
+    report = pd.DataFrame(
+        [
+            {"symbol": symbol, "rows": len(bars), "bytes": bars.memory_usage(deep=True).sum()}
+            for symbol, bars in bars_by_symbol.items()
+        ],
+        columns=["symbol", "rows", "bytes"],
+    ).set_index("symbol")
+    report["bytes_per_bar"] = report["bytes"] / report["rows"].where(report["rows"] > 0)
+    return report
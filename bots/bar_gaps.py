@@ -0,0 +1,324 @@
+# external packages
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (
+    AbstractHolidayCalendar,
+    GoodFriday,
+    Holiday,
+    USLaborDay,
+    USMartinLutherKingJr,
+    USMemorialDay,
+    USPresidentsDay,
+    USThanksgivingDay,
+    nearest_workday,
+    sunday_to_monday,
+)
+import pytz
+
+# my modules
+import log_setup
+import utils
+
+log_wp = log_setup.get_logger("bar_gaps")
+
+# finds holes in saved bars and works out the fewest market data requests that fill them. saving
+# bars used to only ever fetch from the last saved bar onwards, so anything missing in the middle
+# (an outage, or a nightly run that failed for longer than yahoo keeps 1m bars) stayed missing
+#
+#   gaps = bar_gaps.find_gaps(bars.index, "5m", "us_market", end=now)
+#   windows, unfillable = bar_gaps.plan_backfill(gaps, "5m", now=now)
+#   bar_gaps.backfill_bars(symbols, "5m", bucket="mfers-tabot", key_base="symbol_data/5m/")
+#
+# equities are only expected to have bars while the NYSE is open - weekdays, 9:30 to 16:00 New
+# York time, less holidays, and 13:00 closes on the usual early close days. crypto never closes
+
+US_MARKET_HOURS = ("America/New_York", pd.Timedelta(hours=9, minutes=30), pd.Timedelta(hours=16))
+US_MARKET_EARLY_CLOSE = pd.Timedelta(hours=13)
+
+# gaps closer together than this get fetched in one request - a couple of extra bars is cheaper
+# than another round trip. a day covers the overnight break between two missing sessions
+DEFAULT_MERGE_WITHIN = pd.Timedelta(days=1)
+
+
+class NyseHolidayCalendar(AbstractHolidayCalendar):
+    rules = [
+        # a saturday new years day isn't made up on the friday before
+        Holiday("NewYearsDay", month=1, day=1, observance=sunday_to_monday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-06-19", observance=nearest_workday),
+        Holiday("IndependenceDay", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def market_for(symbol: str) -> str:
+    # same fast and loose rule as MacdWorker.get_market
+    if symbol[-4:] == "-USD":
+        return "ccc_market"
+    return "us_market"
+
+
+def _early_closes(years) -> set:
+    # 3 july, the day after thanksgiving and christmas eve - when they're trading days
+    days = []
+    for year in years:
+        days += [pd.Timestamp(year, 7, 3), pd.Timestamp(year, 12, 24)]
+        thanksgiving = USThanksgivingDay.dates(f"{year}-01-01", f"{year}-12-31")[0]
+        days.append(thanksgiving + pd.Timedelta(days=1))
+    return {day for day in days if day.dayofweek < 5}
+
+
+def expected_index(
+    start: pd.Timestamp, end: pd.Timestamp, interval: str, market: str
+) -> pd.DatetimeIndex:
+    """Every bar timestamp (UTC) there should be between start and end, both included"""
+    start, end = _utc(start), _utc(end)
+    step = utils.get_interval_integer(interval)
+    if market != "us_market":
+        return pd.date_range(start.ceil(f"{step}min"), end, freq=f"{step}min")
+
+    tz, session_open, session_close = US_MARKET_HOURS
+    first_day = start.tz_convert(tz).tz_localize(None).normalize()
+    last_day = end.tz_convert(tz).tz_localize(None).normalize()
+    holidays = NyseHolidayCalendar().holidays(first_day, last_day)
+    days = pd.bdate_range(first_day, last_day, freq="C", holidays=holidays)
+    if len(days) == 0:
+        return pd.DatetimeIndex([], tz="UTC")
+
+    early_closes = _early_closes(range(first_day.year, last_day.year + 1))
+    offsets = pd.timedelta_range(
+        session_open, session_close - pd.Timedelta(minutes=step), freq=f"{step}min"
+    )
+    early = np.array([day in early_closes for day in days])
+
+    # every session's bars on the local clock, then late bars on early close days thrown out
+    local = days.values[:, None] + offsets.values[None, :]
+    keep = ~(early[:, None] & (offsets.values[None, :] >= US_MARKET_EARLY_CLOSE.to_timedelta64()))
+    index = pd.DatetimeIndex(local[keep]).tz_localize(tz).tz_convert("UTC")
+    return index[(index >= start) & (index <= end)]
+
+
+def find_gaps(
+    index: pd.DatetimeIndex,
+    interval: str,
+    market: str,
+    start: pd.Timestamp = None,
+    end: pd.Timestamp = None,
+) -> list:
+    """[(first missing bar, last missing bar, missing bars)] for every run of bars that should be
+    in index but aren't. Checks from start (or the first bar) to end (or the last bar)"""
+    if len(index) == 0 and (start is None or end is None):
+        return []
+    index = index.tz_convert("UTC") if index.tz is not None else index.tz_localize("UTC")
+    start = index[0] if start is None else start
+    end = index[-1] if end is None else end
+
+    expected = expected_index(start, end, interval, market)
+    missing = np.flatnonzero(~expected.isin(index))
+    if len(missing) == 0:
+        return []
+
+    # split the missing positions wherever they stop being consecutive
+    runs = np.split(missing, np.flatnonzero(np.diff(missing) > 1) + 1)
+    return [(expected[run[0]], expected[run[-1]], len(run)) for run in runs]
+
+
+def plan_backfill(
+    gaps: list,
+    interval: str,
+    now: datetime = None,
+    max_range: pd.Timedelta = None,
+    merge_within: pd.Timedelta = DEFAULT_MERGE_WITHIN,
+) -> tuple:
+    """Merges gaps into as few (start, end) request windows as it can, without any window being
+    longer than the market data source will give us in one go. Returns (windows, unfillable) -
+    unfillable is the (start, end) of gaps, or parts of them, from before the source's history
+    starts"""
+    interval_delta = pd.Timedelta(minutes=utils.get_interval_integer(interval))
+    max_range = max_range if max_range is not None else _max_range(interval)
+    now = _utc(now if now is not None else datetime.now(pytz.utc))
+    oldest = (now - max_range).ceil(interval_delta)
+
+    windows = []
+    unfillable = []
+    for first, last, __ in gaps:
+        if last < oldest:
+            unfillable.append((first, last))
+            continue
+        if first < oldest:
+            unfillable.append((first, oldest - interval_delta))
+            first = oldest
+
+        if windows and first - windows[-1][1] <= merge_within and last - windows[-1][0] < max_range:
+            windows[-1] = (windows[-1][0], last)
+        else:
+            windows.append((first, last))
+
+    return windows, unfillable
+
+
+def coverage(index: pd.DatetimeIndex, interval: str, market: str, end: pd.Timestamp = None) -> dict:
+    gaps = find_gaps(index, interval, market, end=end)
+    missing = sum(count for __, __, count in gaps)
+    expected = len(expected_index(index[0], end, interval, market)) if len(index) > 0 else 0
+    return {
+        "first": index[0] if len(index) > 0 else None,
+        "last": index[-1] if len(index) > 0 else None,
+        "bars": len(index),
+        "missing": missing,
+        "gaps": len(gaps),
+        "coverage": 1 - missing / expected if expected else 0.0,
+    }
+
+
+def backfill_bars(
+    symbols: list,
+    interval: str,
+    bucket: str = None,
+    key_base: str = None,
+    path: str = None,
+    partitions=None,
+    market_data_source=None,
+    now: datetime = None,
+    max_range: pd.Timedelta = None,
+    merge_within: pd.Timedelta = DEFAULT_MERGE_WITHIN,
+) -> pd.DataFrame:
+    """Fills the gaps in each symbol's saved bars, including everything since the last saved bar,
+    with as few requests as it can. Bars are saved as {symbol}.csv in S3 or a local path, or into
+    partitions (a bar_partitions.PartitionedBars) if it's given - which only reads and writes the
+    partitions it has to. Returns a coverage report, one row per symbol"""
+    market_data_source = market_data_source or utils.YahooMarketData()
+    interval_delta = pd.Timedelta(minutes=utils.get_interval_integer(interval))
+    max_range = max_range if max_range is not None else _max_range(interval)
+    now = _utc(now if now is not None else datetime.now(pytz.utc))
+    # the last bar that's finished - anything after it is still changing
+    last_closed = now.floor(interval_delta) - interval_delta
+
+    report = {}
+    for symbol in symbols:
+        market = market_for(symbol)
+        existing_bars = None
+        if partitions is not None:
+            first, __ = partitions.date_range(symbol)
+            has_bars = first is not None
+            if has_bars:
+                gaps = partitions.find_gaps(symbol, interval, market, end=last_closed)
+        else:
+            existing_bars = utils.load_bars(symbol, bucket=bucket, key_base=key_base, path=path)
+            has_bars = existing_bars is not None and len(existing_bars) > 0
+            if has_bars:
+                existing_bars.index = pd.to_datetime(existing_bars.index, utc=True)
+                first = existing_bars.index[0]
+                gaps = find_gaps(existing_bars.index, interval, market, end=last_closed)
+        if not has_bars:
+            first = (now - max_range).ceil(interval_delta)
+            gaps = [(first, last_closed, None)]
+
+        windows, unfillable = plan_backfill(
+            gaps, interval, now=now, max_range=max_range, merge_within=merge_within
+        )
+        new_bars = _fetch(market_data_source, symbol, interval, windows, last_closed)
+
+        added = 0
+        if new_bars is not None and partitions is not None:
+            added = partitions.sync(symbol, new_bars)
+        elif new_bars is not None:
+            ohlcv = ["Open", "High", "Low", "Close", "Volume"]
+            if existing_bars is None:
+                merged = new_bars[ohlcv]
+            else:
+                merged = utils.merge_bars(existing_bars[ohlcv], new_bars[ohlcv]).sort_index()
+            added = len(merged) - (0 if existing_bars is None else len(existing_bars))
+
+            if added > 0:
+                # signals after a filled gap would be off, so they're all worked out again
+                existing_bars = utils.add_signals(bars=merged, interval=interval)
+                _save(symbol, existing_bars, bucket=bucket, key_base=key_base, path=path)
+
+        # what's still missing, now the gaps have been filled as far as they can be
+        if partitions is not None:
+            bars_count = partitions.rows(symbol)
+            gaps = partitions.find_gaps(symbol, interval, market, end=last_closed)
+        elif existing_bars is not None:
+            bars_count = len(existing_bars)
+            gaps = find_gaps(existing_bars.index, interval, market, end=last_closed)
+        else:
+            bars_count = 0
+            gaps = [(first, last_closed, len(expected_index(first, last_closed, interval, market)))]
+        missing = sum(count for __, __, count in gaps)
+        expected = len(expected_index(first, last_closed, interval, market))
+
+        report[symbol] = {
+            "bars": bars_count,
+            "missing": missing,
+            "gaps": len(gaps),
+            "coverage": 1 - missing / expected if expected else 0.0,
+            "added": added,
+            "requests": len(windows),
+            "unfillable": sum(
+                len(expected_index(first, last, interval, market)) for first, last in unfillable
+            ),
+        }
+        log_wp.info(
+            f"{symbol}: Added {added:,} bars with {len(windows)} requests - "
+            f"{report[symbol]['coverage']:.2%} covered, {missing:,} still missing"
+        )
+
+    return pd.DataFrame.from_dict(report, orient="index")
+
+
+def _fetch(market_data_source, symbol: str, interval: str, windows: list, last_closed):
+    interval_delta = pd.Timedelta(minutes=utils.get_interval_integer(interval))
+    fetched = []
+    for window_start, window_end in windows:
+        bars = market_data_source.Ticker(symbol).history(
+            start=window_start,
+            end=window_end + interval_delta,
+            interval=interval,
+            actions=False,
+            debug=False,
+        )
+        if len(bars) > 0:
+            fetched.append(bars.tz_convert(pytz.utc))
+
+    if not fetched:
+        return None
+    new_bars = pd.concat(fetched)
+    # yahoo's last few bars can be part way through the interval, with odd timestamps
+    step = utils.get_interval_integer(interval)
+    new_bars = new_bars.loc[
+        (new_bars.index.minute % step == 0)
+        & (new_bars.index.second == 0)
+        & (new_bars.index <= last_closed)
+    ]
+    new_bars = new_bars.loc[~new_bars.index.duplicated(keep="last")]
+    return new_bars if len(new_bars) > 0 else None
+
+
+def _save(symbol: str, bars: pd.DataFrame, bucket: str, key_base: str, path: str = None):
+    if path is not None:
+        bars.to_csv(f"{path.rstrip('/')}/{symbol}.csv")
+        return
+    if not utils.upload_to_s3(
+        pickle=bars.to_csv(), bucket=bucket, key_base=key_base, key=f"{symbol}.csv"
+    ):
+        log_wp.error(f"{symbol}: Failed to save bars to S3")
+
+
+def _max_range(interval: str) -> pd.Timedelta:
+    # get_interval_settings gives a relativedelta, which doesn't compare with timedeltas
+    __, max_range = utils.get_interval_settings(interval)
+    return pd.Timedelta(days=max_range.days)
+
+
+def _utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tz is None:
+        return timestamp.tz_localize(datetime.now().astimezone().tzinfo).tz_convert("UTC")
+    return timestamp.tz_convert("UTC")
@@ -0,0 +1,164 @@
+# external packages
+import numpy as np
+import pandas as pd
+
+# my modules
+import utils
+
+# what MacdWorker keeps its bars (and their signals) in. new bars nearly always come after the
+# last one we've got, so they get written into preallocated numpy columns instead of concatenating
+# the whole history every cycle - only late/out of order bars go through utils.merge_bars. with
+# max_bars set the oldest bars fall off the front, so a live bot's memory stays flat
+#
+#   history = BarHistory(bars, max_bars=1000)
+#   history.append(new_bars)
+#   history.frame
+
+# 200 bars for sma_200 and the data window, the 300 add_signals pads new bars with (which covers
+# macd warm up), plus plenty of room to look back for the last crossover
+DEFAULT_MAX_BARS = 1000
+MIN_CAPACITY = 64
+
+
+class BarHistory:
+    def __init__(self, bars: pd.DataFrame, max_bars: int = None):
+        self.max_bars = max_bars
+        self._load(bars)
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_index(self) -> pd.Timestamp:
+        if len(self) == 0:
+            return None
+        last_index = pd.Timestamp(self._index[self._end - 1])
+        if self._tz is not None:
+            last_index = last_index.tz_localize("UTC").tz_convert(self._tz)
+        return last_index
+
+    @property
+    def frame(self) -> pd.DataFrame:
+        # built once per append - it's a copy, so anything that writes to it (add_signals does)
+        # can't get at the buffers
+        if self._frame is None:
+            index = pd.DatetimeIndex(self._index[self._start : self._end], name=self._index_name)
+            if self._tz is not None:
+                index = index.tz_localize("UTC").tz_convert(self._tz)
+            self._frame = pd.DataFrame(
+                {column: self._column(column) for column in self._columns}, index=index
+            )
+        return self._frame
+
+    def _load(self, bars: pd.DataFrame):
+        if self.max_bars is not None:
+            bars = bars.iloc[-self.max_bars :]
+
+        self._tz = bars.index.tz
+        self._index_name = bars.index.name
+        self._start = 0
+        self._end = 0
+        self._capacity = 0
+        # categorical columns (see bar_dtypes) are kept as their codes
+        self._categories = {
+            column: bars[column].dtype
+            for column in bars.columns
+            if isinstance(bars[column].dtype, pd.CategoricalDtype)
+        }
+        self._columns = {
+            column: np.empty(0, dtype=self._buffer_dtype(bars[column]))
+            for column in bars.columns
+        }
+        self._index = np.empty(0, dtype="datetime64[ns]")
+        self._make_room(len(bars))
+        self._write(bars)
+        self._frame = None
+
+    def _buffer_dtype(self, column: pd.Series):
+        if column.name in self._categories:
+            return column.cat.codes.dtype
+        return column.dtype
+
+    def _column(self, column: str):
+        values = self._columns[column][self._start : self._end]
+        if column in self._categories:
+            return pd.Categorical.from_codes(values, dtype=self._categories[column])
+        return values
+
+    def _make_room(self, rows: int):
+        # when the buffers fill up, move what we're keeping to the front of new ones with at least
+        # as much space again. that only happens every max_bars appends (or each time the history
+        # doubles without a limit), so appending is O(1) on average
+        if self._end + rows <= self._capacity:
+            return
+
+        keep = self._end - self._start
+        if self.max_bars is None:
+            self._capacity = max(MIN_CAPACITY, (keep + rows) * 2)
+        else:
+            self._capacity = max(MIN_CAPACITY, keep + rows, self.max_bars * 2)
+        for column, buffer in self._columns.items():
+            self._columns[column] = self._move(buffer, keep)
+        self._index = self._move(self._index, keep)
+        self._start = 0
+        self._end = keep
+
+    def _move(self, buffer, keep: int):
+        new_buffer = np.empty(self._capacity, dtype=buffer.dtype)
+        new_buffer[:keep] = buffer[self._start : self._start + keep]
+        return new_buffer
+
+    def _write(self, bars: pd.DataFrame):
+        rows = len(bars)
+        for column, buffer in self._columns.items():
+            if column in self._categories:
+                values = pd.Categorical(bars[column], dtype=self._categories[column]).codes
+            else:
+                values = bars[column].to_numpy()
+            buffer[self._end : self._end + rows] = values
+
+        index = bars.index
+        if index.tz is not None:
+            index = index.tz_convert("UTC").tz_localize(None)
+        self._index[self._end : self._end + rows] = index.to_numpy()
+
+        self._end += rows
+        if self.max_bars is not None and len(self) > self.max_bars:
+            self._start = self._end - self.max_bars
+        self._frame = None
+
+    def _can_append(self, new_bars: pd.DataFrame) -> bool:
+        if list(new_bars.columns) != list(self._columns):
+            return False
+        if not new_bars.index.is_monotonic_increasing or not new_bars.index.is_unique:
+            return False
+        if len(self) > 0 and new_bars.index[0] <= self.last_index:
+            return False
+
+        for column, buffer in self._columns.items():
+            if column in self._categories:
+                # anything that isn't one of the categories would be lost
+                values = new_bars[column]
+                categorical = pd.Categorical(values, dtype=self._categories[column])
+                if (categorical.isna() & values.notna().to_numpy()).any():
+                    return False
+                continue
+
+            dtype = new_bars[column].dtype
+            # object columns are what bool columns turn into after a concat - fine to cast back
+            if dtype != buffer.dtype and dtype != object:
+                if not np.can_cast(dtype, buffer.dtype, casting="same_kind"):
+                    return False
+        return True
+
+    def append(self, new_bars: pd.DataFrame):
+        """Adds new_bars to the end of the history, or merges them in and sorts if any of them
+        aren't after the last bar we've got. Bars we already have are ignored, like merge_bars"""
+        if len(new_bars) == 0:
+            return
+
+        if self._can_append(new_bars):
+            self._make_room(len(new_bars))
+            self._write(new_bars)
+        else:
+            self._load(utils.merge_bars(self.frame, new_bars).sort_index())
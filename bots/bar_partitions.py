@@ -0,0 +1,289 @@
+# external packages
+import argparse
+import glob
+import io
+import json
+import os
+import pandas as pd
+
+# my modules
+import bar_gaps
+import log_setup
+import utils
+from iobject_store import IObjectStore
+from object_stores import LocalObjectStore, S3ObjectStore
+
+log_wp = log_setup.get_logger("bar_partitions")
+
+# saved bars split into one object per symbol per day (or week), plus a manifest of which
+# partitions there are and what's in them. saving used to download the whole {symbol}.csv, merge
+# and upload the lot every night - now a nightly sync only writes the partitions that changed
+# (normally just yesterday's), and a back test over a date window only reads the ones it needs
+#
+#   {key_base}{symbol}/manifest.json               the only object that ever gets overwritten
+#   {key_base}{symbol}/{partition}.v{version}.csv  OHLCV, never changed once written
+#
+# a partition that gets more bars (the day was still going, or a gap got filled) is written again
+# as the next version, the manifest is pointed at it and then the old version is deleted
+#
+#   partitions = PartitionedBars(S3ObjectStore("mfers-tabot"), "symbol_data/partitioned/5m/")
+#   partitions.sync("BTC-USD", new_bars)
+#   partitions.read("BTC-USD", start, end, lookback=300)
+#
+#   python bar_partitions.py --bars_path ./bars --store_path /data/partitioned --interval 5m
+
+MANIFEST_FILE = "manifest.json"
+OHLCV = ["Open", "High", "Low", "Close", "Volume"]
+PARTITIONINGS = ["daily", "weekly"]
+
+
+class PartitionMissing(Exception):
+    ...
+
+
+class PartitionedBars:
+    def __init__(self, store: IObjectStore, key_base: str, partitioning: str = "daily"):
+        if partitioning not in PARTITIONINGS:
+            raise ValueError(f"partitioning must be one of {PARTITIONINGS}, not {partitioning}")
+        self.store = store
+        self.key_base = key_base
+        self.partitioning = partitioning
+        self._manifests = {}
+
+    def _key(self, symbol: str, file_name: str) -> str:
+        return f"{self.key_base}{symbol}/{file_name}"
+
+    def partition_start(self, index: pd.DatetimeIndex) -> pd.DatetimeIndex:
+        """The start (UTC midnight, and a monday for weekly) of the partition each bar goes in"""
+        days = index.tz_convert("UTC").normalize()
+        if self.partitioning == "weekly":
+            return days - pd.to_timedelta(days.dayofweek, unit="D")
+        return days
+
+    def _partition_length(self) -> pd.Timedelta:
+        return pd.Timedelta(days=7 if self.partitioning == "weekly" else 1)
+
+    def manifest(self, symbol: str) -> dict:
+        if symbol not in self._manifests:
+            body = self.store.get(self._key(symbol, MANIFEST_FILE))
+            if body is None:
+                return None
+            self._manifests[symbol] = json.loads(body)
+        return self._manifests[symbol]
+
+    def _entries(self, symbol: str) -> list:
+        manifest = self.manifest(symbol)
+        return manifest["partitions"] if manifest is not None else []
+
+    def date_range(self, symbol: str) -> tuple:
+        entries = self._entries(symbol)
+        if len(entries) == 0:
+            return None, None
+        return pd.Timestamp(entries[0]["first"]), pd.Timestamp(entries[-1]["last"])
+
+    def rows(self, symbol: str) -> int:
+        return sum(entry["rows"] for entry in self._entries(symbol))
+
+    def _read_partition(self, entry: dict) -> pd.DataFrame:
+        body = self.store.get(entry["key"])
+        if body is None:
+            raise PartitionMissing(entry["key"])
+        bars = pd.read_csv(io.BytesIO(body), index_col=0)
+        bars.index = pd.to_datetime(bars.index, utc=True)
+        return bars
+
+    def _concat(self, entries: list) -> pd.DataFrame:
+        if len(entries) == 0:
+            return None
+        return pd.concat([self._read_partition(entry) for entry in entries])
+
+    def _fresh(self, symbol: str, load):
+        # another process has synced since the manifest was read, and replaced a partition - read
+        # the manifest again and have another go
+        try:
+            return load()
+        except PartitionMissing:
+            self._manifests.pop(symbol, None)
+            return load()
+
+    def read(
+        self,
+        symbol: str,
+        start: pd.Timestamp = None,
+        end: pd.Timestamp = None,
+        lookback: int = 0,
+    ) -> pd.DataFrame:
+        """Bars from start to end (both included) plus lookback bars before start, reading only
+        the partitions they're in. Returns None if the symbol has no partitions"""
+        return self._fresh(symbol, lambda: self._read(symbol, start, end, lookback))
+
+    def _read(self, symbol: str, start, end, lookback: int) -> pd.DataFrame:
+        entries = self._entries(symbol)
+        if len(entries) == 0:
+            return None
+        start = _utc(start) if start is not None else None
+        end = _utc(end) if end is not None else None
+
+        wanted = [
+            position
+            for position, entry in enumerate(entries)
+            if (start is None or pd.Timestamp(entry["last"]) >= start)
+            and (end is None or pd.Timestamp(entry["first"]) <= end)
+        ]
+        if len(wanted) == 0:
+            return pd.DataFrame(columns=OHLCV, index=pd.DatetimeIndex([], tz="UTC"))
+
+        # earlier partitions, until there's enough of them for the lookback
+        first = wanted[0]
+        before = 0
+        while start is not None and first > 0 and before < lookback:
+            first -= 1
+            before += entries[first]["rows"]
+
+        bars = self._concat(entries[first : wanted[-1] + 1])
+        if end is not None:
+            bars = bars.loc[bars.index <= end]
+        if start is not None:
+            earlier = bars.loc[bars.index < start]
+            bars = pd.concat([earlier.iloc[max(0, len(earlier) - lookback) :], bars.loc[start:]])
+        return bars
+
+    def tail(self, symbol: str, rows: int) -> pd.DataFrame:
+        """The last rows bars, from as few partitions as it takes"""
+        return self._fresh(symbol, lambda: self._tail(symbol, rows))
+
+    def _tail(self, symbol: str, rows: int) -> pd.DataFrame:
+        entries = self._entries(symbol)
+        first = len(entries)
+        found = 0
+        while first > 0 and found < rows:
+            first -= 1
+            found += entries[first]["rows"]
+        bars = self._concat(entries[first:])
+        return bars.iloc[-rows:] if bars is not None else None
+
+    def sync(
+        self, symbol: str, bars: pd.DataFrame, replace: bool = False, sources: dict = None
+    ) -> int:
+        """Writes bars into their partitions - only partitions that change are written, each as a
+        new version. Bars that are already saved are left as they are, unless replace is set.
+        sources is kept in the manifest for whatever the bars were built from. Returns how many
+        new bars were saved"""
+        return self._fresh(symbol, lambda: self._sync(symbol, bars, replace, sources))
+
+    def _sync(self, symbol: str, bars: pd.DataFrame, replace: bool, sources: dict) -> int:
+        manifest = self.manifest(symbol) or {"partitioning": self.partitioning, "partitions": []}
+        if manifest["partitioning"] != self.partitioning:
+            raise ValueError(
+                f"{symbol}: saved bars are partitioned {manifest['partitioning']}, not "
+                f"{self.partitioning}"
+            )
+        entries = {entry["partition"]: entry for entry in manifest["partitions"]}
+        bars = bars[OHLCV].sort_index()
+        bars = bars.loc[~bars.index.duplicated(keep="last")]
+
+        added = 0
+        replaced = []
+        for start, partition_bars in bars.groupby(self.partition_start(bars.index)):
+            label = start.strftime("%Y-%m-%d")
+            entry = entries.get(label)
+            version = 1
+            if entry is not None:
+                existing = self._read_partition(entry)
+                new_bars = partition_bars.loc[~partition_bars.index.isin(existing.index)]
+                if replace:
+                    kept = existing.loc[~existing.index.isin(partition_bars.index)]
+                    partition_bars = pd.concat([kept, partition_bars]).sort_index()
+                    changed = not partition_bars.equals(existing)
+                else:
+                    partition_bars = utils.merge_bars(existing, new_bars).sort_index()
+                    changed = len(new_bars) > 0
+                if not changed:
+                    continue
+                version = entry["version"] + 1
+                replaced.append(entry["key"])
+                added += len(new_bars)
+            else:
+                added += len(partition_bars)
+
+            key = self._key(symbol, f"{label}.v{version}.csv")
+            self.store.put(key, partition_bars.to_csv().encode("utf-8"))
+            entries[label] = {
+                "partition": label,
+                "key": key,
+                "version": version,
+                "first": partition_bars.index[0].isoformat(),
+                "last": partition_bars.index[-1].isoformat(),
+                "rows": len(partition_bars),
+            }
+
+        if not replaced and added == 0 and (sources is None or sources == manifest.get("sources")):
+            return 0
+
+        manifest = {**manifest, "partitions": [entries[label] for label in sorted(entries)]}
+        if sources is not None:
+            manifest["sources"] = sources
+        self.store.put(self._key(symbol, MANIFEST_FILE), json.dumps(manifest).encode("utf-8"))
+        self._manifests[symbol] = manifest
+        # nothing points at the old versions any more
+        for key in replaced:
+            self.store.delete(key)
+
+        log_wp.log(9, f"{symbol}: Saved {added:,} new bars, rewrote {len(replaced)} partitions")
+        return added
+
+    def find_gaps(self, symbol: str, interval: str, market: str, end: pd.Timestamp) -> list:
+        """bar_gaps.find_gaps over everything saved, up to end. Partitions that have as many bars
+        as the market was open for aren't read at all"""
+        return self._fresh(symbol, lambda: self._find_gaps(symbol, interval, market, end))
+
+    def _find_gaps(self, symbol: str, interval: str, market: str, end: pd.Timestamp) -> list:
+        entries = self._entries(symbol)
+        if len(entries) == 0:
+            return []
+
+        indexes = []
+        for entry in entries:
+            first, last = pd.Timestamp(entry["first"]), pd.Timestamp(entry["last"])
+            period_start = self.partition_start(pd.DatetimeIndex([first]))[0]
+            period_end = period_start + self._partition_length() - pd.Timedelta(nanoseconds=1)
+            expected = bar_gaps.expected_index(first, period_end, interval, market)
+            if len(expected) > 0 and entry["rows"] == len(expected) and expected[-1] == last:
+                indexes.append(expected)
+            else:
+                indexes.append(self._read_partition(entry).index)
+
+        index = indexes[0].append(indexes[1:]) if len(indexes) > 1 else indexes[0]
+        return bar_gaps.find_gaps(index, interval, market, end=end)
+
+
+def _utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tz is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def main(args):
+    if args.store_path:
+        store = LocalObjectStore(args.store_path)
+    else:
+        store = S3ObjectStore(args.bucket)
+    partitions = PartitionedBars(store, args.key_base + f"{args.interval}/", args.partitioning)
+    for csv_path in sorted(glob.glob(os.path.join(args.bars_path, "*.csv"))):
+        symbol = os.path.basename(csv_path)[:-4]
+        bars = pd.read_csv(csv_path, index_col=0)
+        bars.index = pd.to_datetime(bars.index, utc=True)
+        added = partitions.sync(symbol, bars)
+        print(f"{symbol}: partitioned {added:,} new bars ({partitions.rows(symbol):,} in total)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split saved {symbol}.csv bars into partitions")
+    parser.add_argument("--bars_path", required=True)
+    parser.add_argument("--interval", default="5m")
+    parser.add_argument("--partitioning", default="daily", choices=PARTITIONINGS)
+    parser.add_argument("--store_path", default=None, help="A local directory instead of S3")
+    parser.add_argument("--bucket", default="mfers-tabot")
+    parser.add_argument("--key_base", default="symbol_data/partitioned/")
+    main(parser.parse_args())
@@ -0,0 +1,85 @@
+# external packages
+import argparse
+import logging
+import numpy as np
+import pandas as pd
+import time
+
+# my modules
+import log_setup
+from broker_back_test import BackTestAPI
+
+# benchmark of back test throughput with logging on vs off. it drives BackTestAPI with a market
+# buy and sell per symbol per bar, so every order check goes through the fill code where the
+# per order debug logging lives
+#
+# python bench_logging.py --symbols 5 --bars 400
+
+
+def make_bars(symbols: int, bars: int, seed: int = 42) -> dict:
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2022-01-01", periods=bars, freq="5min", tz="UTC")
+    all_bars = {}
+    for i in range(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+        all_bars[f"SYM{i}-USD"] = pd.DataFrame(
+            {
+                "Open": close,
+                "High": close * 1.001,
+                "Low": close * 0.999,
+                "Close": close,
+            },
+            index=index,
+        )
+    return all_bars
+
+
+def run_back_test(all_bars: dict) -> float:
+    api = BackTestAPI(back_testing=True, back_testing_balance=10000000)
+    for symbol, bars in all_bars.items():
+        api._put_bars(symbol=symbol, bars=bars)
+
+    # buy and sell every symbol on every bar, so every order check goes through a fill and logs
+    index = next(iter(all_bars.values())).index
+    start_time = time.perf_counter()
+    for back_testing_date in index:
+        for symbol in all_bars:
+            api.buy_order_market(symbol=symbol, units=1, back_testing_date=back_testing_date)
+            api.sell_order_market(symbol=symbol, units=1, back_testing_date=back_testing_date)
+    return time.perf_counter() - start_time
+
+
+def main(args):
+    all_bars = make_bars(symbols=args.symbols, bars=args.bars)
+    orders = args.symbols * args.bars * 2
+
+    modes = {
+        # every debug line formatted, queued and written out by the listener
+        "debug": lambda: log_setup.configure(
+            back_testing=False, levels={"backtest_api": logging.DEBUG}
+        ),
+        # what tabot does for a back test - sub INFO records are dropped before formatting
+        "back_test": lambda: log_setup.configure(
+            back_testing=True, levels={"backtest_api": logging.INFO}
+        ),
+        # logging off altogether
+        "off": lambda: logging.disable(logging.CRITICAL),
+    }
+
+    results = {}
+    for mode, set_up in modes.items():
+        set_up()
+        elapsed = run_back_test(all_bars)
+        log_setup.flush()
+        logging.disable(logging.NOTSET)
+        results[mode] = elapsed
+        print(f"{mode:>10}: {elapsed:.3f}s, {orders / elapsed:,.0f} orders/s")
+
+    print(f"back_test mode is {results['debug'] / results['back_test']:.1f}x faster than debug")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Back test throughput with logging on vs off")
+    parser.add_argument("--symbols", type=int, default=5)
+    parser.add_argument("--bars", type=int, default=400)
+    main(parser.parse_args())
@@ -0,0 +1,471 @@
+# external packages
+import argparse
+from contextlib import redirect_stdout
+from datetime import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+import pandas as pd
+
+# my modules
+import log_setup
+from bot_telemetry import BotTelemetry
+from broker_back_test import BackTestAPI, OrderResult
+from buyplan import (
+    BuyPlan,
+    OrderQuantitySmallerThanMinimum,
+    OrderValueSmallerThanMinimum,
+    InsufficientBalance,
+    StopPriceAlreadyMet,
+    TakeProfitAlreadyMet,
+)
+from macd import MacdBot
+from macd_worker import MacdWorker
+from itradeapi import order_columns
+import notification_services
+from parameter_stores import BackTestStore
+from portfolio_value import PortfolioValue
+from symbol_objects import SymbolData
+import synthetic_bars
+from tabot_rules import TABotRules
+import utils
+
+log_wp = log_setup.get_logger("bench_suite")
+
+# benchmarks for the trading engine, run against seeded synthetic bars so numbers are comparable
+# from one commit to the next. no AWS, no Yahoo
+#
+#   python bench_suite.py --output bench_results.json
+#   python bench_suite.py --baseline bench_results.json     # exits 1 if anything regressed
+#
+# a benchmark regresses when its median time is more than its threshold times the baseline's
+
+DEFAULT_THRESHOLD = 1.25
+# end to end runs are noisier, so they get more slack
+THRESHOLDS = {
+    "macd_back_test": 1.4,
+    "startup": 1.4,
+}
+
+PLAY_EXCEPTIONS = (
+    OrderQuantitySmallerThanMinimum,
+    OrderValueSmallerThanMinimum,
+    InsufficientBalance,
+    StopPriceAlreadyMet,
+    TakeProfitAlreadyMet,
+)
+
+
+class SyntheticWorker(MacdWorker):
+    """MacdWorker that takes its bars from synthetic_bars instead of S3 and Yahoo"""
+
+    def _get_bars(self, from_date=None, to_date=None, initialised: bool = True):
+        bars = self.market_data_source.Ticker(self.symbol).history(
+            start=from_date, interval=self.interval
+        )
+        if self.back_testing:
+            self.api._put_bars(symbol=self.symbol, bars=bars)
+        return bars
+
+
+class SyntheticBot(MacdBot):
+    worker_class = SyntheticWorker
+
+
+def make_config(all_bars: dict, interval: str = "5m", balance: float = 100000):
+    # just what MacdBot and MacdWorker read, with everything kept in memory
+    return SimpleNamespace(
+        store=BackTestStore(),
+        interval=interval,
+        run_type="back_test",
+        back_testing=True,
+        paper_testing=False,
+        production_run=False,
+        back_testing_balance=balance,
+        back_testing_override_broker=True,
+        back_testing_skip_bar_update=True,
+        bot_telemetry=BotTelemetry(back_testing=True),
+        notification_service=notification_services.LocalEcho(),
+        market_data_source=synthetic_bars.SyntheticMarketData(all_bars),
+        buy_market=False,
+        order_size=5000,
+        profit_target=1.5,
+        path_rules="/bench/rules",
+        path_state="/bench/state",
+        max_concurrency=1,
+        async_processing=False,
+        max_bars=None,
+        compact_bars=False,
+        float32_bars=False,
+        shared_bars=None,
+        archive_path=None,
+        bar_partitions=None,
+        bars_start=None,
+        bars_end=None,
+    )
+
+
+def signal_dates(bars, limit: int) -> list:
+    # crossovers below zero - where the bot would consider buying
+    buy_points = bars.index[(bars.macd_crossover == True) & (bars.macd_macd < 0)]
+    return [date for date in buy_points if bars.index.get_loc(date) > 250][:limit]
+
+
+# each benchmark sets up, then returns (callable to time, number of operations it does)
+
+
+def bench_add_signals(params):
+    bars = synthetic_bars.make_bars(symbols=1, bars=params.bars, seed=params.seed)
+    symbol_bars = next(iter(bars.values()))
+    return lambda: utils.add_signals(symbol_bars, params.interval), len(symbol_bars)
+
+
+def bench_check_buy_signal(params):
+    bars = synthetic_bars.make_bars(symbols=1, bars=params.bars, seed=params.seed)
+    symbol, symbol_bars = next(iter(bars.items()))
+    symbol_bars = utils.add_signals(symbol_bars, params.interval)
+    telemetry = BotTelemetry(back_testing=True)
+    ends = range(len(symbol_bars) - params.checks, len(symbol_bars))
+
+    def run():
+        for end in ends:
+            utils.check_buy_signal(symbol_bars.iloc[:end], symbol, telemetry)
+
+    return run, len(ends)
+
+
+def bench_buy_plan(params):
+    bars = synthetic_bars.make_bars(symbols=1, bars=params.bars, seed=params.seed)
+    symbol, symbol_bars = next(iter(bars.items()))
+    symbol_bars = utils.add_signals(symbol_bars, params.interval)
+    dates = signal_dates(symbol_bars, limit=params.plays)
+
+    def run():
+        for date in dates:
+            try:
+                BuyPlan(
+                    symbol=symbol,
+                    df=symbol_bars.loc[:date],
+                    balance=10000,
+                    play_id="bench",
+                    precision=3,
+                    min_quantity_increment=0.001,
+                    min_quantity=0.001,
+                    min_price_increment=0.001,
+                )
+            except PLAY_EXCEPTIONS:
+                ...
+
+    return run, len(dates)
+
+
+def bench_back_test_fills(params):
+    all_bars = synthetic_bars.make_bars(
+        symbols=params.symbols, bars=params.fill_bars, seed=params.seed
+    )
+    index = next(iter(all_bars.values())).index
+
+    def run():
+        api = BackTestAPI(back_testing=True, back_testing_balance=100000000)
+        for symbol, bars in all_bars.items():
+            api._put_bars(symbol=symbol, bars=bars)
+        for date in index:
+            for symbol in all_bars:
+                api.buy_order_market(symbol=symbol, units=1, back_testing_date=date)
+                api.sell_order_market(symbol=symbol, units=1, back_testing_date=date)
+
+    return run, len(index) * len(all_bars) * 2
+
+
+def bench_rules_round_trip(params):
+    symbols = synthetic_bars.symbol_names(params.symbols)
+
+    def run():
+        rules = TABotRules(store=BackTestStore(), rules_path="/bench/rules", state_path="/bench/state")
+        for symbol in symbols:
+            buy_plan = SimpleNamespace(
+                symbol=symbol,
+                play_id=f"play-{symbol}",
+                stop_unit=90,
+                target_price=110,
+                risk_unit=10,
+                blue_cycle_start=datetime(2022, 1, 3),
+            )
+            order_result = SimpleNamespace(
+                symbol=symbol, filled_unit_price=100, filled_unit_quantity=1, order_id=symbol
+            )
+            rules.write_to_state(new_state={"symbol": symbol, "broker": "back_test"})
+            rules.write_to_rules(buy_plan=buy_plan, order_result=order_result)
+
+        for symbol in symbols:
+            rule = rules.get_rule(symbol=symbol)
+            rule["current_stop_loss"] = 95
+            rules.replace_rule(new_rule=rule, symbol=symbol)
+            rules.get_state(symbol=symbol)
+
+        for symbol in symbols:
+            rules.remove_from_rules(symbol=symbol)
+            rules.remove_from_state(symbol=symbol, broker="back_test")
+
+    return run, len(symbols) * 8
+
+
+def bench_macd_back_test(params):
+    all_bars = synthetic_bars.make_bars(
+        symbols=params.symbols, bars=params.bars, seed=params.seed
+    )
+    symbols = [{"symbol": symbol, "api": "back_test"} for symbol in all_bars]
+    records = params.bars - 250
+
+    def run():
+        # building the bot adds signals to every symbol, which is part of a real back test too
+        config = make_config(all_bars, interval=params.interval)
+        with redirect_stdout(io.StringIO()):
+            bot = SyntheticBot(symbols=symbols, config=config, run_id="bench")
+            bot.process_bars()
+
+    return run, records * len(symbols)
+
+
+def bench_order_records(params):
+    # what a long back test's telemetry holds on to - a buy and a sell per play, kept for the
+    # whole run - and turning them into orders_df at the end
+    dates = next(iter(synthetic_bars.make_bars(bars=1000, seed=params.seed).values())).index
+    plays = params.orders // 2
+
+    def run():
+        telemetry = BotTelemetry(back_testing=True)
+        for i in range(plays):
+            date = dates[i % len(dates)]
+            for order_type, prefix in [(1, "buy"), (2, "sell")]:
+                order = OrderResult(
+                    response={
+                        "order_type": order_type,
+                        "orderUuid": f"{prefix}-{i}",
+                        "symbol": "SYM0-USD",
+                        "quantity": 10,
+                        "status": 4,
+                        "feeAmount": 0,
+                        "created_time": date,
+                        "updated_time": date,
+                    }
+                )
+                order.filled_unit_quantity = 10.0
+                order.filled_unit_price = 100.0
+                order.filled_total_value = 1000.0
+                telemetry.add_order(order_result=order, play_id=f"play-{i}")
+
+        pd.DataFrame(order_columns(telemetry.orders))
+
+    return run, plays * 2
+
+
+def bench_portfolio_value(params):
+    # what tides does every cycle - a new bar for every symbol, then read portfolio_df. each symbol
+    # is missing a few different bars, so they have to be lined up
+    all_bars = synthetic_bars.make_bars(symbols=params.symbols, bars=params.bars, seed=params.seed)
+    start = params.bars - params.cycles
+    full_bars = {}
+    for i, (name, bars) in enumerate(all_bars.items()):
+        full_bars[name] = bars.drop(bars.index[i + 3 :: 17 + i])
+
+    def run():
+        symbols = []
+        for name, bars in full_bars.items():
+            symbol = SymbolData.__new__(SymbolData)
+            symbol.yf_symbol = name
+            symbol.bars = bars.iloc[:start]
+            symbol.refresh_cache = lambda: None
+            symbols.append(symbol)
+
+        portfolio = PortfolioValue(
+            portfolio={name: 1 for name in full_bars}, symbols=symbols, incremental=True
+        )
+        for cycle in range(params.cycles):
+            for symbol in symbols:
+                symbol.bars = full_bars[symbol.yf_symbol].iloc[: start + cycle + 1]
+            portfolio.portfolio_df
+
+    return run, params.cycles
+
+
+STARTUP_SCRIPT = """
+from types import SimpleNamespace
+from macd import MacdBot
+from macd_config import MacdConfig
+MacdConfig(SimpleNamespace(
+    interval="5m", run_type="back_test", symbols=None, buy_market=False, async_processing=False,
+    max_concurrency=1, back_testing_balance=100000, back_testing_override_broker=True,
+    back_testing_skip_bar_update=True, parameters_file=None, bars_path=".", telemetry_path=".",
+    play_log_path=None, notification_service="slack", max_bars=None,
+    compact_bars=False, float32_bars=False, archive_path=None, archive_chunk_bars=None,
+    derive_intervals=False, partitioned_bars=False, bars_start=None, bars_end=None,
+    profit_target=None,
+))
+"""
+
+
+def bench_startup(params):
+    # a fresh interpreter each time - imports plus building an offline back test config, which is
+    # what every back test pays before it looks at a single bar
+    bots_dir = os.path.dirname(os.path.abspath(__file__))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([bots_dir] + sys.path)}
+
+    def run():
+        subprocess.run([sys.executable, "-c", STARTUP_SCRIPT], env=env, check=True)
+
+    return run, 1
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "add_signals": bench_add_signals,
+    "check_buy_signal": bench_check_buy_signal,
+    "buy_plan": bench_buy_plan,
+    "back_test_fills": bench_back_test_fills,
+    "rules_round_trip": bench_rules_round_trip,
+    "macd_back_test": bench_macd_back_test,
+    "order_records": bench_order_records,
+    "portfolio_value": bench_portfolio_value,
+}
+
+# these also get one extra run under tracemalloc, to record peak memory
+MEASURE_MEMORY = {"order_records", "macd_back_test"}
+
+
+def run_benchmark(name: str, params) -> dict:
+    func, operations = BENCHMARKS[name](params)
+
+    timings = []
+    for i in range(params.repeat):
+        start_time = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start_time)
+
+    median = statistics.median(timings)
+    result = {
+        "median": median,
+        "min": min(timings),
+        "max": max(timings),
+        "repeat": params.repeat,
+        "operations": operations,
+        "ops_per_second": operations / median if median else None,
+    }
+
+    if name in MEASURE_MEMORY:
+        result["peak_bytes"] = measure_peak_memory(func)
+        result["bytes_per_operation"] = result["peak_bytes"] / operations
+
+    return result
+
+
+def measure_peak_memory(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: dict, baseline: dict, thresholds: dict = None) -> list:
+    """Returns a list of (name, ratio, threshold) for every benchmark that got slower than its
+    threshold allows. Benchmarks missing from either side are skipped"""
+    thresholds = thresholds or THRESHOLDS
+    regressions = []
+    for name, result in results["results"].items():
+        baseline_result = baseline["results"].get(name)
+        if baseline_result is None or not baseline_result["median"]:
+            continue
+
+        ratio = result["median"] / baseline_result["median"]
+        threshold = thresholds.get(name, DEFAULT_THRESHOLD)
+        if ratio > threshold:
+            regressions.append((name, ratio, threshold))
+
+        # memory is a lot less noisy than time, so it shares the threshold
+        if result.get("peak_bytes") and baseline_result.get("peak_bytes"):
+            ratio = result["peak_bytes"] / baseline_result["peak_bytes"]
+            if ratio > threshold:
+                regressions.append((f"{name} memory", ratio, threshold))
+
+    return regressions
+
+
+def main(args) -> int:
+    # the engine logs a lot at DEBUG - that's not what we're measuring
+    log_setup.configure(back_testing=True)
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "params": vars(args),
+        "results": {},
+    }
+
+    for name in names:
+        result = run_benchmark(name, args)
+        results["results"][name] = result
+        message = (
+            f"{name:>18}: median {result['median']:.4f}s over {result['repeat']} runs, "
+            f"{result['ops_per_second']:,.0f} ops/s"
+        )
+        if "peak_bytes" in result:
+            message += (
+                f", peak {result['peak_bytes'] / 1024 / 1024:,.1f}MB "
+                f"({result['bytes_per_operation']:,.0f} bytes/op)"
+            )
+        print(message)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+        regressions = compare(results, baseline)
+        for name, ratio, threshold in regressions:
+            print(f"REGRESSION {name}: {ratio:.2f}x the baseline (allowed {threshold}x)")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (commit {baseline.get('commit')})")
+
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Trading engine benchmarks")
+    parser.add_argument("--only", default=None, help="Comma separated benchmarks to run")
+    parser.add_argument("--symbols", type=int, default=5)
+    parser.add_argument("--bars", type=int, default=2000)
+    parser.add_argument("--fill_bars", type=int, default=200)
+    parser.add_argument("--checks", type=int, default=500)
+    parser.add_argument("--plays", type=int, default=20)
+    parser.add_argument("--orders", type=int, default=100000)
+    parser.add_argument("--cycles", type=int, default=200)
+    parser.add_argument("--interval", default="5m")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", default=None, help="Write results to this JSON file")
+    parser.add_argument("--baseline", default=None, help="Compare against this results file")
+    sys.exit(main(parser.parse_args()))
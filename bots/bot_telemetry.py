@@ -1,18 +1,10 @@
-import logging
-import boto3
 import pandas as pd
-from itradeapi import IOrderResult
+import threading
+import http_sessions
+import log_setup
+from itradeapi import IOrderResult, order_columns
 
-log_wp = logging.getLogger("bot_telemetry")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("bot_telemetry.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("bot_telemetry")
 
 
 class BotTelemetry:
@@ -67,6 +59,8 @@ class BotTelemetry:
         self.peak_orders = 0
         self.peak_capital_balance = 0
         self.concurrent_orders = 0
+        # MacdBot.process_bars_async runs symbols on a thread pool, and they all report in here
+        self._lock = threading.Lock()
 
     def add_order(self, order_result: IOrderResult, play_id: str):
         # TODO - this is a dumb error specific to back testing that I don't care enough about to fix
@@ -75,15 +69,16 @@ class BotTelemetry:
             return
 
         order_result.play_id = play_id
-        self.orders.append(order_result)
-        self._update_counters()
-        self._update_streaks()
-        self._update_peaks()
+        with self._lock:
+            self.orders.append(order_result)
+            self._update_counters()
+            self._update_streaks()
+            self._update_peaks()
 
         # if order_result.order_type == MARKET_SELL:
 
     def generate_df(self):
-        self.orders_df = pd.DataFrame([x.as_dict() for x in self.orders])
+        self.orders_df = pd.DataFrame(order_columns(self.orders))
         if len(self.orders_df) == 0:
             return
 
@@ -233,11 +228,12 @@ class BotTelemetry:
             columns=BotTelemetry.cycle_columns,
             index=[0],
         )
-        self.cycle_df = pd.concat([self.cycle_df, new_row], ignore_index=True)
+        with self._lock:
+            self.cycle_df = pd.concat([self.cycle_df, new_row], ignore_index=True)
 
     def save_cycle(self):
         if len(self.cycle_df) > 0:
-            dyn = boto3.resource("dynamodb")
+            dyn = http_sessions.get_boto3_resource("dynamodb")
             table = dyn.Table("bot_telemetry_macd_cycles")
             cycle_json = self.cycle_df.to_json()
             # formatted_cycle_json = json.dumps(cycle_json, indent=4, sort_keys=True)
@@ -10,26 +10,21 @@ from itradeapi import (
     UntradeableAssetError,
     BrokerAPIError,
 )
-import yfinance as yf
 from datetime import datetime
 from alpaca_trade_api import REST, entity
 from alpaca_trade_api.rest import APIError
 import pandas as pd
-import boto3
-import logging
 import math
 from dateutil.relativedelta import relativedelta
 
-log_wp = logging.getLogger("alpaca")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("alpaca.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+import asset_cache
+import broker_registry
+import http_sessions
+import log_setup
+import rate_limiter
+import utils
+
+log_wp = log_setup.get_logger("alpaca")
 
 # CONSTANTS
 MARKET_BUY = 1
@@ -106,6 +101,8 @@ INTERVAL_MAP = {
 
 
 class OrderResult(IOrderResult):
+    __slots__ = ()
+
     def __init__(self, response: entity.Order, alpaca_to_yf_symbol_map: dict):
         self._raw_response = response
 
@@ -216,31 +213,57 @@ class AlpacaAPI(ITradeAPI):
             secret_key=alpaca_secret_key,
             base_url=base_url,
         )
-
-        # set up asset lists
-        self._build_asset_list()
-
-        # self.asset_list_by_id = self._structure_asset_dict_by_id(assets)
-        self.asset_list_by_symbol = self._structure_asset_dict_by_symbol(self.assets)
-
-        self.supported_crypto_symbols_alp = self._get_crypto_symbols()
-        self._create_yf_to_alpaca_symbol_mapping(self.supported_crypto_symbols_alp)
-        self.supported_crypto_symbols_yf = self._get_crypto_symbols_yf()
+        # swap the REST client's private session for the shared, pooled one
+        self.api._session = http_sessions.get_session("alpaca")
+
+        # set up asset lists - served from the on-disk cache if we have one
+        self._asset_cache = asset_cache.AssetCache(
+            broker_name=self.get_broker_name(),
+            loader=self._download_asset_list,
+            on_refresh=self._build_asset_list,
+        )
+        self._build_asset_list(self._asset_cache.load())
 
         self.default_currency = "USD"
 
-    def _build_asset_list(self):
-        alpaca_assets = self.api.list_assets()
+    def _download_asset_list(self) -> list:
+        # keep just what we need from each asset so the cache stays small and json friendly
+        assets = []
+        for asset in self.api.list_assets():
+            raw = asset._raw
+            assets.append(
+                {
+                    "symbol": raw["symbol"],
+                    "class": raw["class"],
+                    "status": raw["status"],
+                    "tradable": raw["tradable"],
+                    # only crypto assets have these, equities use the defaults in _make_asset
+                    "min_order_size": raw.get("min_order_size"),
+                    "min_trade_increment": raw.get("min_trade_increment"),
+                    "price_increment": raw.get("price_increment"),
+                }
+            )
+        return assets
 
-        self._invalid_assets = {}
+    def _build_asset_list(self, alpaca_assets: list):
+        invalid_assets = {}
         valid_assets = []
         for asset in alpaca_assets:
-            if asset.status == "inactive" or not asset.tradable:
-                self._invalid_assets[asset.symbol] = asset
+            if asset["status"] == "inactive" or not asset["tradable"]:
+                invalid_assets[asset["symbol"]] = asset
             else:
                 valid_assets.append(asset)
 
+        # build everything first and then swap it in, since a background refresh calls this too
+        asset_list_by_symbol = self._structure_asset_dict_by_symbol(valid_assets)
+        supported_crypto_symbols_alp = self._get_crypto_symbols(valid_assets)
+
+        self._invalid_assets = invalid_assets
         self.assets = valid_assets
+        self.asset_list_by_symbol = asset_list_by_symbol
+        self._create_yf_to_alpaca_symbol_mapping(supported_crypto_symbols_alp)
+        self.supported_crypto_symbols_alp = supported_crypto_symbols_alp
+        self.supported_crypto_symbols_yf = self._get_crypto_symbols_yf()
 
     def validate_symbol(self, symbol: str):
         al_symbol = self._to_alpaca(symbol)
@@ -259,10 +282,10 @@ class AlpacaAPI(ITradeAPI):
         return False
 
         # so its invalid but the broker does know about it - delisted/not tradeable
-        if self._invalid_assets[al_symbol].status == "inactive":
+        if self._invalid_assets[al_symbol]["status"] == "inactive":
             raise DelistedAssetError(f"{symbol} has been delisted on {self.get_broker_name()}")
 
-        if self._invalid_assets[al_symbol].tradable == False:
+        if self._invalid_assets[al_symbol]["tradable"] == False:
             raise UntradeableAssetError(
                 f"{symbol} is not currently tradeable on {self.get_broker_name()}"
             )
@@ -275,13 +298,13 @@ class AlpacaAPI(ITradeAPI):
         return yf_symbols
 
     def _create_yf_to_alpaca_symbol_mapping(self, crypto_symbols):
-        self._yf_to_alpaca_symbol_map = {}
-        self._alpaca_to_yf_symbol_map = {}
+        yf_to_alpaca_symbol_map = {}
+        alpaca_to_yf_symbol_map = {}
         for symbol in crypto_symbols:
             if symbol[-4:] == "/USD":
                 yf_symbol = symbol[:-4] + "-USD"
-                self._yf_to_alpaca_symbol_map[yf_symbol] = symbol
-                self._alpaca_to_yf_symbol_map[symbol] = yf_symbol
+                yf_to_alpaca_symbol_map[yf_symbol] = symbol
+                alpaca_to_yf_symbol_map[symbol] = yf_symbol
             elif symbol.find("/") > 0:
                 # ignore the other binary pairs, USDT and BTC
                 ...
@@ -294,15 +317,18 @@ class AlpacaAPI(ITradeAPI):
             # self._yf_to_alpaca_symbol_map[yf_symbol] = symbol
             # self._alpaca_to_yf_symbol_map[symbol] = yf_symbol
 
+        self._yf_to_alpaca_symbol_map = yf_to_alpaca_symbol_map
+        self._alpaca_to_yf_symbol_map = alpaca_to_yf_symbol_map
+
     def get_broker_name(self) -> str:
         return "alpaca"
 
-    def _get_crypto_symbols(self) -> list:
+    def _get_crypto_symbols(self, assets: list) -> list:
         # convert this to yf symbols
         crypto_symbols = []
-        for asset in self.assets:
-            if asset._raw["class"] == "crypto":
-                crypto_symbols.append(asset._raw["symbol"])
+        for asset in assets:
+            if asset["class"] == "crypto":
+                crypto_symbols.append(asset["symbol"])
 
         return crypto_symbols
 
@@ -315,7 +341,7 @@ class AlpacaAPI(ITradeAPI):
         for asset in asset_dict:
             # code
             # name
-            return_dict[str(asset.symbol)] = asset
+            return_dict[str(asset["symbol"])] = asset
         return return_dict
 
     def get_account(self) -> Account:
@@ -343,12 +369,12 @@ class AlpacaAPI(ITradeAPI):
 
     def get_last_close(self, symbol: str):
         raise NotImplementedError
-        history = yf.Ticker(symbol).history(interval="1m", actions=False)
+        history = utils.YahooMarketData().Ticker(symbol).history(interval="1m", actions=False)
         return history["Close"].iloc[-1]
 
     def get_bars(self, symbol: str, start: str, end: str, interval: str):
         raise NotImplementedError
-        return yf.Ticker(symbol).history(start=start, end=end, interval=interval, actions=False)
+        return utils.YahooMarketData().Ticker(symbol).history(start=start, end=end, interval=interval, actions=False)
 
     def _to_yf(self, alpaca_symbol) -> str:
         if alpaca_symbol in self._alpaca_to_yf_symbol_map:
@@ -579,12 +605,11 @@ class AlpacaAPI(ITradeAPI):
     # def get_asset(self, symbol):
     #    return self.api.get_asset(symbol=self._to_alpaca(symbol))
 
-    def get_asset(self, symbol: str) -> Asset:
-        asset = self.api.get_asset(symbol=self._to_alpaca(symbol))
-        if hasattr(asset, "min_order_size"):
-            min_order_size = float(asset.min_order_size)
-            min_trade_increment = float(asset.min_trade_increment)
-            min_price_increment = float(asset.price_increment)
+    def _make_asset(self, symbol: str, cached_asset: dict) -> Asset:
+        if cached_asset.get("min_order_size") is not None:
+            min_order_size = float(cached_asset["min_order_size"])
+            min_trade_increment = float(cached_asset["min_trade_increment"])
+            min_price_increment = float(cached_asset["price_increment"])
         else:
             min_order_size = 1
             min_trade_increment = 1
@@ -597,6 +622,24 @@ class AlpacaAPI(ITradeAPI):
             min_price_increment=min_price_increment,
         )
 
+    def get_asset(self, symbol: str) -> Asset:
+        self._asset_cache.refresh_if_stale()
+
+        al_symbol = self._to_alpaca(symbol)
+        cached_asset = self.asset_list_by_symbol.get(al_symbol)
+        if cached_asset is None:
+            # not in the cache (new listing since the last refresh?) so fall back to asking alpaca
+            log_wp.debug(f"{symbol}: Not in the cached asset list, fetching it from Alpaca")
+            cached_asset = self.api.get_asset(symbol=al_symbol)._raw
+
+        return self._make_asset(symbol=symbol, cached_asset=cached_asset)
+
+    def get_assets(self, symbols: list) -> dict:
+        assets = {}
+        for symbol in symbols:
+            assets[symbol] = self.get_asset(symbol=symbol)
+        return assets
+
     def get_symbol_minimums(self, symbol):
         asset = self.get_asset(symbol=symbol)
         if hasattr(asset, "min_order_size"):
@@ -609,6 +652,19 @@ class AlpacaAPI(ITradeAPI):
             self.min_price_increment = 0.001
 
 
+@broker_registry.register("alpaca")
+def make_api(config):
+    return rate_limiter.wrap_api(
+        AlpacaAPI(
+            alpaca_key_id=config.alpaca_api_key,
+            alpaca_secret_key=config.alpaca_security_key,
+            back_testing=config.back_testing,
+            back_testing_balance=config.back_testing_balance,
+            real_money_trading=config.production_run,
+        )
+    )
+
+
 if __name__ == "__main__":
     import boto3
 
@@ -10,6 +10,9 @@ from pandas import Timestamp
 import logging
 import pytz
 import utils
+import broker_registry
+import log_setup
+import shared_bars
 
 # import datetime
 # from dateutil.relativedelta import relativedelta
@@ -19,18 +22,7 @@ import utils
 # that i need to pipe them through?
 # or maybe make a script to update them?!
 
-log_wp = logging.getLogger(
-    "backtest_api"
-)  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("backtest_api.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.INFO)
+log_wp = log_setup.get_logger("backtest_api", level=logging.INFO)
 
 
 # CONSTANTS
@@ -91,6 +83,8 @@ INTERVAL_MAP = {
 
 
 class OrderResult(IOrderResult):
+    __slots__ = ()
+
     def __init__(self, response: dict):
         self._raw_response = response
 
@@ -454,6 +448,9 @@ class BackTestAPI(ITradeAPI):
             return False
 
     def _put_bars(self, symbol, bars):
+        # a SharedBarsHandle means the bars are in shared memory, so attach rather than copy
+        if isinstance(bars, shared_bars.SharedBarsHandle):
+            bars = shared_bars.attach(bars)
         self._bars[symbol] = bars
 
     def _get_held_units(self, symbol):
@@ -473,6 +470,9 @@ class BackTestAPI(ITradeAPI):
         # assumes that this gets called with back_testing_date for every index in bars, since it only checks this index/back_testing_date
         filled_symbols = []
 
+        # this runs for every order on every bar, so only build debug messages if they'll be logged
+        debug = log_wp.isEnabledFor(logging.DEBUG)
+
         # hacky way of avoiding deleting orders and raising RuntimeError for dict changed size during iteration
         orders_copy = self._orders.copy()
         for symbol in orders_copy:
@@ -484,24 +484,27 @@ class BackTestAPI(ITradeAPI):
             ):
                 self._inactive_orders.append(this_order)
                 filled_symbols.append(symbol)
-                log_wp.debug(
-                    f"{symbol}: Skipping this symbol in _inactive_orders since the "
-                    f"status is {ORDER_STATUS_ID_TO_SUMMARY[this_order.status]}"
-                )
+                if debug:
+                    log_wp.debug(
+                        f"{symbol}: Skipping this symbol in _inactive_orders since the "
+                        f"status is {ORDER_STATUS_ID_TO_SUMMARY[this_order.status]}"
+                    )
                 continue
 
             try:
                 check_index = self._bars[symbol].loc[back_testing_date]
             except KeyError as e:
-                log_wp.debug(f"{symbol}: No data for {back_testing_date}")
+                if debug:
+                    log_wp.debug(f"{symbol}: No data for {back_testing_date}")
                 continue
 
             # if we got here, the order is not yet actioned
             if this_order.order_type == MARKET_BUY:
                 # immediate fill - its just a question of how many units they bought
-                log_wp.debug(
-                    f"{symbol}: Starting fill for MARKET_BUY order {this_order.order_id}"
-                )
+                if debug:
+                    log_wp.debug(
+                        f"{symbol}: Starting fill for MARKET_BUY order {this_order.order_id}"
+                    )
 
                 unit_price = round(
                     self._bars[symbol].Low.loc[back_testing_date],
@@ -551,15 +554,17 @@ class BackTestAPI(ITradeAPI):
 
                 filled_symbols.append(symbol)
 
-                log_wp.debug(
-                    f"{symbol}: market_buy filled, {this_order.filled_unit_quantity} "
-                    f"units at {this_order.filled_unit_price}, balance {self._balance}"
-                )
+                if debug:
+                    log_wp.debug(
+                        f"{symbol}: market_buy filled, {this_order.filled_unit_quantity} "
+                        f"units at {this_order.filled_unit_price}, balance {self._balance}"
+                    )
 
             elif this_order.order_type == MARKET_SELL:
-                log_wp.debug(
-                    f"{symbol}: Starting fill for MARKET_SELL order {this_order.order_id}"
-                )
+                if debug:
+                    log_wp.debug(
+                        f"{symbol}: Starting fill for MARKET_SELL order {this_order.order_id}"
+                    )
 
                 # how many of this symbol do we own? is it >= than the requested amount to sell?
                 held, paid = self._get_held_units(symbol)
@@ -613,9 +618,10 @@ class BackTestAPI(ITradeAPI):
                     self._bars[symbol].Low.loc[back_testing_date]
                     < this_order.ordered_unit_price
                 ):
-                    log_wp.debug(
-                        f"{symbol}: Starting fill for LIMIT_BUY order {this_order.order_id}"
-                    )
+                    if debug:
+                        log_wp.debug(
+                            f"{symbol}: Starting fill for LIMIT_BUY order {this_order.order_id}"
+                        )
 
                     # don't process this order if it would send balance to negative
                     order_value = (
@@ -680,18 +686,20 @@ class BackTestAPI(ITradeAPI):
                     self._bars[symbol].High.loc[back_testing_date]
                     > this_order.ordered_unit_price
                 ):
-                    log_wp.debug(
-                        f"{symbol}: Starting fill for LIMIT_SELL order {this_order.order_id}"
-                    )
+                    if debug:
+                        log_wp.debug(
+                            f"{symbol}: Starting fill for LIMIT_SELL order {this_order.order_id}"
+                        )
                     # how many of this symbol do we own? is it >= than the requested amount to sell?
                     held, paid = self._get_held_units(symbol)
 
                     if held < this_order.ordered_unit_quantity:
-                        log_wp.debug(
-                            f"{symbol}: Failed to fill order {this_order.order_id} - "
-                            f"trying to sell {this_order.ordered_unit_quantity} units "
-                            f"but only hold {held}"
-                        )
+                        if debug:
+                            log_wp.debug(
+                                f"{symbol}: Failed to fill order {this_order.order_id} - "
+                                f"trying to sell {this_order.ordered_unit_quantity} units "
+                                f"but only hold {held}"
+                            )
                         self.cancel_order(
                             order_id=this_order.order_id,
                             back_testing_date=back_testing_date,
@@ -910,6 +918,14 @@ class BackTestAPI(ITradeAPI):
         return True
 
 
+@broker_registry.register("back_test")
+def make_api(config):
+    return BackTestAPI(
+        back_testing=config.back_testing,
+        back_testing_balance=config.back_testing_balance,
+    )
+
+
 if __name__ == "__main__":
     starting_balance = 10000
     api = BackTestAPI(back_testing=True, back_testing_balance=starting_balance)
@@ -1,5 +1,4 @@
 from binance import Client, ThreadedWebsocketManager, ThreadedDepthCacheManager
-import boto3
 
 from itradeapi import (
     ITradeAPI,
@@ -16,22 +15,12 @@ from itradeapi import (
 
 from datetime import datetime
 import pandas as pd
-import boto3
-import logging
 import math
 from dateutil.relativedelta import relativedelta
+import log_setup
 
 
-log_wp = logging.getLogger("binance")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("binance.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("binance")
 
 # CONSTANTS
 MARKET_BUY = 1
@@ -44,6 +33,8 @@ DUST_SELL = 8
 
 
 class OrderResult(IOrderResult):
+    __slots__ = ()
+
     def __init__(self, response, binance_to_yf_symbol_map: dict):
         self._raw_response = response
 
@@ -139,10 +130,12 @@ class BinanceAPI():
         prices = self.api.get_all_tickers()
 
 
-
+# not registered with broker_registry until BinanceAPI implements ITradeAPI
 
 
 if __name__ == "__main__":
+    import boto3
+
     ssm = boto3.client("ssm")
     api_key = (
         ssm.get_parameter(Name="/tabot/paper/binance/api_key", WithDecryption=True)
@@ -0,0 +1,101 @@
+# external packages
+from concurrent.futures import ThreadPoolExecutor
+import importlib
+import threading
+import time
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("broker_registry")
+
+# broker name (as used in the symbol lists) -> the module its adapter lives in. each adapter module
+# registers a factory that builds a ready to use api from a MacdConfig:
+#
+#   @broker_registry.register("swyftx")
+#   def make_api(config):
+#       return rate_limiter.wrap_api(SwyftxAPI(access_token=config.swyftx_access_token, ...))
+#
+# modules only get imported the first time their broker is asked for, so a back test never pays
+# for the Alpaca or Swyftx SDKs. a broker that lives outside this repo can be added with
+# register_module() - nothing in MacdBot needs to know about it
+
+MODULES = {
+    "back_test": "broker_back_test",
+    "swyftx": "broker_swyftx",
+    "alpaca": "broker_alpaca",
+    # broker_binance isn't here yet - BinanceAPI doesn't implement ITradeAPI so it can't be built
+}
+
+_factories = {}
+_lock = threading.RLock()
+
+
+def register(name: str):
+    """Decorator for an adapter module's factory(config) -> api"""
+
+    def decorator(factory):
+        with _lock:
+            _factories[name] = factory
+        return factory
+
+    return decorator
+
+
+def register_module(name: str, module_name: str):
+    """Tells the registry where to find broker name's adapter, eg. for a plugin"""
+    with _lock:
+        MODULES[name] = module_name
+
+
+def available() -> list:
+    return list(MODULES)
+
+
+def get_factory(name: str):
+    """Returns the factory for broker name, importing its module if this is the first ask"""
+    with _lock:
+        if name in _factories:
+            return _factories[name]
+
+        if name not in MODULES:
+            raise ValueError(f"Unknown broker specified {name}")
+
+        importlib.import_module(MODULES[name])
+        if name not in _factories:
+            raise ValueError(f"{MODULES[name]} didn't register a factory for broker {name}")
+
+        log_wp.debug(f"Loaded {name} broker from {MODULES[name]}")
+        return _factories[name]
+
+
+def build(names, config, max_workers: int = None) -> tuple:
+    """Builds an api for each broker in names at the same time, since each one usually spends its
+    setup waiting on its asset list
+
+    Returns ({name: api}, {name: seconds it took to build}). If any broker fails to build, the
+    first failure is raised once the others have finished
+    """
+    names = list(dict.fromkeys(names))
+    if len(names) == 0:
+        return {}, {}
+
+    # import on this thread - importing the same module from several threads isn't worth the risk
+    factories = {name: get_factory(name) for name in names}
+
+    def timed_build(name):
+        start_time = time.perf_counter()
+        api = factories[name](config)
+        return api, time.perf_counter() - start_time
+
+    with ThreadPoolExecutor(
+        max_workers=max_workers or len(names), thread_name_prefix="broker_setup"
+    ) as executor:
+        futures = {name: executor.submit(timed_build, name) for name in names}
+
+    apis = {}
+    timings = {}
+    for name, future in futures.items():
+        apis[name], timings[name] = future.result()
+
+    return apis, timings
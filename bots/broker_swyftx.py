@@ -1,13 +1,11 @@
 from datetime import datetime
 from decimal import Decimal
 import json
-import logging
 from math import log10
 import pyswyft
 from pyswyft.endpoints import accounts, history, markets, orders
 import pytz
 import time
-import yfinance as yf
 
 
 from itradeapi import (
@@ -27,18 +25,14 @@ from itradeapi import (
     BuyImmediatelyTriggeredError
 )
 
+import asset_cache
+import broker_registry
+import http_sessions
+import log_setup
+import rate_limiter
 import utils
 
-log_wp = logging.getLogger("swyftx")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("swyftx.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("swyftx")
 
 
 class OrderRequiresPriceOrUnitsException(Exception):
@@ -101,6 +95,8 @@ ORDER_MAP = {
 ORDER_MAP_INVERTED = {y: x for x, y in ORDER_MAP.items()}
 
 class OrderResult(IOrderResult):
+    __slots__ = ()
+
     def __init__(self, order_object, asset_list_by_id: dict):
         self._raw_response = order_object
         self.status = order_object["status"]
@@ -178,27 +174,53 @@ class SwyftxAPI(ITradeAPI):
 
         if real_money_trading != True:
             # now use the environment that was actually requested. i hate this.
-            self.api = pyswyft.API(access_token=access_token, environment="demo")
+            self.api = self._make_api(environment="demo")
         else:
-            self.api = pyswyft.API(access_token=access_token, environment="live")
+            self.api = self._make_api(environment="live")
 
-        # set up data structures
-        self._build_asset_list()
+        # set up data structures - served from the on-disk cache if we have one
+        self._asset_cache = asset_cache.AssetCache(
+            broker_name=self.get_broker_name(),
+            loader=self._download_asset_list,
+            on_refresh=self._build_asset_list,
+        )
+        self._build_asset_list(self._asset_cache.load())
 
         self.default_currency = "USD"
 
         self.rejected_orders = {}
 
+    def _make_api(self, environment: str) -> pyswyft.API:
+        api = pyswyft.API(access_token=self.access_token, environment=environment)
+        # pyswyft makes its own requests.Session - replace it with a shared pooled one, keeping
+        # the auth headers pyswyft set up. demo and live are different hosts with their own auth,
+        # so each environment gets its own session
+        api.client = http_sessions.get_session(
+            f"swyftx_{environment}", headers=dict(api.client.headers)
+        )
+        return api
+
     def get_precision(self, yf_symbol:str)->int:
         return 5
 
     def get_broker_name(self)->str:
         return "swyftx"
 
-    def get_assets(self)->dict:
-        return self._asset_list_by_yf_symbol
+    def get_session_name(self)->str:
+        return f"swyftx_{self.api.environment}"
+
+    def get_assets(self, symbols:list=None)->dict:
+        self._asset_cache.refresh_if_stale()
+        if symbols is None:
+            return self._asset_list_by_yf_symbol
+
+        assets = {}
+        for symbol in symbols:
+            assets[symbol] = self._asset_list_by_yf_symbol[symbol]
+        return assets
 
     def get_asset(self, symbol:str)->Asset:
+        self._asset_cache.refresh_if_stale()
         return self._asset_list_by_yf_symbol[symbol]
 
     def get_asset_by_id(self, id)->Asset:
@@ -234,12 +256,21 @@ class SwyftxAPI(ITradeAPI):
         location = yf_symbol.rfind("USD") - 1
         return yf_symbol[:location]
 
-    def _build_asset_list(self)->bool:
+    def _download_asset_list(self)->list:
         # this is munted. there's no Markets endpoint in demo?!
-        temp_api = pyswyft.API(access_token=self.access_token, environment="live")
-        raw_assets = temp_api.request(markets.MarketsAssets())
+        if self.api.environment == "live":
+            markets_api = self.api
+        else:
+            markets_api = self._make_api(environment="live")
+        raw_assets = markets_api.request(markets.MarketsAssets())
+
+        # only keep the fields we use so the cache stays small
+        keep = ["id", "code", "minimum_order", "minimum_order_increment", "tradable", "buyDisabled", "delisting"]
+        return [{key: this_asset[key] for key in keep} for this_asset in raw_assets]
+
+    def _build_asset_list(self, raw_assets:list)->bool:
         valid_assets = []
-        self._invalid_assets = {}
+        invalid_assets = {}
 
         # convert them to Asset objects
         for this_asset in raw_assets:
@@ -249,13 +280,16 @@ class SwyftxAPI(ITradeAPI):
             asset_obj = Asset(symbol=yf_symbol, min_quantity=minimum_order, min_quantity_increment=minimum_order_increment, min_price_increment=0.00001)
             asset_obj.id = this_asset["id"]
             if self._is_invalid_asset(this_asset):
-                self._invalid_assets[yf_symbol] = asset_obj
+                invalid_assets[yf_symbol] = asset_obj
             else:
                 valid_assets.append(asset_obj)
 
-        # set up asset lists
-        self._asset_list_by_yf_symbol = self._structure_asset_dict_by_yf_symbol(valid_assets)
-        self._asset_list_by_id = self._structure_asset_dict_by_id(valid_assets)
+        # set up asset lists. build them first and swap them in, since a background refresh calls this too
+        asset_list_by_yf_symbol = self._structure_asset_dict_by_yf_symbol(valid_assets)
+        asset_list_by_id = self._structure_asset_dict_by_id(valid_assets)
+        self._invalid_assets = invalid_assets
+        self._asset_list_by_yf_symbol = asset_list_by_yf_symbol
+        self._asset_list_by_id = asset_list_by_id
 
         return True
 
@@ -410,7 +444,7 @@ class SwyftxAPI(ITradeAPI):
 
         symbol = symbol + "-USD"
 
-        return yf.Ticker(symbol).history(
+        return utils.YahooMarketData().Ticker(symbol).history(
             start=start, end=end, interval=interval, actions=False
         )
 
@@ -729,6 +763,19 @@ def reset(api):
     for o in orders:
         api.cancel_order(o.order_id)
 
+
+@broker_registry.register("swyftx")
+def make_api(config):
+    return rate_limiter.wrap_api(
+        SwyftxAPI(
+            access_token=config.swyftx_access_token,
+            back_testing=config.back_testing,
+            back_testing_balance=config.back_testing_balance,
+            real_money_trading=config.production_run,
+        )
+    )
+
+
 if __name__ == "__main__":
     import boto3
 
@@ -1,9 +1,9 @@
 # external packages
 from decimal import Decimal
-import logging
 from math import floor, log10
 
 # my modules
+import log_setup
 from itradeapi import IOrderResult, Position
 from utils import (
     get_blue_cycle_start,
@@ -14,16 +14,7 @@ from utils import (
     clean,
 )
 
-log_wp = logging.getLogger("buyplan")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("buyplan.log")
-log_wp.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
+log_wp = log_setup.get_logger("buyplan")
 
 
 class OrderQuantitySmallerThanMinimum(Exception):
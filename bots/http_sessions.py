@@ -0,0 +1,213 @@
+# external packages
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("http_sessions")
+
+# (connect, read) in seconds
+DEFAULT_TIMEOUT = (3.05, 15)
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 20
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that applies a default timeout to any request that doesn't specify one
+
+    requests has no session-wide timeout, and most of the broker SDKs never pass one, so
+    without this a hung socket blocks the bot forever
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, *args, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+
+class SessionFactory:
+    """Builds and holds on to the HTTP sessions and AWS clients used by the bot
+
+    Every adapter (Alpaca, Swyftx, Slack, Pushover, boto3) asks this for its client so that
+    connection pooling, keep-alive, timeouts and retries are configured in one place, and so
+    the same sockets get reused from one cycle to the next instead of being reopened
+    """
+
+    def __init__(
+        self,
+        timeout: tuple = DEFAULT_TIMEOUT,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        retries: int = DEFAULT_RETRIES,
+        backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+        retry_statuses: list = DEFAULT_RETRY_STATUSES,
+    ):
+        self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.retry_statuses = retry_statuses
+
+        self._sessions = {}
+        self._boto3_clients = {}
+        self._boto3_resources = {}
+
+    def _make_retry(self) -> Retry:
+        # Retry's default allowed_methods only covers idempotent verbs, so a POST that submits
+        # an order is never resent automatically - the broker adapters decide what to do with those
+        return Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=self.retry_statuses,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+
+    def _make_adapter(self) -> TimeoutHTTPAdapter:
+        return TimeoutHTTPAdapter(
+            timeout=self.timeout,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            max_retries=self._make_retry(),
+        )
+
+    def get_session(self, name: str, headers: dict = None) -> requests.Session:
+        # headers only go on when the session is made - it's shared, so a later caller can't
+        # change them under everyone else. anything with its own auth needs its own name
+        session = self._sessions.get(name)
+        if session is None:
+            session = requests.Session()
+            adapter = self._make_adapter()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers.update({"Connection": "keep-alive"})
+            if headers:
+                session.headers.update(headers)
+            self._sessions[name] = session
+            log_wp.log(9, f"{name}: Created new pooled HTTP session")
+
+        return session
+
+    def get_boto3_config(self):
+        from botocore.config import Config
+
+        return Config(
+            connect_timeout=self.timeout[0],
+            read_timeout=self.timeout[1],
+            max_pool_connections=self.pool_maxsize,
+            retries={"max_attempts": self.retries, "mode": "standard"},
+            tcp_keepalive=True,
+        )
+
+    def get_boto3_client(self, service: str):
+        # boto3 is imported here rather than at the top so that callers that only need
+        # a requests session don't pay for it
+        import boto3
+
+        client = self._boto3_clients.get(service)
+        if client is None:
+            client = boto3.client(service, config=self.get_boto3_config())
+            self._boto3_clients[service] = client
+            log_wp.log(9, f"{service}: Created new boto3 client")
+        return client
+
+    def get_boto3_resource(self, service: str):
+        import boto3
+
+        resource = self._boto3_resources.get(service)
+        if resource is None:
+            resource = boto3.resource(service, config=self.get_boto3_config())
+            self._boto3_resources[service] = resource
+            log_wp.log(9, f"{service}: Created new boto3 resource")
+        return resource
+
+    def get_slack_client(self, token: str):
+        # slack_sdk's WebClient talks urllib rather than requests, so it can't share a pool -
+        # the best we can do is give it the same timeout and retry policy as everything else
+        from slack_sdk import WebClient
+        from slack_sdk.http_retry.builtin_handlers import (
+            ConnectionErrorRetryHandler,
+            RateLimitErrorRetryHandler,
+        )
+
+        return WebClient(
+            token=token,
+            timeout=int(self.timeout[1]),
+            retry_handlers=[
+                ConnectionErrorRetryHandler(max_retry_count=self.retries),
+                RateLimitErrorRetryHandler(max_retry_count=self.retries),
+            ],
+        )
+
+    def connection_stats(self) -> dict:
+        """Per session counts of requests made vs sockets opened
+
+        reused is the number of requests that went out over an already open connection. If
+        keep-alive is working it should climb every cycle while connections stays flat
+        """
+        stats = {}
+        for name, session in self._sessions.items():
+            requests_made = 0
+            connections = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    requests_made += pool.num_requests
+                    connections += pool.num_connections
+
+            stats[name] = {
+                "requests": requests_made,
+                "connections": connections,
+                "reused": requests_made - connections,
+            }
+
+        return stats
+
+    def close_all(self):
+        for name, session in self._sessions.items():
+            session.close()
+        self._sessions = {}
+
+
+_factory = None
+
+
+def get_factory() -> SessionFactory:
+    global _factory
+    if _factory is None:
+        _factory = SessionFactory()
+    return _factory
+
+
+def set_factory(factory: SessionFactory):
+    global _factory
+    _factory = factory
+
+
+def get_session(name: str, headers: dict = None) -> requests.Session:
+    return get_factory().get_session(name=name, headers=headers)
+
+
+def get_boto3_client(service: str):
+    return get_factory().get_boto3_client(service)
+
+
+def get_boto3_resource(service: str):
+    return get_factory().get_boto3_resource(service)
+
+
+def connection_stats() -> dict:
+    return get_factory().connection_stats()
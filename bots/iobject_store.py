@@ -0,0 +1,16 @@
+from abc import ABC, abstractmethod
+
+
+class IObjectStore(ABC):
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        # None if there's nothing at key
+        ...
+
+    @abstractmethod
+    def put(self, key: str, body: bytes):
+        ...
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
@@ -1,4 +1,5 @@
 from abc import ABC, abstractmethod
+from operator import attrgetter
 from pandas import DataFrame
 import datetime
 
@@ -32,6 +33,7 @@ class Account:
 
 
 class Position:
+    __slots__ = ("symbol", "quantity")
     symbol: str
     quantity: float
 
@@ -50,7 +52,34 @@ class Asset:
         self.min_price_increment = min_price_increment
 
 
+# what telemetry keeps per order, in order - as_dict() and order_columns() both use it
+ORDER_RESULT_FIELDS = (
+    "symbol",
+    "order_id",
+    "order_type",
+    "order_type_text",
+    "play_id",
+    "status",
+    "status_summary",
+    "status_text",
+    "ordered_unit_quantity",
+    "ordered_unit_price",
+    "ordered_total_value",
+    "filled_unit_quantity",
+    "filled_unit_price",
+    "filled_total_value",
+    "fees",
+    "success",
+    "create_time",
+    "update_time",
+)
+
+
 class IOrderResult(ABC):
+    # slotted - a back test holds on to every order it makes, so a __dict__ each adds up. every
+    # broker's OrderResult needs __slots__ = () too, or it gets a __dict__ back
+    __slots__ = ORDER_RESULT_FIELDS + ("closed", "_raw_response")
+
     _raw_response:dict
     order_type:int
     order_type_text:str
@@ -70,7 +99,12 @@ class IOrderResult(ABC):
     create_time:datetime
     update_time:datetime
     closed:bool
-        
+    play_id:str
+
+    # the broker's response is only needed to build the result, so it's let go of once the result
+    # validates. flip this on when debugging a broker
+    keep_raw_response = False
+
     @abstractmethod
     def __init__(self, response: dict, orders_create_object):
         ...
@@ -100,29 +134,29 @@ class IOrderResult(ABC):
         for attribute in required_attributes:
             if not hasattr(self, attribute):
                 raise MalformedOrderResult(f"OrderResult is missing {attribute}")
+
+        if not self.keep_raw_response:
+            self._raw_response = None
+
+        # set by BotTelemetry.add_order, but as_dict() shouldn't blow up before then
+        if not hasattr(self, "play_id"):
+            self.play_id = None
         return True
 
     def as_dict(self):
-        return {
-            "symbol": self.symbol,
-            "order_id": self.order_id,
-            "order_type": self.order_type,
-            "order_type_text": self.order_type_text,
-            "play_id": self.play_id,
-            "status": self.status,
-            "status_summary": self.status_summary,
-            "status_text": self.status_text,
-            "ordered_unit_quantity": self.ordered_unit_quantity,
-            "ordered_unit_price": self.ordered_unit_price,
-            "ordered_total_value": self.ordered_total_value,
-            "filled_unit_quantity": self.filled_unit_quantity,
-            "filled_unit_price": self.filled_unit_price,
-            "filled_total_value": self.filled_total_value,
-            "fees": self.fees,
-            "success": self.success,
-            "create_time": self.create_time,
-            "update_time": self.update_time,
-        }
+        return {field: getattr(self, field) for field in ORDER_RESULT_FIELDS}
+
+
+_get_order_fields = attrgetter(*ORDER_RESULT_FIELDS)
+
+
+def order_columns(orders: list) -> dict:
+    """{field: [value for each order]} for a list of order results - the cheap way to get a lot of
+    them into a DataFrame, rather than building a dict per order"""
+    rows = [_get_order_fields(order) for order in orders]
+    if len(rows) == 0:
+        return {field: [] for field in ORDER_RESULT_FIELDS}
+    return dict(zip(ORDER_RESULT_FIELDS, map(list, zip(*rows))))
 
 
 # interface for api
@@ -135,6 +169,10 @@ class ITradeAPI(ABC):
     def get_broker_name(self) -> str:
         ...
 
+    def get_session_name(self) -> str:
+        # the http_sessions session this api sends through
+        return self.get_broker_name()
+
     @abstractmethod
     def get_account(self) -> Account:
         ...
@@ -195,5 +233,12 @@ class ITradeAPI(ABC):
     def get_asset(self, symbol: str) -> Asset:
         ...
 
+    def get_assets(self, symbols: list) -> dict:
+        # bulk version of get_asset, keyed by symbol. brokers with a cached asset list override this
+        assets = {}
+        for symbol in symbols:
+            assets[symbol] = self.get_asset(symbol=symbol)
+        return assets
+
     @abstractmethod
     def validate_symbol(self, symbol:str)->bool:...
\ No newline at end of file
@@ -0,0 +1,230 @@
+# external packages
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+import queue
+import threading
+
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
+
+
+class RoutingHandler(logging.Handler):
+    """Runs on the listener thread and hands each record to the handlers registered for its logger
+
+    This is what lets every module keep its own log file even though they all share one queue
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._routes = {}
+        self._routes_lock = threading.Lock()
+
+    def add_route(self, logger_name: str, handler: logging.Handler):
+        # copy on write so emit never sees a dict that's changing under it
+        with self._routes_lock:
+            routes = dict(self._routes)
+            routes[logger_name] = routes.get(logger_name, []) + [handler]
+            self._routes = routes
+
+    def remove_routes(self, logger_name: str) -> list:
+        with self._routes_lock:
+            routes = dict(self._routes)
+            removed = routes.pop(logger_name, [])
+            self._routes = routes
+        return removed
+
+    def emit(self, record):
+        if getattr(record, "release_logger", False):
+            self._release(record.name)
+            return
+
+        # this is the only listener thread - one broken handler mustn't take down every module's
+        # logging with it
+        for handler in self._routes.get(record.name, []):
+            if record.levelno >= handler.level:
+                try:
+                    handler.handle(record)
+                except Exception:
+                    handler.handleError(record)
+
+    def _release(self, logger_name: str):
+        # handlers log_setup made for this logger get closed. shared ones (the console, the play
+        # log writer) stay open, but get told the logger is done if they have an end_play hook
+        owned = _owned_handlers.pop(logger_name, [])
+        for handler in self.remove_routes(logger_name):
+            if handler in owned:
+                handler.close()
+            elif callable(getattr(handler, "end_play", None)):
+                handler.end_play(logger_name)
+
+
+_queue = queue.SimpleQueue()
+_queue_handler = QueueHandler(_queue)
+_router = RoutingHandler()
+_listener = None
+_listener_lock = threading.Lock()
+_console = None
+
+_loggers = {}
+# handlers log_setup created (and so closes) for each logger
+_owned_handlers = {}
+# level each module asked for, and any overrides from configure()
+_module_levels = {}
+_level_overrides = {}
+_default_level = None
+_back_testing = False
+
+
+def _get_console() -> logging.Handler:
+    global _console
+    if _console is None:
+        _console = logging.StreamHandler()
+        _console.setFormatter(logging.Formatter(LOG_FORMAT))
+    return _console
+
+
+def start():
+    """Starts the background thread that does the actual writing. get_logger calls this for you"""
+    global _listener
+    with _listener_lock:
+        if _listener is None:
+            _listener = QueueListener(_queue, _router)
+            _listener.start()
+
+
+def stop():
+    """Writes out anything still queued and stops the listener thread"""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+# make sure whatever is still on the queue gets written when the process exits
+atexit.register(stop)
+
+
+def flush():
+    # stopping the listener drains the queue, and the next log call starts it again
+    stop()
+    start()
+
+
+def _level_for(name: str) -> int:
+    if name in _level_overrides:
+        return _level_overrides[name]
+
+    if _default_level is not None:
+        level = _default_level
+    else:
+        level = _module_levels.get(name, logging.DEBUG)
+
+    if _back_testing:
+        # back tests only care about INFO and up - anything below is dropped by the logger
+        # before a record is even made
+        level = max(level, logging.INFO)
+    return level
+
+
+def get_logger(
+    name: str,
+    level: int = logging.DEBUG,
+    log_file: str = None,
+    console: bool = True,
+    handlers: list = None,
+    log_format: str = LOG_FORMAT,
+) -> logging.Logger:
+    """Returns a logger whose records go on the shared queue instead of being written in line
+
+    By default records end up on the console and in {name}.log, same as the old per-module set
+    up. Set log_file=False and/or console=False to turn those off, and pass handlers to add
+    others (eg. CloudWatch) - all of them run on the listener thread
+    """
+    logger = logging.getLogger(name)
+    _module_levels[name] = level
+
+    if name not in _loggers:
+        logger.addHandler(_queue_handler)
+
+        if console:
+            _router.add_route(name, _get_console())
+
+        if log_file is None:
+            log_file = f"{name}.log"
+
+        if log_file:
+            # delay means the file isn't created until something is written to it
+            file_handler = logging.FileHandler(log_file, delay=True)
+            file_handler.setFormatter(logging.Formatter(log_format))
+            _router.add_route(name, file_handler)
+            _owned_handlers[name] = [file_handler]
+
+        _loggers[name] = logger
+
+    for handler in handlers or []:
+        _router.add_route(name, handler)
+
+    logger.setLevel(_level_for(name))
+    start()
+    return logger
+
+
+def release_logger(name: str):
+    """Detaches a logger from the queue and closes its handlers, eg. when a play finishes
+
+    The handlers are closed on the listener thread once everything the logger queued ahead of
+    this has been written. The logger itself is dropped from logging's registry too, otherwise
+    one per play would pile up over weeks of uptime
+    """
+    logger = _loggers.pop(name, None)
+    if logger is None:
+        return
+
+    logger.removeHandler(_queue_handler)
+    _module_levels.pop(name, None)
+
+    release_record = logging.makeLogRecord({"name": name, "release_logger": True})
+    _queue.put(release_record)
+    start()
+
+    logging.Logger.manager.loggerDict.pop(name, None)
+
+
+def configure(levels: dict = None, default_level: int = None, back_testing: bool = None):
+    """Sets log levels for existing and future loggers
+
+    levels is a dict of logger name to level, eg. {"backtest_api": logging.WARNING}. default_level
+    applies to every logger not named in levels. back_testing drops everything below INFO unless
+    levels says otherwise
+    """
+    global _back_testing, _default_level
+
+    if back_testing is not None:
+        _back_testing = back_testing
+
+    if default_level is not None:
+        _default_level = default_level
+
+    if levels:
+        _level_overrides.update(levels)
+
+    for name, logger in _loggers.items():
+        logger.setLevel(_level_for(name))
+
+
+def parse_levels(levels: str) -> dict:
+    """Turns "macd_worker=INFO,utils=WARNING" into a dict for configure()"""
+    parsed = {}
+    if not levels:
+        return parsed
+
+    for pair in levels.split(","):
+        name, level = pair.split("=")
+        level = level.strip().upper()
+        if level.isdigit():
+            parsed[name.strip()] = int(level)
+        else:
+            parsed[name.strip()] = logging.getLevelName(level)
+
+    return parsed
@@ -1,12 +1,14 @@
 # external packages
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import logging
 import time
 
 # my modules
-from broker_alpaca import AlpacaAPI
-from broker_swyftx import SwyftxAPI
-from broker_back_test import BackTestAPI
+import bar_dtypes
+import log_setup
+import profiling
+import broker_registry
 from macd_config import MacdConfig
 from macd_worker import (
     MacdWorker,
@@ -17,23 +19,21 @@ from macd_worker import (
     TAKING_PROFIT,
     STOP_LOSS_ACTIVE,
 )
+from itradeapi import UnknownSymbolError
 from tabot_rules import TABotRules
 import utils
 from parameter_stores import BackTestStore
+import rate_limiter
+import scheduler
+from scheduler import CycleTimer
 
-log_wp = logging.getLogger("macd")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("macd.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("macd")
 
 
 class MacdBot:
+    # the class used for each symbol - benchmarks swap in one that serves synthetic bars
+    worker_class = MacdWorker
+
     def __init__(self, symbols: list, config: MacdConfig, run_id: str):
         self.config = config
         self.store = config.store
@@ -44,9 +44,10 @@ class MacdBot:
         self.bot_telemetry = config.bot_telemetry
         self.notification_service = config.notification_service
         self.run_id = run_id
+        self._executor = None
         # self.rules = TABotRules(store=self.config.store, rules_path=self.config.path_rules, state_path=self.config.path_state)
         self.rules = TABotRules(
-            store=BackTestStore(),
+            store=profiling.wrap(BackTestStore(), "store"),
             rules_path=self.config.path_rules,
             state_path=self.config.path_state,
         )
@@ -67,16 +68,20 @@ class MacdBot:
         self.api_list = list(set(self.api_list))
         self.api_dict = self.setup_brokers()
 
+        # one bulk asset lookup per broker, rather than each worker asking for its own
+        assets = self.get_assets(symbols)
+
         # set up individual symbols
         self.symbols = {}
         for s in symbols:
             start_time = time.time()
-            new_symbol = MacdWorker(
+            new_symbol = self.worker_class(
                 symbol=s["symbol"],
                 api=self.api_dict[s["api"]],
                 rules=self.rules,
                 config=config,
                 run_id=self.run_id,
+                asset=assets[s["api"]].get(s["symbol"]),
             )
             key = s["api"] + s["symbol"]
             if new_symbol._init_complete:
@@ -87,43 +92,62 @@ class MacdBot:
             else:
                 log_wp.error(f'{s["symbol"]}: Failed to set up this symbol. Skipping')
 
+        if config.compact_bars:
+            report = self.bars_memory_report()
+            log_wp.debug(f"Bar memory by symbol:\n{report}")
+            log_wp.info(
+                f"Bars for {len(report)} symbols are using "
+                f"{report.bytes.sum() / 1024 / 1024:,.1f}MB ({report.bytes_per_bar.mean():,.0f} "
+                f"bytes per bar)"
+            )
+
+    def bars_memory_report(self):
+        return bar_dtypes.memory_report({k: worker.bars for k, worker in self.symbols.items()})
+
     def setup_brokers(self):
-        # use a set to drop any duplicates
-        api_set = set(self.api_list)
-        api_dict = {}
+        # only brokers the symbols actually use get built, all at once - see broker_registry for
+        # how adapters plug in
+        api_dict, self.broker_setup_times = broker_registry.build(
+            names=sorted(set(self.api_list)), config=self.config
+        )
+        for api, seconds in self.broker_setup_times.items():
+            log_wp.debug(f"Set up {api} in {round(seconds,1)}s")
 
-        for api in api_set:
-            start_time = time.time()
-            if api == "back_test":
-                api_dict[api] = BackTestAPI(
-                    back_testing=self.config.back_testing,
-                    back_testing_balance=self.config.back_testing_balance,
-                )
-                break
-
-            elif api == "swyftx":
-                api_dict[api] = SwyftxAPI(
-                    access_token=self.config.swyftx_access_token,
-                    back_testing=self.config.back_testing,
-                    back_testing_balance=self.back_testing_balance,
-                    real_money_trading=self.real_money_trading,
-                )
+        return api_dict
 
-            elif api == "alpaca":
-                api_dict[api] = AlpacaAPI(
-                    alpaca_key_id=self.config.alpaca_api_key,
-                    alpaca_secret_key=self.config.alpaca_security_key,
-                    back_testing=self.config.back_testing,
-                    back_testing_balance=self.back_testing_balance,
-                    real_money_trading=self.real_money_trading,
-                )
+    def get_assets(self, symbols: list) -> dict:
+        # group the symbols by broker so each broker gets a single get_assets call
+        symbols_by_broker = {}
+        for s in symbols:
+            symbols_by_broker.setdefault(s["api"], []).append(s["symbol"])
 
-            else:
-                raise ValueError(f"Unknown broker specified {api}")
+        assets = {}
+        for broker, broker_symbols in symbols_by_broker.items():
+            api = self.api_dict[broker]
+            valid_symbols = []
+            for symbol in broker_symbols:
+                # invalid symbols get reported (and skipped) when their worker is set up
+                try:
+                    if api.validate_symbol(symbol):
+                        valid_symbols.append(symbol)
+                except UnknownSymbolError:
+                    ...
+
+            start_time = time.time()
+            assets[broker] = api.get_assets(valid_symbols)
+            log_wp.log(
+                9,
+                f"Got {len(valid_symbols)} assets from {broker} in {round(time.time() - start_time,1)}s",
+            )
 
-            log_wp.debug(f"Set up {api} in {round(time.time() - start_time,1)}s")
+        return assets
 
-        return api_dict
+    def get_rate_limit_metrics(self) -> dict:
+        metrics = {}
+        for broker, api in self.api_dict.items():
+            if isinstance(api, rate_limiter.RateLimitedAPI):
+                metrics[broker] = api.governor.metrics()
+        return metrics
 
     def get_date_range(self):
         start_date = None
@@ -134,31 +158,36 @@ class MacdBot:
             return None, None
 
         for s in self.symbols:
+            # the whole archive's range when paging through one, not just what's loaded
+            first_bar, last_bar = self.symbols[s].get_bars_range()
+
             # if this is the first symbol we're assessing
             if not start_date:
-                start_date = self.symbols[s].bars.index.min()
-                end_date = self.symbols[s].bars.index.max()
+                start_date = first_bar
+                end_date = last_bar
                 latest_start = start_date
                 latest_symbol = s
             else:
-                if start_date > self.symbols[s].bars.index.min():
-                    start_date = self.symbols[s].bars.index.min()
+                if start_date > first_bar:
+                    start_date = first_bar
 
-                if end_date < self.symbols[s].bars.index.max():
-                    end_date = self.symbols[s].bars.index.max()
+                if end_date < last_bar:
+                    end_date = last_bar
 
             # used when back testing to make sure we don't try sampling index -200
             # we're looking to see which symbol starts the LATEST
             # if latest_start > self.symbols[s].bars.index.min():
-            if self.symbols[s].bars.index.min() > latest_start:
-                latest_start = self.symbols[s].bars.index.min()
+            if first_bar > latest_start:
+                latest_start = first_bar
                 latest_symbol = s
 
         if self.config.back_testing:
-            latest_start_position = self.symbols[latest_symbol].bars.index.get_loc(latest_start)
-            back_test_start_position = latest_start_position + 250
-
-            start_date = self.symbols[latest_symbol].bars.index[back_test_start_position]
+            start_date = self.symbols[latest_symbol].get_bar_after(latest_start, bars=250)
+            # only part of the bars - --bars_start/--bars_end, or a walk_forward window
+            if self.config.bars_start is not None:
+                start_date = max(start_date, self.config.bars_start)
+            if self.config.bars_end is not None:
+                end_date = min(end_date, self.config.bars_end)
 
         log_wp.log(
             9,
@@ -167,11 +196,21 @@ class MacdBot:
         )
         return start_date, end_date
 
-    def process_bars(self):
+    def process_bars(self, cycle: CycleTimer = None):
+        # cycle collects how long each phase takes - the live loop passes one in from the scheduler
+        if cycle is None:
+            cycle = CycleTimer()
+
         # update the data
-        for s in self.symbols:
-            log_wp.log(9, f"{s}: Updating bar data")
-            self.symbols[s].update_bars()
+        new_bars = {}
+        with cycle.phase(scheduler.FETCH):
+            for s in self.symbols:
+                log_wp.log(9, f"{s}: Updating bar data")
+                new_bars[s] = self.symbols[s].fetch_new_bars()
+
+        with cycle.phase(scheduler.SIGNALS):
+            for s in self.symbols:
+                self.symbols[s].apply_new_bars(new_bars[s])
 
         # find the oldest and newest records we're working with
         data_start_date, data_end_date = self.get_date_range()
@@ -189,16 +228,126 @@ class MacdBot:
         self.bot_telemetry.next_cycle(timestamp=datetime.now())
 
         # iterate through the data until we reach the end
+        with cycle.phase(scheduler.STATE_MACHINE):
+            while current_record <= data_end_date:
+                window_end = self._load_archive_window(current_record, data_end_date)
+                while current_record <= window_end:
+                    # log_wp.debug(f"Started processing {current_record}")
+                    for s in self.symbols:
+                        this_symbol = self.symbols[s]
+                        if (
+                            this_symbol._analyse_date == None
+                            or this_symbol._analyse_date < data_end_date
+                        ):
+                            this_symbol.process(current_record)
+                        else:
+                            log_wp.log(9, f"{s}: No new data")
+                    current_record = current_record + self.interval_delta
+
+        with cycle.phase(scheduler.PERSISTENCE):
+            self.bot_telemetry.save_cycle()
+
+        # log_wp.debug(f"Finished processing all records")
+
+    def _load_archive_window(self, start, data_end_date):
+        # back tests from a bar_archive hold archive_chunk_bars of each symbol at a time. returns
+        # the end of the window that's loaded - which is everything if there's no archive
+        if not (self.config.back_testing and self.config.archive_path):
+            return data_end_date
+
+        end = min(start + self.interval_delta * (self.config.archive_chunk_bars - 1), data_end_date)
+        for worker in self.symbols.values():
+            worker.load_archive_window(start, end)
+        log_wp.log(9, f"Loaded archived bars from {start} to {end}")
+        return end
+
+    def new_bar_available(self) -> bool:
+        """Used by the scheduler to poll for the next bar
+
+        Only checks one symbol rather than all of them - whichever has the most recent data, so a
+        24/7 crypto symbol gets picked over an NYSE one that's shut for the night
+        """
+        if len(self.symbols) == 0:
+            return True
+
+        canary = max(self.symbols.values(), key=lambda worker: worker.bars.index[-1])
+        last_bar = canary.bars.index[-1]
+        canary.update_bars()
+        return canary.bars.index[-1] > last_bar
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # none of the broker SDKs have an async client, so their blocking calls run on this pool
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.config.max_concurrency, thread_name_prefix="macd_bot"
+            )
+        return self._executor
+
+    async def _run_in_executor(self, semaphore: asyncio.Semaphore, func, *args):
+        async with semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def _process_symbol_async(
+        self, s: str, semaphore: asyncio.Semaphore, start_record, data_end_date
+    ):
+        # each symbol still walks through its records (and its state machine) one at a time
+        this_symbol = self.symbols[s]
+        current_record = start_record
         while current_record <= data_end_date:
-            # log_wp.debug(f"Started processing {current_record}")
-            for s in self.symbols:
-                this_symbol = self.symbols[s]
-                if this_symbol._analyse_date == None or this_symbol._analyse_date < data_end_date:
-                    this_symbol.process(current_record)
-                else:
-                    log_wp.log(9, f"{s}: No new data")
+            if this_symbol._analyse_date == None or this_symbol._analyse_date < data_end_date:
+                await self._run_in_executor(semaphore, this_symbol.process, current_record)
+            else:
+                log_wp.log(9, f"{s}: No new data")
             current_record = current_record + self.interval_delta
 
-        self.bot_telemetry.save_cycle()
+    async def process_bars_async(self, cycle: CycleTimer = None):
+        """Same as process_bars, but bar updates and state machines for different symbols run
+        concurrently (at most config.max_concurrency at a time) so a cycle takes about as long as
+        the slowest symbol rather than the sum of all of them
 
-        # log_wp.debug(f"Finished processing all records")
+        Only meant for live runs - back tests need symbols processed in a fixed order so that the
+        BackTestAPI balance is spent the same way every time
+        """
+        if cycle is None:
+            cycle = CycleTimer()
+
+        semaphore = asyncio.Semaphore(self.config.max_concurrency)
+
+        # update the data
+        with cycle.phase(scheduler.FETCH):
+            fetched = await asyncio.gather(
+                *[
+                    self._run_in_executor(semaphore, self.symbols[s].fetch_new_bars)
+                    for s in self.symbols
+                ]
+            )
+
+        with cycle.phase(scheduler.SIGNALS):
+            await asyncio.gather(
+                *[
+                    self._run_in_executor(semaphore, self.symbols[s].apply_new_bars, new_bars)
+                    for s, new_bars in zip(self.symbols, fetched)
+                ]
+            )
+
+        # find the oldest and newest records we're working with
+        data_start_date, data_end_date = self.get_date_range()
+
+        if self.config.back_testing:
+            current_record = data_start_date
+        else:
+            current_record = data_end_date
+
+        self.bot_telemetry.next_cycle(timestamp=datetime.now())
+
+        with cycle.phase(scheduler.STATE_MACHINE):
+            await asyncio.gather(
+                *[
+                    self._process_symbol_async(s, semaphore, current_record, data_end_date)
+                    for s in self.symbols
+                ]
+            )
+
+        with cycle.phase(scheduler.PERSISTENCE):
+            self.bot_telemetry.save_cycle()
@@ -1,23 +1,19 @@
 # external packages
-import logging
-import yfinance as yf
+import pandas as pd
 
 # my modules
+import bar_history
+from bar_partitions import PartitionedBars
+import log_setup
 from bot_telemetry import BotTelemetry
 from parameter_stores import Ssm, BackTestStore
 from iparameter_store import IParameterStore
 import notification_services
+from object_stores import LocalObjectStore, S3ObjectStore
+import resample_bars
+import utils
 
-log_wp = logging.getLogger("macd_config")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("macd_config.log")
-log_wp.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(fhdlr)
-log_wp.addHandler(hdlr)
+log_wp = log_setup.get_logger("macd_config")
 
 
 class MacdConfig:
@@ -33,6 +29,8 @@ class MacdConfig:
     PATH_PAPER_SLACK_HEARTBEAT_CHANNEL = f"/{_PREFIX}/paper/slack/heartbeat_channel"
     PATH_PAPER_SWYFTX_ACCESS_TOKEN = f"/{_PREFIX}/paper/swyftx/access_token"
     PATH_PAPER_SWYFTX_API_KEY = f"/{_PREFIX}/paper/swyftx/api_key"
+    PATH_PAPER_BINANCE_API_KEY = f"/{_PREFIX}/paper/binance/api_key"
+    PATH_PAPER_BINANCE_SECRET_KEY = f"/{_PREFIX}/paper/binance/secret_key"
     PAPER_RULES = f"/{_PREFIX}/paper/rules/5m"
     PAPER_STATE = f"/{_PREFIX}/paper/state"
     PAPER_TELEMETRY_S3_BUCKET = "mfers-tabot"
@@ -45,6 +43,8 @@ class MacdConfig:
     PATH_PROD_SLACK_HEARTBEAT_CHANNEL = f"/{_PREFIX}/prod/slack/heartbeat_channel"
     PATH_PROD_SWYFTX_ACCESS_TOKEN = f"/{_PREFIX}/prod/swyftx/access_token"
     PATH_PROD_SWYFTX_API_KEY = f"/{_PREFIX}/prod/swyftx/api_key"
+    PATH_PROD_BINANCE_API_KEY = f"/{_PREFIX}/prod/binance/api_key"
+    PATH_PROD_BINANCE_SECRET_KEY = f"/{_PREFIX}/prod/binance/secret_key"
     PROD_RULES = f"/{_PREFIX}/prod/rules/5m"
     PROD_STATE = f"/{_PREFIX}/prod/state"
     PROD_TELEMETRY_S3_BUCKET = "mfers-tabot"
@@ -53,8 +53,12 @@ class MacdConfig:
     PATH_PUSHOVER_USER_KEY = f"/{_PREFIX}/pushover/user_key"
     PATH_SLACK_BOT_KEY = f"/{_PREFIX}/slack/bot_key"
     PATH_SLACK_SIGNING_TOKEN = f"/{_PREFIX}/slack/signing_token"
+    # used when a back test's parameters file doesn't set PATH_ORDER_SIZE
+    DEFAULT_BACK_TEST_ORDER_SIZE = 1000
 
     order_size: float
+    # BuyPlan's take profit, as a multiple of the stop loss distance
+    profit_target: float = 1.5
     saved_symbol_data_bucket: str
     saved_symbol_key_base: str
     path_alpaca_api_key: str
@@ -69,6 +73,8 @@ class MacdConfig:
     path_slack_signing_token: str
     path_swyftx_access_token: str
     path_swyftx_api_key: str
+    path_binance_api_key: str
+    path_binance_secret_key: str
     path_rules: str
     path_state: str
     telemetry_s3_prefix: str
@@ -86,13 +92,43 @@ class MacdConfig:
     path_notification_service: str = "slack"
     store: IParameterStore = None
     run_type: str
+    async_processing: bool = False
+    max_concurrency: int = 8
+    bars_path: str = None
+    telemetry_path: str = None
+    play_log_path: str = None
+    max_bars: int = None
+    compact_bars: bool = False
+    float32_bars: bool = False
+    archive_path: str = None
+    archive_chunk_bars: int = 10000
+    derive_intervals: bool = False
+    # bar_partitions.PartitionedBars, and the window a back test reads from them
+    bar_partitions = None
+    bars_start: pd.Timestamp = None
+    bars_end: pd.Timestamp = None
+    # {symbol: shared_bars.SharedBarsHandle}, set by whatever starts a pool of back tests
+    shared_bars: dict = None
 
     def __init__(self, args):
         self.interval = args.interval
         self.run_type = args.run_type
-        self.market_data_source = yf
+        self.market_data_source = utils.YahooMarketData()
+        # only fetch 1m bars and build the interval from them - see resample_bars
+        self.derive_intervals = args.derive_intervals
+        if self.derive_intervals:
+            self.market_data_source = resample_bars.ResampledMarketData(self.market_data_source)
         self.symbol_group = args.symbols
         self.buy_market = args.buy_market
+        if args.profit_target:
+            self.profit_target = float(args.profit_target)
+        self.async_processing = args.async_processing
+        self.max_concurrency = int(args.max_concurrency)
+        # how many bars each symbol keeps when running live
+        self.max_bars = int(args.max_bars) if args.max_bars else bar_history.DEFAULT_MAX_BARS
+        # smaller dtypes for bars - see bar_dtypes
+        self.float32_bars = args.float32_bars
+        self.compact_bars = args.compact_bars or args.float32_bars
         self.production_run = False
         self.paper_testing = False
         self.back_testing = False
@@ -114,6 +150,8 @@ class MacdConfig:
             self.path_slack_signing_token = self.PATH_SLACK_SIGNING_TOKEN
             self.path_swyftx_access_token = self.PATH_PROD_SWYFTX_ACCESS_TOKEN
             self.path_swyftx_api_key = self.PATH_PROD_SWYFTX_API_KEY
+            self.path_binance_api_key = self.PATH_PROD_BINANCE_API_KEY
+            self.path_binance_secret_key = self.PATH_PROD_BINANCE_SECRET_KEY
             self.path_rules = self.PROD_RULES
             self.path_state = self.PROD_STATE
             self.telemetry_s3_prefix = self.PROD_TELEMETRY_S3_PREFIX
@@ -136,6 +174,8 @@ class MacdConfig:
             self.path_slack_signing_token = self.PATH_SLACK_SIGNING_TOKEN
             self.path_swyftx_access_token = self.PATH_PAPER_SWYFTX_ACCESS_TOKEN
             self.path_swyftx_api_key = self.PATH_PAPER_SWYFTX_API_KEY
+            self.path_binance_api_key = self.PATH_PAPER_BINANCE_API_KEY
+            self.path_binance_secret_key = self.PATH_PAPER_BINANCE_SECRET_KEY
             self.path_rules = self.PAPER_RULES
             self.path_state = self.PAPER_STATE
             self.telemetry_s3_prefix = self.PROD_TELEMETRY_S3_PREFIX
@@ -157,6 +197,8 @@ class MacdConfig:
                 self.path_slack_heartbeat_channel,
                 self.path_swyftx_access_token,
                 self.path_swyftx_api_key,
+                self.path_binance_api_key,
+                self.path_binance_secret_key,
                 self.path_order_size,
             )
 
@@ -175,34 +217,75 @@ class MacdConfig:
             self.path_slack_signing_token = self.PATH_SLACK_SIGNING_TOKEN
             self.path_swyftx_access_token = self.PATH_PAPER_SWYFTX_ACCESS_TOKEN
             self.path_swyftx_api_key = self.PATH_PAPER_SWYFTX_API_KEY
+            self.path_binance_api_key = self.PATH_PAPER_BINANCE_API_KEY
+            self.path_binance_secret_key = self.PATH_PAPER_BINANCE_SECRET_KEY
             self.path_rules = self.PAPER_RULES
             self.path_state = self.PAPER_STATE
             self.telemetry_s3_prefix = self.PAPER_TELEMETRY_S3_PREFIX
             self.telemetry_s3_bucket = self.PAPER_TELEMETRY_S3_BUCKET
             self.back_testing = True
-            self.back_testing_balance = args.back_testing_balance
+            self.back_testing_balance = float(args.back_testing_balance)
             self.back_testing_override_broker = args.back_testing_override_broker
             self.back_testing_skip_bar_update = args.back_testing_skip_bar_update
 
+            # offline back tests don't touch SSM - anything they need (order size, or broker keys
+            # if --back_testing_override_broker isn't used) comes from an optional JSON file. a
+            # back test against a real broker without one still gets its keys from SSM
             self.store = BackTestStore()
-            self.store._bootstrap(
-                self.path_alpaca_api_key,
-                self.path_alpaca_security_key,
-                self.path_slack_bot_key,
-                self.path_slack_announcements_channel,
-                self.path_pushover_api_key,
-                self.path_pushover_user_key,
-                self.path_slack_signing_token,
-                self.path_slack_heartbeat_channel,
-                self.path_swyftx_access_token,
-                self.path_swyftx_api_key,
-            )
+            if args.parameters_file:
+                self.store.load_file(args.parameters_file)
+            elif not self.back_testing_override_broker:
+                self.store._bootstrap(
+                    self.path_alpaca_api_key,
+                    self.path_alpaca_security_key,
+                    self.path_slack_bot_key,
+                    self.path_slack_announcements_channel,
+                    self.path_pushover_api_key,
+                    self.path_pushover_user_key,
+                    self.path_slack_signing_token,
+                    self.path_slack_heartbeat_channel,
+                    self.path_swyftx_access_token,
+                    self.path_swyftx_api_key,
+                    self.path_order_size,
+                )
+
+            # bars from a local directory rather than S3/Yahoo, and results written next to them.
+            # with all three set a back test runs without any network access at all
+            self.bars_path = args.bars_path
+            self.telemetry_path = args.telemetry_path
+            self.play_log_path = args.play_log_path
+            if self.bars_path:
+                self.back_testing_skip_bar_update = True
+
+            # or page through a (much longer) bar_archive, archive_chunk_bars at a time
+            self.archive_path = args.archive_path
+            if args.archive_chunk_bars:
+                self.archive_chunk_bars = int(args.archive_chunk_bars)
+            if self.archive_path:
+                self.back_testing_skip_bar_update = True
+
+            # back tests walk through every bar they were given, so they keep the lot
+            self.max_bars = None
 
         else:
             raise ValueError(
                 f"Unknown run_type {args.run_type}. Must be either 'prod', 'paper', or 'back_test'"
             )
 
+        # saved bars split into daily partitions, so back tests only read the days they need
+        if args.partitioned_bars:
+            if self.bars_path:
+                store = LocalObjectStore(self.bars_path)
+            else:
+                store = S3ObjectStore(self.saved_symbol_data_bucket)
+            self.bar_partitions = PartitionedBars(
+                store, f"{self.SAVED_SYMBOL_KEY_BASE}partitioned/{self.interval}/"
+            )
+            if args.bars_start:
+                self.bars_start = pd.Timestamp(args.bars_start, tz="UTC")
+            if args.bars_end:
+                self.bars_end = pd.Timestamp(args.bars_end, tz="UTC")
+
         self.bot_telemetry = BotTelemetry(back_testing=self.back_testing)
 
         self.pushover_api_key = self.store.get(path=self.path_pushover_api_key)
@@ -214,10 +297,15 @@ class MacdConfig:
         self.swyftx_api_key = self.store.get(path=self.path_swyftx_api_key)
         self.alpaca_api_key = self.store.get(path=self.path_alpaca_api_key)
         self.alpaca_security_key = self.store.get(path=self.path_alpaca_security_key)
+        self.binance_api_key = self.store.get(path=self.path_binance_api_key)
+        self.binance_secret_key = self.store.get(path=self.path_binance_secret_key)
         self.slack_announcements_channel = self.store.get(
             path=self.path_slack_announcements_channel
         )
-        self.order_size = float(self.store.get(path=self.path_order_size))
+        order_size = self.store.get(path=self.path_order_size)
+        if self.back_testing and order_size == "[]":
+            order_size = self.DEFAULT_BACK_TEST_ORDER_SIZE
+        self.order_size = float(order_size)
 
         if self.back_testing:
             self.notification_service = notification_services.LocalEcho()
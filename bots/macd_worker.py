@@ -6,9 +6,15 @@ from math import floor
 import pandas as pd
 import pytz
 from typing import Callable
-from cloudwatch import cloudwatch
 
 # my modules
+import bar_archive
+import bar_dtypes
+import log_setup
+import play_logs
+import shared_bars
+from bar_history import BarHistory
+import profiling
 from bot_telemetry import BotTelemetry
 from buyplan import (
     BuyPlan,
@@ -23,6 +29,7 @@ from inotification_service import INotificationService
 from iparameter_store import IParameterStore
 from itradeapi import (
     ITradeAPI,
+    Asset,
     MARKET_BUY,
     MARKET_SELL,
     LIMIT_BUY,
@@ -41,16 +48,7 @@ from macd_config import MacdConfig
 from tabot_rules import TABotRules
 import utils
 
-log_wp = logging.getLogger("macd_worker")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("macd_worker.log")
-log_wp.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(fhdlr)
-log_wp.addHandler(hdlr)
+log_wp = log_setup.get_logger("macd_worker")
 
 
 NO_POSITION_TAKEN = 0
@@ -70,6 +68,9 @@ STATE_MAP = {
 }
 STATE_MAP_INVERTED = {y: x for x, y in STATE_MAP.items()}
 
+# bars loaded before each archive window - sma_200 and the 200 bar data window, plus macd warm up
+ARCHIVE_LOOKBACK_BARS = 300
+
 
 class SymbolForbidden(Exception):
     ...
@@ -105,21 +106,30 @@ class MacdWorker:
     enter_position_timeout: relativedelta
     _analyse_date: pd.Timestamp
     _back_testing_date: pd.Timestamp
-    bars: pd.DataFrame
+    bar_history: BarHistory
     min_quantity_increment: float
     min_quantity: float
     min_price_increment: float
 
     def __init__(
-        self, symbol: str, api: ITradeAPI, config: MacdConfig, rules: TABotRules, run_id: str
+        self,
+        symbol: str,
+        api: ITradeAPI,
+        config: MacdConfig,
+        rules: TABotRules,
+        run_id: str,
+        asset: Asset = None,
     ):
         self.symbol = symbol
         self.run_id = run_id
-        self.api = api
+        self.bars = None
+        self.archive = None
+        # broker and store calls get timed when profiling is on
+        self.api = profiling.wrap(api, "broker")
         self.broker_name = self.api.get_broker_name()
         self.rules = rules
         self.config = config
-        self.store = config.store
+        self.store = profiling.wrap(config.store, "store")
         self.buy_market = config.buy_market
         self.notification_service = config.notification_service
         self.bot_telemetry = config.bot_telemetry
@@ -146,7 +156,7 @@ class MacdWorker:
 
         # next check precision on order - normal stocks are only to the thousandth, crypto is huge
         self.precision = self.api.get_precision(yf_symbol=self.symbol)
-        self._set_order_size_and_increment()
+        self._set_order_size_and_increment(asset)
 
         # work out if this symbol is only traded in certain hours
         self.market = self.get_market()
@@ -167,24 +177,106 @@ class MacdWorker:
         # this is hacky - if back_testing is True then this will be the same date as _analyse_date
         self._back_testing_date = None
 
-        bars = self._get_bars(
-            initialised=False,
-        )
+        shared = self._get_shared_bars()
+        if shared is not None:
+            bars = shared
+        elif self.back_testing and self.config.archive_path:
+            bars = self._get_archive_bars()
+        else:
+            bars = self._get_bars(
+                initialised=False,
+            )
 
         if len(bars) == 0:
             self.bars = []
             self.log(logging.ERROR, f"{symbol}: No YF data for this symbol")
             return
+        elif shared is not None and "macd_macd" in shared.columns:
+            # already has its signals, and it's read only so it's used as is
+            self.bars = shared
+            self._init_complete = True
         else:
-            self.bars = utils.add_signals(bars, self.interval)
+            # live runs only keep config.max_bars, back tests keep everything they were given
+            self.bar_history = BarHistory(
+                self._compact(utils.add_signals(bars, self.interval)), max_bars=self.config.max_bars
+            )
             self._init_complete = True
 
+    def _get_shared_bars(self):
+        # back tests running in a process pool share one copy of every symbol's bars - see
+        # shared_bars
+        if not self.back_testing or not self.config.shared_bars:
+            return None
+        handle = self.config.shared_bars.get(self.symbol)
+        if handle is None:
+            return None
+
+        self.api._put_bars(symbol=self.symbol, bars=handle)
+        return shared_bars.attach(handle)
+
+    def _get_archive_bars(self):
+        # deep back tests only hold a chunk of the archive at a time - MacdBot pages through it
+        # with load_archive_window, this is just the first chunk
+        self.archive = bar_archive.BarArchive(self.config.archive_path, self.interval)
+        index = self.archive.index(self.symbol)
+        if len(index) == 0:
+            return pd.DataFrame()
+
+        last_bar = index[min(self.config.archive_chunk_bars, len(index)) - 1]
+        bars = self.archive.read(self.symbol, end=pd.Timestamp(last_bar, tz="UTC"))
+        self.api._put_bars(symbol=self.symbol, bars=bars)
+        return bars
+
+    def load_archive_window(self, start: pd.Timestamp, end: pd.Timestamp):
+        """Swaps bars for start to end of the archive, plus enough before start for the signals
+        and the data window"""
+        bars = self.archive.read(self.symbol, start, end, lookback=ARCHIVE_LOOKBACK_BARS)
+        if "macd_macd" not in bars.columns:
+            bars = utils.add_signals(bars, self.interval)
+        self.bar_history = BarHistory(self._compact(bars))
+        self.api._put_bars(symbol=self.symbol, bars=self.bars)
+
+    def get_bars_range(self) -> tuple:
+        # first and last bar - of the whole archive when paging through one
+        if self.archive is not None:
+            return self.archive.date_range(self.symbol)
+        return self.bars.index.min(), self.bars.index.max()
+
+    def get_bar_after(self, timestamp: pd.Timestamp, bars: int) -> pd.Timestamp:
+        if self.archive is not None:
+            position = self.archive.position(self.symbol, timestamp) + bars
+            return pd.Timestamp(self.archive.index(self.symbol)[position], tz="UTC")
+        return self.bars.index[self.bars.index.get_loc(timestamp) + bars]
+
+    def _compact(self, bars: pd.DataFrame) -> pd.DataFrame:
+        if not self.config.compact_bars:
+            return bars
+        return bar_dtypes.compact(bars, float32=self.config.float32_bars)
+
+    @property
+    def bars(self) -> pd.DataFrame:
+        return self.bar_history.frame if self.bar_history is not None else self._bars
+
+    @bars.setter
+    def bars(self, bars):
+        self.bar_history = None
+        self._bars = bars
+
     def setup_play_log(self):
-        play_logger = logging.getLogger(self.play_id)
-        play_logger.addHandler(
-            cloudwatch.CloudwatchHandler(log_group="tabot", log_stream=self.play_id)
+        # every play shares the one batched writer, which gives each play its own stream
+        self.play_log = log_setup.get_logger(
+            self.play_id,
+            console=False,
+            log_file=False,
+            handlers=[play_logs.get_writer()],
         )
-        self.play_log = play_logger
+
+    def close_play_log(self):
+        # sends whatever is left for this play and lets go of its logger and stream
+        if self.play_log is not None:
+            log_setup.release_logger(self.play_id)
+        self.play_id = None
+        self.play_log = None
 
     def is_valid_symbol(self):
         # can't easily map alpaca and YFinance
@@ -215,12 +307,15 @@ class MacdWorker:
         # this is how you'd do the right way but it will take ages to boot even a small number of symbols
         self.market = self.market_data_source.Ticker("ACN").info["market"]
 
-    def _set_order_size_and_increment(self):
-        asset = self.api.get_asset(self.symbol)
+    def _set_order_size_and_increment(self, asset: Asset = None):
+        # MacdBot hands us the asset from its bulk lookup, only go to the broker if it didn't
+        if asset is None:
+            asset = self.api.get_asset(self.symbol)
         self.min_quantity_increment = asset.min_quantity_increment
         self.min_quantity = asset.min_quantity
         self.min_price_increment = asset.min_price_increment
 
+    @profiling.timed("process", symbol_from_self=True)
     def process(self, datestamp):
         # i'm too lazy to pass datestamp around so save it in object
         self._analyse_date = datestamp
@@ -237,14 +332,16 @@ class MacdWorker:
         # keep progressing through the state machine until we hit a stop
         while True:
             # run the current check - will return reference to a transition function if the check says we're ready for next state
-            next_transition = self.current_check()
+            with profiling.timer(self.current_check.__name__):
+                next_transition = self.current_check()
             # not ready for next state, break
             if next_transition == False:
                 break
 
             # do the next transition, which will set self.current_check to whatever the next state check is, ready for next loop
-            if next_transition():
-                ...
+            with profiling.timer(next_transition.__name__):
+                if next_transition():
+                    ...
 
             # a loop can happen while backtesting where:
             # we do a buy order
@@ -323,16 +420,34 @@ class MacdWorker:
         return self.rules.remove_from_state(symbol=self.symbol, broker=self.broker_name)
 
     # START BAR FUNCTIONS
+    def _load_saved_bars(self, path: str = None) -> pd.DataFrame:
+        partitions = self.config.bar_partitions
+        if partitions is None:
+            return utils.load_bars(
+                self.symbol,
+                bucket=self.config.saved_symbol_data_bucket,
+                key_base=self.config.saved_symbol_key_base,
+                path=path,
+                compact=self.config.compact_bars,
+                float32=self.config.float32_bars,
+            )
+
+        # only the partitions that are needed - the back test's window, or what a live run keeps
+        if self.back_testing:
+            return partitions.read(
+                self.symbol,
+                start=self.config.bars_start,
+                end=self.config.bars_end,
+                lookback=ARCHIVE_LOOKBACK_BARS,
+            )
+        return partitions.tail(self.symbol, rows=self.config.max_bars)
+
     def _get_bars(self, from_date=None, to_date=None, initialised: bool = True):
         saved_data = False
         yf_end = None
 
         if self.back_testing and self.config.back_testing_skip_bar_update:
-            saved_bars = utils.load_bars(
-                self.symbol,
-                bucket=self.config.saved_symbol_data_bucket,
-                key_base=self.config.saved_symbol_key_base,
-            )
+            saved_bars = self._load_saved_bars(path=self.config.bars_path)
             # this means we got data from s3
             if type(saved_bars) == pd.core.frame.DataFrame:
                 yf_start = saved_bars.index[-1]
@@ -350,11 +465,7 @@ class MacdWorker:
                 # we actually need to grab everything
                 # first check to see if we have any data in s3
                 # if i wasn't lazy i'd make a
-                saved_bars = utils.load_bars(
-                    self.symbol,
-                    bucket=self.config.saved_symbol_data_bucket,
-                    key_base=self.config.saved_symbol_key_base,
-                )
+                saved_bars = self._load_saved_bars()
 
                 # this means we got data from s3
                 if type(saved_bars) == pd.core.frame.DataFrame:
@@ -419,7 +530,13 @@ class MacdWorker:
 
         return bars
 
-    def update_bars(self, from_date=None, to_date=None):
+    @profiling.timed(symbol_from_self=True)
+    def fetch_new_bars(self, from_date=None, to_date=None):
+        if self.bar_history is None or self.archive is not None:
+            # shared bars are everything the back test is going to get, and archived bars come
+            # from load_archive_window
+            return self.bars.iloc[:0]
+
         if from_date == None:
             from_date = self.bars.index[-1]
 
@@ -428,20 +545,46 @@ class MacdWorker:
             to_date=to_date,
         )
 
-        if len(new_bars) > 0:
-            # pad new bars to 200 rows so that macd and sma200 work
-            # TODO merge these bars in before running add_signals - this way we're doing signals for only a couple rows instead of 200
-            if len(new_bars) < 300:
-                new_bars = utils.merge_bars(new_bars=new_bars, bars=self.bars.iloc[-300:])
+        if len(new_bars) == 0:
+            self.log(9, f"{self.symbol}: No new data since {from_date}")
+
+        return new_bars
 
-            new_bars = utils.add_signals(new_bars, interval=self.interval)
-            self.bars = utils.merge_bars(self.bars, new_bars)
+    @profiling.timed(symbol_from_self=True)
+    def apply_new_bars(self, new_bars):
+        if len(new_bars) == 0:
+            return
 
-            if self.back_testing:
-                self.api._put_bars(symbol=self.symbol, bars=self.bars)
+        # the fetch overlaps what we've already got, so only signal the bars that are actually new
+        last_index = self.bar_history.last_index
+        newer_bars = new_bars.loc[new_bars.index > last_index]
+        late_bars = new_bars.loc[new_bars.index <= last_index]
+        late_bars = late_bars.loc[~late_bars.index.isin(self.bars.index)]
+
+        if len(late_bars) > 0:
+            # yahoo filled in a gap - merge everything in and let add_signals find the NaNs
+            self.bar_history.append(pd.concat([late_bars, newer_bars]))
+            self.bar_history = BarHistory(
+                self._compact(utils.add_signals(self.bars, interval=self.interval)),
+                max_bars=self.config.max_bars,
+            )
 
-        else:
-            self.log(9, f"{self.symbol}: No new data since {from_date}")
+        elif len(newer_bars) > 0:
+            # pad new bars to 300 rows so that macd and sma200 work
+            new_count = len(newer_bars)
+            if new_count < 300:
+                newer_bars = pd.concat([self.bars.iloc[-300:], newer_bars])
+
+            newer_bars = utils.add_signals(newer_bars, interval=self.interval)
+            self.bar_history.append(self._compact(newer_bars.iloc[-new_count:]))
+
+        if self.back_testing:
+            self.api._put_bars(symbol=self.symbol, bars=self.bars)
+
+    @profiling.timed(symbol_from_self=True)
+    def update_bars(self, from_date=None, to_date=None):
+        # fetching and adding signals are split up so the live loop can time them separately
+        self.apply_new_bars(self.fetch_new_bars(from_date=from_date, to_date=to_date))
 
     # END  BAR FUNCTIONS
 
@@ -471,7 +614,6 @@ class MacdWorker:
             account = self.api.get_account()
             balance = account.assets["USD"]
             play_id = "play-" + self.symbol + utils.generate_id()
-            self.setup_play_log()
 
             # MACD stuff
             blue_cycle_start = self.get_blue_cycle_start(df=bars_slice)
@@ -518,6 +660,7 @@ class MacdWorker:
                     min_quantity=self.min_quantity,
                     min_price_increment=self.min_price_increment,
                     max_play_value=self.config.order_size,
+                    profit_target=self.config.profit_target,
                 )
 
             except (
@@ -592,15 +735,18 @@ class MacdWorker:
                     " action is trans_buy_order_timed_out",
                 )
                 return self.trans_buy_order_timed_out
-            self.log(9, f"{self.symbol}: Order {order.order_id}: is still open or pending")
+            if self.log_enabled(9):
+                self.log(9, f"{self.symbol}: Order {order.order_id}: is still open or pending")
 
-        # do nothing - still open, not timedout
-        self.log(
-            logging.DEBUG,
-            f"{self.symbol}: Order {order.order_id} is still open but not filled. Last "
-            f"High was {self.bars.High.loc[self._analyse_date]:,} last Low was "
-            f"{self.bars.Low.loc[self._analyse_date]:,}, limit price is {order.ordered_unit_price:,}",
-        )
+        # do nothing - still open, not timedout. this runs every bar while we wait for a fill, so
+        # don't bother building the message if nobody is going to see it
+        if self.log_enabled(logging.DEBUG):
+            self.log(
+                logging.DEBUG,
+                f"{self.symbol}: Order {order.order_id} is still open but not filled. Last "
+                f"High was {self.bars.High.loc[self._analyse_date]:,} last Low was "
+                f"{self.bars.Low.loc[self._analyse_date]:,}, limit price is {order.ordered_unit_price:,}",
+            )
         return False
 
     def check_state_position_taken(self):
@@ -806,10 +952,11 @@ class MacdWorker:
                 return self.trans_externally_liquidated
 
             # nothing to do
-            self.log(
-                logging.DEBUG,
-                f"{self.symbol} {self._analyse_date}: Stop loss order still open, no next action",
-            )
+            if self.log_enabled(logging.DEBUG):
+                self.log(
+                    logging.DEBUG,
+                    f"{self.symbol} {self._analyse_date}: Stop loss order still open, no next action",
+                )
             return False
 
     # END  CHECK_STATE FUNCTIONS
@@ -819,6 +966,7 @@ class MacdWorker:
         # submit buy order
         self.log(9, f"{self.symbol}: Started trans_entering_position")
         self.play_id = self.buy_plan.play_id
+        self.setup_play_log()
 
         # there is a toggle to do market buy or limit buy
         if self.buy_market:
@@ -902,8 +1050,7 @@ class MacdWorker:
         # clear any variables set at symbol
         self.active_order_id = None
         self.buy_plan = None
-        self.play_id = None
-        self.play_log = None
+        self.close_play_log()
 
         # clear state
         self.remove_from_state()
@@ -937,8 +1084,7 @@ class MacdWorker:
         # clear any variables set at symbol
         self.active_order_id = None
         self.buy_plan = None
-        self.play_id = None
-        self.play_log = None
+        self.close_play_log()
 
         # clear state
         self.remove_from_state()
@@ -1102,14 +1248,20 @@ class MacdWorker:
             )
             self.bot_telemetry.add_order(order_result=order, play_id=self.play_id)
 
-        # already don't hold any, so no need to delete orders
-        # just need to clean up the object and delete rules
+            # a take profit sell can still be sitting there with nothing left to sell - if it
+            # stays open the broker won't take our next buy for this symbol
+            if order and (order.status_summary == "open" or order.status_summary == "pending"):
+                self.api.cancel_order(
+                    order_id=self.active_order_id, back_testing_date=self._analyse_date
+                )
+
+        # already don't hold any units, so the only thing left to do is
+        # clean up the object and delete rules
         self.remove_from_rules()
         self.active_order_id = None
         self.active_order_result = None
         self.buy_plan = None
-        self.play_id = None
-        self.play_log = None
+        self.close_play_log()
 
         # TODO add to win/loss as unknown outcome
 
@@ -1127,8 +1279,7 @@ class MacdWorker:
         self.active_order_id = None
         self.active_order_result = None
         self.buy_plan = None
-        self.play_id = None
-        self.play_log = None
+        self.close_play_log()
 
         # delete rules
         self.remove_from_rules()
@@ -1314,3 +1465,9 @@ class MacdWorker:
             self.play_log.log(level, message)
         else:
             log_wp.log(level, message)
+
+    def log_enabled(self, level) -> bool:
+        # lets hot paths skip building an f-string that's only going to be thrown away
+        if self.play_id:
+            return self.play_log.isEnabledFor(level)
+        return log_wp.isEnabledFor(level)
@@ -0,0 +1,145 @@
+# external packages
+import argparse
+import numpy as np
+import pandas as pd
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("monte_carlo")
+
+# how much of a back test's result is down to the order its plays happened to come in. the plays'
+# profits get resampled into tens of thousands of alternative histories, and each one's final
+# profit, worst drawdown and longest losing streak are collected into distributions
+#
+#   bootstrap    plays drawn with replacement - some plays twice, some not at all, so the final
+#                profit moves as well
+#   permutation  the same plays shuffled - the final profit can't change, but the drawdowns and
+#                streaks you'd have had to sit through do
+#
+# every history is a row of a (simulations, plays) matrix, so it's all numpy - chunks of rows at a
+# time so 100k simulations of a long back test don't need gigabytes
+#
+#   result = monte_carlo.simulate(bot_telemetry.plays_df, simulations=100000)
+#   result.summary()
+#
+#   python monte_carlo.py --plays_path ./telemetry/{run_id}_plays.csv --simulations 100000
+
+METHODS = ["bootstrap", "permutation"]
+DEFAULT_SIMULATIONS = 100000
+PERCENTILES = [5, 25, 50, 75, 95]
+# matrix cells worked on at once, ~32MB of float64
+CHUNK_CELLS = 4000000
+
+
+class MonteCarloResult:
+    """Per simulation final_pnl, max_drawdown, max_drawdown_pct and losing_streak, plus the same
+    for the plays in the order they really happened"""
+
+    def __init__(self, method: str, balance: float, metrics: dict, observed: dict):
+        self.method = method
+        self.balance = balance
+        self.metrics = metrics
+        self.observed = observed
+
+    @property
+    def simulations(self) -> int:
+        return len(self.metrics["final_pnl"])
+
+    def probability_of_loss(self) -> float:
+        return float((self.metrics["final_pnl"] < 0).mean())
+
+    def summary(self, percentiles: list = PERCENTILES) -> pd.DataFrame:
+        rows = {}
+        for name, values in self.metrics.items():
+            row = {"observed": self.observed[name], "mean": values.mean()}
+            for percentile, value in zip(percentiles, np.percentile(values, percentiles)):
+                row[f"p{percentile}"] = value
+            rows[name] = row
+        return pd.DataFrame.from_dict(rows, orient="index")
+
+
+def play_profits(plays: pd.DataFrame) -> np.ndarray:
+    """Profit of each finished play, in the order they finished"""
+    plays = plays.loc[plays.profit.notna()]
+    if "end" in plays.columns:
+        plays = plays.sort_values("end", kind="stable")
+    return plays.profit.to_numpy(dtype=np.float64)
+
+
+def path_metrics(profits: np.ndarray, balance: float) -> dict:
+    """Final profit, worst drawdown (in money and as a fraction of the peak) and longest run of
+    losing plays for each row of a (simulations, plays) matrix of play profits"""
+    equity = balance + np.cumsum(profits, axis=1)
+    # the starting balance counts as a peak too
+    peak = np.maximum(np.maximum.accumulate(equity, axis=1), balance)
+    drawdown = peak - equity
+
+    # running count of losses that resets at every win - the count so far, less what it was at
+    # the last win
+    losses = profits < 0
+    count = np.cumsum(losses, axis=1)
+    at_last_win = np.maximum.accumulate(np.where(losses, 0, count), axis=1)
+
+    return {
+        "final_pnl": equity[:, -1] - balance,
+        "max_drawdown": drawdown.max(axis=1),
+        "max_drawdown_pct": (drawdown / peak).max(axis=1),
+        "losing_streak": (count - at_last_win).max(axis=1),
+    }
+
+
+def _resample(rng: np.random.Generator, profits: np.ndarray, rows: int, method: str):
+    if method == "bootstrap":
+        return profits[rng.integers(0, len(profits), size=(rows, len(profits)))]
+    return rng.permuted(np.broadcast_to(profits, (rows, len(profits))), axis=1)
+
+
+def simulate(
+    plays,
+    simulations: int = DEFAULT_SIMULATIONS,
+    method: str = "bootstrap",
+    balance: float = 100000,
+    seed: int = None,
+) -> MonteCarloResult:
+    """Resamples plays (a plays_df, or an array of play profits) simulations times"""
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}, not {method}")
+    profits = play_profits(plays) if isinstance(plays, pd.DataFrame) else np.asarray(plays, float)
+    if len(profits) == 0:
+        raise ValueError("No finished plays to resample")
+
+    rng = np.random.default_rng(seed)
+    chunk = max(1, CHUNK_CELLS // len(profits))
+    chunks = []
+    for start in range(0, simulations, chunk):
+        rows = min(chunk, simulations - start)
+        chunks.append(path_metrics(_resample(rng, profits, rows, method), balance))
+    metrics = {name: np.concatenate([c[name] for c in chunks]) for name in chunks[0]}
+
+    observed = {name: values[0] for name, values in path_metrics(profits[None, :], balance).items()}
+    log_wp.log(9, f"Ran {simulations:,} {method} simulations of {len(profits):,} plays")
+    return MonteCarloResult(method, balance, metrics, observed)
+
+
+def main(args):
+    plays = pd.read_csv(args.plays_path, index_col=0, parse_dates=["end"])
+    result = simulate(
+        plays,
+        simulations=int(args.simulations),
+        method=args.method,
+        balance=float(args.balance),
+        seed=int(args.seed) if args.seed is not None else None,
+    )
+    print(result.summary().to_string())
+    print(f"Probability of losing money: {result.probability_of_loss():.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo resampling of back test plays")
+    parser.add_argument("--plays_path", required=True, help="A back test's {run_id}_plays.csv")
+    parser.add_argument("--simulations", default=DEFAULT_SIMULATIONS)
+    parser.add_argument("--method", default="bootstrap", choices=METHODS)
+    parser.add_argument("--balance", default=100000)
+    parser.add_argument("--seed", default=None)
+    main(parser.parse_args())
@@ -1,24 +1,15 @@
 # external packages
-import logging
-from pushover import Pushover
-from slack_sdk import WebClient
 
 # my modules
+import log_setup
+import http_sessions
 from inotification_service import INotificationService
 
 
-log_wp = logging.getLogger(
-    "notification_services"
-)  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("notification_services.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("notification_services")
+
+
+PUSHOVER_MESSAGES_URL = "https://api.pushover.net/1/messages.json"
 
 
 class Pushover(INotificationService):
@@ -28,16 +19,29 @@ class Pushover(INotificationService):
         user_key:str,
     ):
         #self.client = Client(user_key, api_token=api_key)
-        self.client = Pushover(api_key)
-        self.client.user(user_key)
+        # the pushover API is a single POST, so just hit it with the shared session instead of
+        # going through a client library that opens a new connection every time
+        self.api_key = api_key
+        self.user_key = user_key
+        self.client = http_sessions.get_session("pushover")
 
     def send(self, message: str,subject: str = None) -> bool:
         if not subject:
             subject = "tabot notification"
 
-        po_message = self.client.msg(message)
-        po_message.set("title", subject)
-        self.client.send(po_message)
+        response = self.client.post(
+            PUSHOVER_MESSAGES_URL,
+            data={
+                "token": self.api_key,
+                "user": self.user_key,
+                "message": message,
+                "title": subject,
+            },
+        )
+        if not response.ok:
+            log_wp.error(f"Pushover returned {response.status_code}: {response.text}")
+            return False
+        return True
 
 
 # finish changing get parameter and put parameter
@@ -52,7 +56,7 @@ class Slack(INotificationService):
         channel:str
     ):
         self.channel = channel
-        self.client = WebClient(token=bot_key)
+        self.client = http_sessions.get_factory().get_slack_client(token=bot_key)
 
     def send(self, message: str, subject: str = None) -> bool:
         self.client.chat_postMessage(
@@ -0,0 +1,60 @@
+import os
+
+from iobject_store import IObjectStore
+import http_sessions
+
+
+class S3ObjectStore(IObjectStore):
+    def __init__(self, bucket: str, storage_class: str = "ONEZONE_IA"):
+        self.bucket = bucket
+        self.storage_class = storage_class
+        self.s3 = http_sessions.get_boto3_client("s3")
+
+    def get(self, key: str) -> bytes:
+        try:
+            return self.s3.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+        except self.s3.exceptions.NoSuchKey:
+            return None
+
+    def put(self, key: str, body: bytes):
+        self.s3.put_object(Bucket=self.bucket, Key=key, Body=body, StorageClass=self.storage_class)
+
+    def delete(self, key: str):
+        self.s3.delete_object(Bucket=self.bucket, Key=key)
+
+
+class LocalObjectStore(IObjectStore):
+    """Stands in for S3 - keys are paths under root. Keeps the keys it's read and written, so
+    tests can see what got transferred"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.reads = []
+        self.writes = []
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key), "rb") as f:
+                body = f.read()
+        except FileNotFoundError:
+            return None
+        self.reads.append(key)
+        return body
+
+    def put(self, key: str, body: bytes):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # whole objects or nothing, like S3
+        with open(path + ".tmp", "wb") as f:
+            f.write(body)
+        os.replace(path + ".tmp", path)
+        self.writes.append(key)
+
+    def delete(self, key: str):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            ...
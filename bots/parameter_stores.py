@@ -1,16 +1,19 @@
-from iparameter_store import IParameterStore
+import json
 
-import boto3
-from botocore.exceptions import ClientError
+from iparameter_store import IParameterStore
+import http_sessions
 
 
 class Ssm(IParameterStore):
     def __init__(self):
-        self.store = boto3.client("ssm")
+        self.store = http_sessions.get_boto3_client("ssm")
 
     def put(
         self, path: str, value: str, field_type: str = "String", overwrite: bool = True
     ) -> dict:
+        # botocore only gets imported by things that actually talk to SSM
+        from botocore.exceptions import ClientError
+
         try:
             return self.store.put_parameter(
                 Name=path, Value=value, Type=field_type, Overwrite=overwrite
@@ -19,6 +22,8 @@ class Ssm(IParameterStore):
             raise
 
     def get(self, path: str, with_decryption: bool = True) -> dict:
+        from botocore.exceptions import ClientError
+
         try:
             return self.store.get_parameter(Name=path, WithDecryption=with_decryption)["Parameter"][
                 "Value"
@@ -64,3 +69,11 @@ class BackTestStore(IParameterStore):
         for this_path in args:
             this_value = ssm.get(path=this_path)
             self.put(path=this_path, value=this_value)
+
+    def load_file(self, path: str):
+        # seed the store from a JSON file of {parameter path: value}, so back tests don't need SSM
+        with open(path) as f:
+            parameters = json.load(f)
+
+        for this_path, this_value in parameters.items():
+            self.put(path=this_path, value=this_value)
@@ -0,0 +1,275 @@
+# external packages
+import atexit
+from collections import OrderedDict, deque
+import logging
+import threading
+
+# my modules
+import log_setup
+import http_sessions
+
+log_wp = log_setup.get_logger("play_logs")
+
+LOG_GROUP = "tabot"
+
+# CloudWatch limits for a single put_log_events call. each event costs its message size plus 26
+# bytes of overhead
+MAX_MESSAGE_BYTES = 256 * 1024 - 26
+MAX_BATCH_EVENTS = 10000
+MAX_BATCH_BYTES = 1048576
+EVENT_OVERHEAD_BYTES = 26
+
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_MAX_BUFFERED = 10000
+
+
+class CloudWatchSink:
+    """Sends batches of events to a log stream per play, all in the one log group"""
+
+    def __init__(self, log_group: str = LOG_GROUP, client=None):
+        self.log_group = log_group
+        self._client = client
+
+    @property
+    def client(self):
+        # boto3 client comes from the shared session factory, so it's pooled with everything else
+        if self._client is None:
+            self._client = http_sessions.get_boto3_client("logs")
+        return self._client
+
+    def create_stream(self, stream: str):
+        try:
+            self.client.create_log_stream(logGroupName=self.log_group, logStreamName=stream)
+        except self.client.exceptions.ResourceAlreadyExistsException:
+            ...
+        except self.client.exceptions.ResourceNotFoundException:
+            # group doesn't exist yet
+            try:
+                self.client.create_log_group(logGroupName=self.log_group)
+            except self.client.exceptions.ResourceAlreadyExistsException:
+                ...
+            self.client.create_log_stream(logGroupName=self.log_group, logStreamName=stream)
+
+    def put_events(self, stream: str, events: list):
+        # sequence tokens aren't needed any more - CloudWatch accepts concurrent puts to a stream
+        self.client.put_log_events(
+            logGroupName=self.log_group, logStreamName=stream, logEvents=events
+        )
+
+    def release_stream(self, stream: str):
+        ...
+
+
+class LocalSink:
+    """Stand in for CloudWatchSink, for tests and back tests
+
+    Events are kept in memory, and also appended to {directory}/{stream}.log if a directory is
+    given. Only the most recent max_streams streams are kept in memory so it stays bounded over a
+    long back test
+    """
+
+    def __init__(self, directory: str = None, max_streams: int = 1000, max_events: int = 10000):
+        self.directory = directory
+        self.max_streams = max_streams
+        self.max_events = max_events
+        self.streams = OrderedDict()
+        self.created = []
+        self.released = []
+        self.put_calls = 0
+
+    def create_stream(self, stream: str):
+        self.created.append(stream)
+        self.streams[stream] = deque(maxlen=self.max_events)
+        while len(self.streams) > self.max_streams:
+            self.streams.popitem(last=False)
+
+    def put_events(self, stream: str, events: list):
+        self.put_calls += 1
+        if stream in self.streams:
+            self.streams[stream].extend(events)
+
+        if self.directory:
+            with open(f"{self.directory}/{stream}.log", "a") as f:
+                for event in events:
+                    f.write(event["message"] + "\n")
+
+    def release_stream(self, stream: str):
+        self.released.append(stream)
+
+    def messages(self, stream: str) -> list:
+        return [event["message"] for event in self.streams.get(stream, [])]
+
+
+class PlayLogWriter(logging.Handler):
+    """One handler shared by every play logger, writing each play to its own stream
+
+    emit() runs on the log_setup listener thread and only appends to an in-memory buffer. A
+    background thread sends the buffers in batches every flush_interval seconds (or sooner if a
+    batch fills up), so there's one set of connections for all plays rather than a
+    CloudwatchHandler per play. At most max_buffered events are held - past that new events are
+    dropped and counted rather than letting memory grow while CloudWatch is unreachable
+
+    When a play's logger is released (log_setup.release_logger) its remaining events are sent
+    and the stream is forgotten
+    """
+
+    def __init__(
+        self,
+        sink=None,
+        flush_interval: float = DEFAULT_FLUSH_INTERVAL,
+        max_buffered: int = DEFAULT_MAX_BUFFERED,
+        batch_size: int = MAX_BATCH_EVENTS,
+    ):
+        super().__init__()
+        self.setFormatter(logging.Formatter(log_setup.LOG_FORMAT))
+        self.sink = sink if sink is not None else CloudWatchSink()
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.batch_size = batch_size
+
+        self._buffers = {}
+        self._buffered = 0
+        self._created = set()
+        self._released = set()
+        self._buffer_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="play_log_writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            message = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        if len(message.encode("utf-8")) > MAX_MESSAGE_BYTES:
+            message = message.encode("utf-8")[:MAX_MESSAGE_BYTES].decode("utf-8", "ignore")
+
+        event = {"timestamp": int(record.created * 1000), "message": message}
+        with self._buffer_lock:
+            if self._buffered >= self.max_buffered:
+                self.dropped += 1
+                return
+            buffer = self._buffers.setdefault(record.name, [])
+            buffer.append(event)
+            self._buffered += 1
+            full = len(buffer) >= self.batch_size
+
+        if full:
+            self._wake.set()
+
+    def end_play(self, logger_name: str):
+        # called by log_setup once everything this play logged has been through emit. not called
+        # release - that's Handler's lock method
+        with self._buffer_lock:
+            self._released.add(logger_name)
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._send_lock:
+            with self._buffer_lock:
+                buffers = self._buffers
+                released = self._released
+                self._buffers = {}
+                self._released = set()
+                self._buffered = 0
+
+            for stream, events in buffers.items():
+                self._send(stream, events)
+
+            for stream in released:
+                self._created.discard(stream)
+                self.sink.release_stream(stream)
+
+    def _send(self, stream: str, events: list):
+        try:
+            if stream not in self._created:
+                self.sink.create_stream(stream)
+                self._created.add(stream)
+
+            for batch in self._batches(events):
+                self.sink.put_events(stream, batch)
+                self.sent += len(batch)
+        except Exception as e:
+            # don't retry - a play's log isn't worth holding up (or growing) the buffer for
+            self.failed += len(events)
+            log_wp.warning(f"{stream}: Failed to send {len(events)} play log events - {str(e)}")
+
+    def _batches(self, events: list):
+        batch = []
+        batch_bytes = 0
+        for event in events:
+            size = len(event["message"].encode("utf-8")) + EVENT_OVERHEAD_BYTES
+            if batch and (len(batch) >= self.batch_size or batch_bytes + size > MAX_BATCH_BYTES):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(event)
+            batch_bytes += size
+        if batch:
+            yield batch
+
+    def close(self):
+        self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+        super().close()
+
+    def stats(self) -> dict:
+        with self._buffer_lock:
+            buffered = self._buffered
+        return {
+            "buffered": buffered,
+            "open_streams": len(self._created),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> PlayLogWriter:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = PlayLogWriter()
+        return _writer
+
+
+def set_writer(writer: PlayLogWriter):
+    """Swaps in a different writer, eg. one with a LocalSink for back tests"""
+    global _writer
+    with _writer_lock:
+        old_writer = _writer
+        _writer = writer
+    if old_writer is not None and old_writer is not writer:
+        old_writer.close()
+
+
+def close():
+    # the logging queue has to be drained first so the last play log records reach the writer
+    log_setup.stop()
+    with _writer_lock:
+        if _writer is not None:
+            _writer.close()
+
+
+atexit.register(close)
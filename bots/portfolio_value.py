@@ -1,18 +1,11 @@
 from numpy import NaN
 from symbol_objects import SymbolCollection
+import log_setup
 import logging
+import numpy as np
 import pandas as pd
 
-log_wp = logging.getLogger("portfolio_value")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("portfolio_value.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.INFO)
+log_wp = log_setup.get_logger("portfolio_value", level=logging.INFO)
 
 
 class PortfolioValue(SymbolCollection):
@@ -33,11 +26,15 @@ class PortfolioValue(SymbolCollection):
         log_level=logging.INFO,
         sma_intervals: int = 100,
         sma_period: int = 20,
+        incremental: bool = False,
     ):
         super().__init__(symbols=symbols, interval=interval, log_level=log_level)
         self.sma_intervals = sma_intervals
         self.sma_period = sma_period
         self.portfolio = portfolio
+        # keep the last portfolio_df and only work out the rows that are new (or changed) since
+        self.incremental = incremental
+        self._portfolio_cache = None
 
     def _add_holding_values(self, collection):
         for k, s in collection.items():
@@ -91,51 +88,85 @@ class PortfolioValue(SymbolCollection):
         return return_df
 
     def sum_all(self) -> pd.DataFrame:
-        all_values = self.get_all()
-        return_df = pd.DataFrame
-        for k, s in all_values.items():
-            if return_df.empty:
-                return_df = s["Close_value"].to_frame()
-            else:
-                return_df = return_df["Close_value"].to_frame() + s["Close_value"].to_frame()
-
-        return return_df
+        # one matrix x units held, rather than a Close_value frame per symbol added together
+        close = self.get_panel("Close")
+        units_held = np.array([self.portfolio[k] for k in close.columns], dtype=float)
+        return pd.DataFrame({"Close_value": close.to_numpy() @ units_held}, index=close.index)
 
     @property
     def portfolio_df(self):
-        # TODO only recalculate the bits that have changed since last run
         portfolio_df = self.sum_all()
-        starting_value = portfolio_df.iloc[0].Close_value
-        portfolio_df = self.add_sma(portfolio_df)
-        self.add_comparisons(portfolio_df, starting_value)
+
+        updated_df = None
+        if self.incremental and self._portfolio_cache is not None:
+            updated_df = self._update_portfolio_df(portfolio_df, self._portfolio_cache)
+
+        if updated_df is not None:
+            portfolio_df = updated_df
+        else:
+            starting_value = portfolio_df.iloc[0].Close_value
+            portfolio_df = self.add_sma(portfolio_df)
+            self.add_comparisons(portfolio_df, starting_value)
+
+        if self.incremental:
+            # don't modify what comes back - it's what the next call starts from
+            self._portfolio_cache = portfolio_df
         return portfolio_df
 
         # this_sma = round(portfolio_analysis.sma.iloc[-1], 3)
         # this_diff_pct = round(portfolio_analysis.portfolio_diff_pct.iloc[-1], 3)
 
+    def _update_portfolio_df(self, portfolio_df, cached):
+        # finds the first row that's new, or whose value moved (eg. a symbol's bar arrived late and
+        # replaced a forward filled one) - everything before it can come straight from the cache.
+        # returns None if history got rewritten rather than added to and it needs doing from scratch
+        old_close = cached.Close_value
+        overlap = portfolio_df.Close_value.iloc[: len(old_close)]
+        if len(overlap) < len(old_close) or not overlap.index.equals(old_close.index):
+            return None
+
+        changed = (overlap.values != old_close.values) & ~(overlap.isna() & old_close.isna()).values
+        first_changed = changed.argmax() if changed.any() else len(old_close)
+        if first_changed == 0:
+            # the starting value moved, so every comparison does too
+            return None
+
+        if first_changed == len(portfolio_df):
+            return cached
+
+        # the SMA for the changed rows needs sma_period rows of history before them
+        recalc_start = max(0, first_changed - self.sma_period + 1)
+        new_sma = self._rolling_mean(portfolio_df.Close_value.iloc[recalc_start:])
+        sma = pd.concat([cached.sma.iloc[:first_changed], new_sma.iloc[first_changed - recalc_start :]])
+
+        portfolio_df = portfolio_df.assign(sma=self._sma_window(sma))
+        portfolio_df["portfolio_diff"] = cached.portfolio_diff.iloc[:first_changed]
+        portfolio_df["portfolio_diff_pct"] = cached.portfolio_diff_pct.iloc[:first_changed]
+        self.add_comparisons(portfolio_df, cached.Close_value.iloc[0])
+
+        log_wp.debug(f"Recalculated {len(portfolio_df) - first_changed} rows of portfolio_df")
+        return portfolio_df
+
+    def _rolling_mean(self, close_values: pd.Series) -> pd.Series:
+        # min_periods=1 skips NaNs the same way DataFrame.mean() does, for symbols that start late
+        return close_values.rolling(self.sma_period, min_periods=1).mean()
+
+    def _sma_window(self, sma: pd.Series) -> pd.Series:
+        # only the last sma_intervals rows (bar the first) get an SMA - anything older stays NaN
+        first_valid = max(0, len(sma) - (self.sma_intervals + self.sma_period)) + self.sma_period + 1
+        sma = sma.copy()
+        sma.iloc[:first_valid] = NaN
+        return sma
+
     def add_sma(self, portfolio_df):
         if len(portfolio_df) < self.sma_intervals:
             raise KeyError(
                 f"Cannot calculate SMA for {self.sma_intervals} intervals, since length of dataframe is only {len(portfolio_df)}"
             )
 
-        slice_length = self.sma_intervals + self.sma_period
-
-        df = portfolio_df.iloc[-slice_length:].copy()
-        sma = []
-
-        for index in df.index:
-            if index <= df.index[self.sma_period]:
-                sma.append(NaN)
-            else:
-                sma_end = df.index.get_loc(index) + 1  # want it to be inclusive of current record
-                sma_start = sma_end - self.sma_period
-                sma.append(df.iloc[sma_start:sma_end].mean().Close_value)
-
-        df["sma"] = sma
-        df = df.loc[df.sma.isna() == False]
-        portfolio_df = portfolio_df.assign(sma=df["sma"])
-        log_wp.debug(f"Added {len(sma)} SMA values to portfolio_df")
+        sma = self._sma_window(self._rolling_mean(portfolio_df.Close_value))
+        portfolio_df = portfolio_df.assign(sma=sma)
+        log_wp.debug(f"Added {sma.notna().sum()} SMA values to portfolio_df")
         return portfolio_df
 
     def add_comparisons(self, portfolio_df, starting_value):
@@ -145,11 +176,8 @@ class PortfolioValue(SymbolCollection):
             portfolio_df["portfolio_diff"] = NaN
             portfolio_df["portfolio_diff_pct"] = NaN
 
-        # now get all the rows where these columns are NaN
-        rows_to_calculate = portfolio_df.loc[portfolio_df["portfolio_diff"].isna()]
-        rows_to_calculate["portfolio_diff"] = rows_to_calculate["Close_value"] - starting_value
-        rows_to_calculate["portfolio_diff_pct"] = rows_to_calculate["Close_value"] / starting_value
-        portfolio_df["portfolio_diff"].fillna(rows_to_calculate["portfolio_diff"], inplace=True)
-        portfolio_df["portfolio_diff_pct"].fillna(
-            rows_to_calculate["portfolio_diff_pct"], inplace=True
-        )
+        # now fill in all the rows where these columns are NaN
+        rows_to_calculate = portfolio_df["portfolio_diff"].isna()
+        close_values = portfolio_df.loc[rows_to_calculate, "Close_value"]
+        portfolio_df.loc[rows_to_calculate, "portfolio_diff"] = close_values - starting_value
+        portfolio_df.loc[rows_to_calculate, "portfolio_diff_pct"] = close_values / starting_value
@@ -0,0 +1,343 @@
+# external packages
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from math import floor
+import numpy as np
+import pandas as pd
+
+# my modules
+import log_setup
+import sample_symbols
+import shared_bars
+import utils
+import walk_forward
+from macd_config import MacdConfig
+
+log_wp = log_setup.get_logger("prescreen")
+
+# a rough back test for screening a whole universe before the real one. the full back test walks
+# every bar through MacdWorker's state machine, BackTestAPI and the rules - right, but far too
+# slow to try hundreds of symbols. this works out the same buy signals, stop and take profit
+# straight from the signal columns, and finds each play's exit with numpy scans
+#
+#   entry        macd_crossover and macd_macd < 0, like check_buy_signal (its sma check is off),
+#                buying at the signal bar's Close if a Low in the next few bars gets under it
+#   stop         the lowest Close since the previous crossover, like BuyPlan
+#   take profit  entry + profit_target * (entry - stop), like BuyPlan
+#   exit         half at each take profit, with the stop moved up to keep 99% of the gain and
+#                the next take profit further out, and the rest when a Close drops under the stop.
+#                all filled at the bar's High like BackTestAPI does
+#
+# it's still only an approximation - no balance shared between symbols, no price or quantity
+# increments, no cancelled orders. calibrate() runs the full back test over the same bars and
+# reports how far off it is
+#
+#   python prescreen.py --bars_path ./bars --symbols crypto_symbols_alpaca_all
+#   python prescreen.py --bars_path ./bars --symbols crypto_symbol --calibrate
+
+# bars a back test needs before the first bar it checks for a signal, see MacdWorker
+SIGNAL_WINDOW = 200
+# bars a limit buy gets to fill, including the signal bar, before it times out
+BUY_FILL_BARS = 3
+# BuyPlan won't buy if the take profit is already this far under the signal bar's High
+TAKE_PROFIT_ALREADY_MET = 1.25
+# from the rules TABotRules writes for each play
+SELL_DOWN = 0.5
+PROTECTED_GAIN = 0.99
+SCAN_CHUNK = 1024
+
+
+def find_signals(bars: pd.DataFrame) -> pd.DataFrame:
+    """Every bar a buy plan would be made on, with its entry, stop and the bar it was made on"""
+    close = bars.Close.to_numpy(dtype=np.float64)
+    crossover = bars.macd_crossover.to_numpy(dtype=bool)
+    positions = np.arange(len(bars))
+    signal = crossover & (bars.macd_macd.to_numpy() < 0) & (positions >= SIGNAL_WINDOW)
+
+    # the stop is the lowest close from the previous crossover up to this one - the minimum of
+    # each stretch between crossovers, and the close on the crossover that ends it
+    crossovers = np.flatnonzero(crossover)
+    if len(crossovers) < 2:
+        return pd.DataFrame(columns=["position", "entry", "stop"])
+    stretch_min = np.minimum.reduceat(close, crossovers)[:-1]
+    stops = np.minimum(stretch_min, close[crossovers[1:]])
+    previous = crossovers[:-1]
+    current = crossovers[1:]
+
+    wanted = signal[current] & (previous >= current - SIGNAL_WINDOW)
+    return pd.DataFrame(
+        {"position": current[wanted], "entry": close[current[wanted]], "stop": stops[wanted]}
+    )
+
+
+def _first_hit(high, close, start, stop, target) -> tuple:
+    # the first bar from start on where the take profit fills or the stop is hit - the take profit
+    # order gets checked first
+    for lo in range(start, len(high), SCAN_CHUNK):
+        take_profit = high[lo : lo + SCAN_CHUNK] > target
+        hits = np.flatnonzero(take_profit | (close[lo : lo + SCAN_CHUNK] < stop))
+        if len(hits) > 0:
+            return lo + hits[0], bool(take_profit[hits[0]])
+    return None, None
+
+
+def _play_exit(high, close, filled, entry, stop, target, units) -> tuple:
+    """Where a position bought at filled gets out, following the rules MacdWorker and BuyPlan
+    use. Returns the exit bar, what the sales made and how many take profits there were - or
+    None if it's still going at the last bar"""
+    # the bar it's bought on checks the stop before the take profit goes in
+    if close[filled] < stop:
+        return filled, units * high[filled], 0
+
+    risk = entry - stop
+    held = units
+    proceeds = 0.0
+    steps = 0
+    take_profits = 0
+    # half goes at each take profit, at least one unit the first time
+    selling = max(floor(units * SELL_DOWN), 1)
+    position = filled
+    while True:
+        position, take_profit = _first_hit(high, close, position, stop, target)
+        if position is None:
+            return None
+        if not take_profit:
+            return position, proceeds + held * high[position], take_profits
+
+        proceeds += selling * high[position]
+        held_before = held
+        held -= selling
+        take_profits += 1
+        if held <= 0:
+            return position, proceeds, take_profits
+
+        # the next take profit is further out, and the stop keeps most of what's been made. a back
+        # test doesn't look at them until the next bar
+        steps_taken = steps + 1
+        target += risk * steps_taken
+        steps += steps_taken
+        stop = entry + (high[position] - entry) * PROTECTED_GAIN
+        # MacdWorker sizes the next one from the position it read before this sale filled - more
+        # than is left sometimes, which the engine fumbles, so that's capped here
+        selling = min(floor(held_before * SELL_DOWN) or held_before, held)
+        position += 1
+
+
+def simulate_symbol(
+    bars: pd.DataFrame,
+    profit_target: float = 1.5,
+    order_size: float = MacdConfig.DEFAULT_BACK_TEST_ORDER_SIZE,
+    start: pd.Timestamp = None,
+    end: pd.Timestamp = None,
+) -> pd.DataFrame:
+    """The plays one symbol's bars (with signals) would make between start and end. Plays that
+    haven't finished by the last bar are left out, like walk_forward.run_back_test does"""
+    high = bars.High.to_numpy(dtype=np.float64)
+    low = bars.Low.to_numpy(dtype=np.float64)
+    close = bars.Close.to_numpy(dtype=np.float64)
+    index = bars.index
+
+    signals = find_signals(bars)
+    if start is not None:
+        signals = signals.loc[index[signals.position] >= start]
+    if end is not None:
+        signals = signals.loc[index[signals.position] <= end]
+        last = index.searchsorted(end, side="right") - 1
+        high, low, close = high[: last + 1], low[: last + 1], close[: last + 1]
+
+    # what BuyPlan turns down
+    signals = signals.loc[
+        (signals.stop <= low[signals.position])
+        & (signals.entry * TAKE_PROFIT_ALREADY_MET >= high[signals.position])
+        & (signals.entry <= order_size)
+    ]
+
+    plays = []
+    free_from = 0
+    for position, entry, stop in signals.itertuples(index=False):
+        # still in the last play, or waiting on its buy
+        if position < free_from:
+            continue
+        fills = np.flatnonzero(low[position : position + BUY_FILL_BARS] < entry)
+        if len(fills) == 0:
+            free_from = position + BUY_FILL_BARS - 1
+            continue
+        # BuyPlan buys whole units
+        units = int(order_size // entry)
+        target = entry + profit_target * (entry - stop)
+
+        exit = _play_exit(high, close, position + fills[0], entry, stop, target, units)
+        if exit is None:
+            break
+        exit_position, proceeds, take_profits = exit
+        # a back test finishes the bar once a play closes
+        free_from = exit_position + 1
+        plays.append(
+            (index[position], index[exit_position], entry, stop, units, proceeds, take_profits)
+        )
+
+    plays = pd.DataFrame(
+        plays,
+        columns=["start", "end", "entry", "stop", "units", "sell_value", "take_profit_count"],
+    )
+    plays["buy_value"] = plays.units * plays.entry
+    plays["profit"] = plays.sell_value - plays.buy_value
+    plays["return"] = plays.profit / plays.buy_value
+    plays["outcome"] = np.where(plays.profit < 0, "loss", "win")
+    return plays
+
+
+def screen(
+    all_bars: dict,
+    interval: str = "5m",
+    profit_target: float = 1.5,
+    order_size: float = MacdConfig.DEFAULT_BACK_TEST_ORDER_SIZE,
+) -> tuple:
+    """Plays for every symbol in all_bars ({symbol: bars}), each from where a back test of it
+    would start. Returns a report of symbols by profit, and the plays"""
+    symbol_plays = []
+    for symbol, bars in all_bars.items():
+        if "macd_macd" not in bars.columns:
+            bars = utils.add_signals(bars, interval)
+        start = bars.index[min(walk_forward.WARM_UP_BARS, len(bars) - 1)]
+        plays = simulate_symbol(bars, profit_target, order_size, start=start)
+        symbol_plays.append(plays.assign(symbol=symbol))
+    plays = pd.concat(symbol_plays, ignore_index=True)
+
+    grouped = plays.groupby("symbol")
+    report = pd.DataFrame(
+        {
+            "plays": grouped.size(),
+            "win_rate": grouped.profit.apply(lambda profit: (profit >= 0).mean()),
+            "profit": grouped.profit.sum(),
+            "mean_return": grouped["return"].mean(),
+        }
+    ).reindex(list(all_bars))
+    report["plays"] = report.plays.fillna(0).astype(int)
+    report["profit"] = report.profit.fillna(0.0)
+    return report.sort_values("profit", ascending=False), plays
+
+
+def calibrate(all_bars: dict, symbols: list, config_factory, max_workers: int = None) -> tuple:
+    """Runs the full back test and the pre-screen over the same bars, with the order size and
+    profit target config_factory's config has. Returns a report per symbol, and a summary of how
+    well they agree"""
+    config = config_factory()
+    api = {symbol["symbol"]: symbol["api"] for symbol in symbols}
+
+    with shared_bars.SharedBarRegistry() as registry:
+        signal_bars = {}
+        for symbol, bars in all_bars.items():
+            signal_bars[symbol] = utils.add_signals(bars, config.interval)
+            registry.publish(symbol, signal_bars[symbol])
+        # one back test per symbol, so no play ever waits on the balance
+        test = partial(walk_forward.run_back_test, config_factory, registry.handles)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {
+                symbol: pool.submit(test, [{"symbol": symbol, "api": api[symbol]}], {}, None, None)
+                for symbol in all_bars
+            }
+            engine = pd.concat(
+                [future.result().assign(symbol=symbol) for symbol, future in futures.items()],
+                ignore_index=True,
+            )
+
+    screen_report, screened = screen(
+        signal_bars, config.interval, config.profit_target, config.order_size
+    )
+    engine["start"] = pd.to_datetime(engine.start, utc=True)
+    engine["return"] = engine.profit.astype(float) / engine.buy_value.astype(float)
+    matched = engine.merge(screened, on=["symbol", "start"], suffixes=("_engine", "_screen"))
+
+    grouped = engine.groupby("symbol")
+    report = pd.DataFrame(
+        {
+            "engine_plays": grouped.size(),
+            "engine_profit": grouped.profit.sum().astype(float),
+            "screen_plays": screen_report.plays,
+            "screen_profit": screen_report.profit,
+            "matched_plays": matched.groupby("symbol").size(),
+        }
+    ).reindex(list(all_bars))
+    report = report.fillna({"engine_plays": 0, "engine_profit": 0.0, "matched_plays": 0})
+
+    summary = {
+        "symbols": len(report),
+        "engine_plays": len(engine),
+        "screen_plays": len(screened),
+        # how many of the real plays the screen found, and how many of its plays were real
+        "recall": len(matched) / len(engine) if len(engine) else None,
+        "precision": len(matched) / len(screened) if len(screened) else None,
+        "outcome_agreement": (matched.outcome_engine == matched.outcome_screen).mean()
+        if len(matched)
+        else None,
+        "return_error": (matched.return_screen - matched.return_engine).abs().mean()
+        if len(matched)
+        else None,
+        # spearman, without needing scipy
+        "profit_rank_correlation": report.engine_profit.rank().corr(report.screen_profit.rank()),
+    }
+    log_wp.info(f"Calibrated against {len(engine)} back test plays: {summary}")
+    return report, summary
+
+
+def main(args):
+    symbols = sample_symbols.input_symbols[args.symbols]
+    all_bars = {}
+    for symbol in symbols:
+        bars = utils.load_bars(
+            symbol["symbol"],
+            bucket=MacdConfig.SAVED_SYMBOL_DATA_BUCKET,
+            key_base=f"{MacdConfig.SAVED_SYMBOL_KEY_BASE}{args.interval}/",
+            path=args.bars_path,
+        )
+        if bars is not None:
+            all_bars[symbol["symbol"]] = bars
+
+    if args.calibrate:
+        tabot_args = [
+            "--run_type=back_test",
+            f"--interval={args.interval}",
+            f"--symbols={args.symbols}",
+            f"--profit_target={args.profit_target}",
+            "--back_testing_override_broker",
+            "--back_testing_skip_bar_update",
+        ]
+        if args.parameters_file:
+            tabot_args.append(f"--parameters_file={args.parameters_file}")
+        report, summary = calibrate(
+            all_bars,
+            symbols,
+            partial(walk_forward.back_test_config, tabot_args),
+            max_workers=int(args.workers) if args.workers else None,
+        )
+        for name, value in summary.items():
+            print(f"{name}: {value}")
+    else:
+        report, plays = screen(
+            all_bars, args.interval, float(args.profit_target), float(args.order_size)
+        )
+
+    if args.output_path:
+        report.to_csv(args.output_path)
+    print(report.to_string())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quick vectorised back test of a symbol universe")
+    parser.add_argument("--bars_path", default=None, help="{symbol}.csv bars instead of S3")
+    parser.add_argument("--symbols", default="crypto_symbol")
+    parser.add_argument("--interval", default="5m")
+    parser.add_argument("--profit_target", default=1.5)
+    parser.add_argument("--order_size", default=MacdConfig.DEFAULT_BACK_TEST_ORDER_SIZE)
+    parser.add_argument(
+        "--calibrate",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Also run the full back test over the same bars and report how well they agree",
+    )
+    parser.add_argument("--parameters_file", default=None)
+    parser.add_argument("--workers", default=None, help="Back tests run at once when calibrating")
+    parser.add_argument("--output_path", default=None, help="Write the report to this CSV")
+    main(parser.parse_args())
@@ -0,0 +1,264 @@
+# external packages
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+import functools
+import json
+import threading
+import time
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("profiling")
+
+# lightweight always-available timing for the bot's hot paths. off by default - when it's off,
+# timer() hands back one shared do-nothing context manager, timed() is a flag check and wrap()
+# returns the object untouched, so the state machine pays close to nothing for it
+#
+#   with profiling.timer("check_state_position_taken", symbol="BTC-USD"):
+#       ...
+#
+#   @profiling.timed("add_signals")
+#   def add_signals(bars, interval):
+#       ...
+#
+# timings are kept per symbol and phase in a histogram with power of two buckets, and dumped
+# to the log (and a JSON file if one is set) every dump_interval seconds
+
+DEFAULT_DUMP_INTERVAL = 300
+
+# bucket upper bounds in seconds, 10us up to ~20s, plus an overflow bucket
+BUCKET_BOUNDS = [0.00001 * 2**i for i in range(22)]
+
+# when there is no symbol to hand (eg. add_signals called from a worker method) records go
+# against whichever symbol the current thread is working on, or this
+NO_SYMBOL = "-"
+
+_enabled = False
+_NULL_TIMER = nullcontext()
+
+_lock = threading.Lock()
+_histograms = {}
+_local = threading.local()
+_clock = time.perf_counter
+
+_dump_interval = DEFAULT_DUMP_INTERVAL
+_dump_path = None
+_last_dump = None
+
+
+class Histogram:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+        self.buckets[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+
+    def percentile(self, pct: float) -> float:
+        # upper bound of the bucket the percentile lands in, capped at the slowest we've seen
+        target = self.count * pct / 100
+        running = 0
+        for i, bucket_count in enumerate(self.buckets):
+            running += bucket_count
+            if running >= target and bucket_count > 0:
+                if i < len(BUCKET_BOUNDS):
+                    return min(BUCKET_BOUNDS[i], self.max)
+                return self.max
+        return self.max
+
+    def summary(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else 0.0,
+            "min": self.min or 0.0,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+def enable(dump_interval: float = DEFAULT_DUMP_INTERVAL, dump_path: str = None, clock=None):
+    global _enabled, _dump_interval, _dump_path, _last_dump, _clock
+    if clock is not None:
+        _clock = clock
+    _dump_interval = dump_interval
+    _dump_path = dump_path
+    _last_dump = _clock()
+    _enabled = True
+    log_wp.info(f"Profiling enabled, dumping every {dump_interval}s")
+
+
+def disable():
+    global _enabled, _clock
+    _enabled = False
+    _clock = time.perf_counter
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def _current_symbol() -> str:
+    return getattr(_local, "symbol", NO_SYMBOL)
+
+
+def record(phase: str, seconds: float, symbol: str = None):
+    if symbol is None:
+        symbol = _current_symbol()
+
+    with _lock:
+        histogram = _histograms.get((symbol, phase))
+        if histogram is None:
+            histogram = Histogram()
+            _histograms[(symbol, phase)] = histogram
+        histogram.add(seconds)
+
+    if _dump_interval is not None and _clock() - _last_dump >= _dump_interval:
+        dump()
+
+
+@contextmanager
+def _timer(phase: str, symbol: str):
+    # symbol is set for the thread so anything timed further down gets charged to it too
+    previous_symbol = getattr(_local, "symbol", NO_SYMBOL)
+    if symbol is not None:
+        _local.symbol = symbol
+    start = _clock()
+    try:
+        yield
+    finally:
+        elapsed = _clock() - start
+        _local.symbol = previous_symbol
+        record(phase, elapsed, symbol)
+
+
+def timer(phase: str, symbol: str = None):
+    """Context manager that times the block against phase (and symbol)"""
+    if not _enabled:
+        return _NULL_TIMER
+    return _timer(phase, symbol)
+
+
+def timed(phase: str = None, symbol_from_self: bool = False):
+    """Decorator version of timer(). phase defaults to the function name
+
+    symbol_from_self takes the symbol from the first argument's .symbol, for methods on things
+    like MacdWorker
+    """
+
+    def decorator(func):
+        name = phase or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            symbol = args[0].symbol if symbol_from_self else None
+            with _timer(name, symbol):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class TimedProxy:
+    """Times every method call made on the wrapped object, as "{prefix}.{method name}"
+
+    Used for broker and parameter store calls, whose classes we'd rather not decorate method by
+    method. Attributes that aren't callable are passed straight through
+    """
+
+    def __init__(self, target, prefix: str):
+        self._target = target
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if not callable(attribute):
+            return attribute
+
+        phase = f"{self._prefix}.{name}"
+
+        @functools.wraps(attribute)
+        def timed_call(*args, **kwargs):
+            with timer(phase):
+                return attribute(*args, **kwargs)
+
+        return timed_call
+
+    @property
+    def wrapped(self):
+        return self._target
+
+
+def wrap(target, prefix: str):
+    """Returns target wrapped in a TimedProxy if profiling is on, otherwise target untouched"""
+    if not _enabled:
+        return target
+    return TimedProxy(target, prefix)
+
+
+def report() -> dict:
+    """{symbol: {phase: summary}} for everything recorded since the last reset"""
+    with _lock:
+        items = list(_histograms.items())
+
+    summary = {}
+    for (symbol, phase), histogram in items:
+        summary.setdefault(symbol, {})[phase] = histogram.summary()
+    return summary
+
+
+def phase_totals() -> dict:
+    """Same as report() but added up across symbols, slowest phase first"""
+    with _lock:
+        items = list(_histograms.items())
+
+    totals = {}
+    for (symbol, phase), histogram in items:
+        total = totals.setdefault(phase, Histogram())
+        total.count += histogram.count
+        total.total += histogram.total
+        total.max = max(total.max, histogram.max)
+        if histogram.min is not None and (total.min is None or histogram.min < total.min):
+            total.min = histogram.min
+        for i, bucket_count in enumerate(histogram.buckets):
+            total.buckets[i] += bucket_count
+
+    ordered = sorted(totals.items(), key=lambda item: item[1].total, reverse=True)
+    return {phase: histogram.summary() for phase, histogram in ordered}
+
+
+def dump():
+    global _last_dump
+    _last_dump = _clock()
+
+    totals = phase_totals()
+    for phase, summary in list(totals.items())[:10]:
+        log_wp.info(
+            f"{phase}: {summary['count']} calls, {round(summary['total'],3)}s total, "
+            f"mean {round(summary['mean'] * 1000,3)}ms, p99 {round(summary['p99'] * 1000,3)}ms"
+        )
+
+    if _dump_path:
+        with open(_dump_path, "w") as f:
+            json.dump({"phases": totals, "symbols": report()}, f, indent=2)
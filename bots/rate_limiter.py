@@ -0,0 +1,268 @@
+# external packages
+import threading
+import time
+from urllib.parse import urlparse
+
+# my modules
+import log_setup
+import http_sessions
+from itradeapi import ITradeAPI
+
+log_wp = log_setup.get_logger("rate_limiter")
+
+# endpoint classes
+ORDERS = "orders"
+ACCOUNT = "account"
+READS = "reads"
+
+# lower number wins - order submissions and cancels jump the queue ahead of everything else
+PRIORITY = {
+    ORDERS: 0,
+    ACCOUNT: 1,
+    READS: 2,
+}
+
+# HTTP methods that change something at the broker
+WRITE_METHODS = ["POST", "PUT", "PATCH", "DELETE"]
+
+
+def endpoint_class_for_request(method: str, url: str) -> str:
+    """Which endpoint class an HTTP request to Alpaca or Swyftx is charged against
+
+    Metering happens per HTTP request rather than per ITradeAPI call, because most adapter calls
+    make more than one request - a Swyftx order submit is a POST and then a get_order,
+    close_position looks up the position before selling, list_orders pages and so on
+    """
+    path = urlparse(url).path.lower()
+    is_order_path = "/orders" in path
+    is_position_path = "/positions" in path
+
+    # submits, cancels, replaces and closing a position (alpaca DELETE /positions)
+    if method.upper() in WRITE_METHODS and (is_order_path or is_position_path):
+        return ORDERS
+
+    # order status checks and listing
+    if is_order_path:
+        return READS
+
+    # alpaca /account and /positions, swyftx /user/balance
+    if "/account" in path or is_position_path or "/user/balance" in path:
+        return ACCOUNT
+
+    # bars, exchange rates, asset lists
+    return READS
+
+
+# requests per second and burst size. "shared" is the broker's overall limit, the others are
+# per endpoint class. "reserve" is how many shared tokens reads and account calls have to leave
+# behind for orders, so a burst of status checks can never starve an order submission
+BROKER_LIMITS = {
+    "alpaca": {
+        # 200 requests per minute per account
+        "shared": {"rate": 200 / 60, "capacity": 20},
+        ORDERS: {"rate": 200 / 60, "capacity": 10},
+        ACCOUNT: {"rate": 1, "capacity": 5},
+        READS: {"rate": 2, "capacity": 10},
+        "reserve": 4,
+    },
+    "swyftx": {
+        "shared": {"rate": 1, "capacity": 10},
+        ORDERS: {"rate": 1, "capacity": 5},
+        ACCOUNT: {"rate": 0.5, "capacity": 3},
+        READS: {"rate": 0.75, "capacity": 5},
+        "reserve": 3,
+    },
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = now
+
+    def refill(self, now: float):
+        elapsed = now - self.last_refill
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.last_refill = now
+
+    def time_until(self, tokens: float, floor: float = 0) -> float:
+        # seconds until we could take tokens and still leave floor behind
+        shortfall = tokens + floor - self.tokens
+        if shortfall <= 0:
+            return 0
+        return shortfall / self.rate
+
+    def take(self, tokens: float):
+        self.tokens -= tokens
+
+
+class RateLimitGovernor:
+    """Paces calls to a single broker using a token bucket per endpoint class plus a shared bucket
+
+    clock and sleep are injectable so tests can drive it with a fake clock
+    """
+
+    # how long a lower priority caller backs off while a higher priority one is queued
+    PRIORITY_YIELD = 0.05
+
+    def __init__(self, broker_name: str, limits: dict, clock=time.monotonic, sleep=time.sleep):
+        self.broker_name = broker_name
+        self.clock = clock
+        self.sleep = sleep
+        self.reserve = limits.get("reserve", 0)
+
+        now = self.clock()
+        self._shared = TokenBucket(now=now, **limits["shared"])
+        self._buckets = {}
+        for endpoint_class in PRIORITY:
+            self._buckets[endpoint_class] = TokenBucket(now=now, **limits[endpoint_class])
+
+        self._lock = threading.Lock()
+        self._waiting = {endpoint_class: 0 for endpoint_class in PRIORITY}
+        self._metrics = {
+            endpoint_class: {"calls": 0, "throttled": 0, "total_wait": 0.0, "max_wait": 0.0}
+            for endpoint_class in PRIORITY
+        }
+
+    def _higher_priority_waiting(self, endpoint_class: str) -> bool:
+        for other_class, waiting in self._waiting.items():
+            if waiting > 0 and PRIORITY[other_class] < PRIORITY[endpoint_class]:
+                return True
+        return False
+
+    def _try_take(self, endpoint_class: str, tokens: float) -> float:
+        # returns 0 if the tokens were taken, otherwise how long to wait before trying again
+        now = self.clock()
+        self._shared.refill(now)
+        bucket = self._buckets[endpoint_class]
+        bucket.refill(now)
+
+        if self._higher_priority_waiting(endpoint_class):
+            return self.PRIORITY_YIELD
+
+        if endpoint_class == ORDERS:
+            floor = 0
+        else:
+            floor = self.reserve
+
+        wait = max(self._shared.time_until(tokens, floor), bucket.time_until(tokens))
+        if wait == 0:
+            self._shared.take(tokens)
+            bucket.take(tokens)
+        return wait
+
+    def acquire(self, endpoint_class: str, tokens: float = 1) -> float:
+        """Blocks until the call is allowed through, returns how long it waited"""
+        start = self.clock()
+        throttled = False
+
+        with self._lock:
+            self._waiting[endpoint_class] += 1
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_take(endpoint_class, tokens)
+                    if wait == 0:
+                        self._waiting[endpoint_class] -= 1
+                        break
+                throttled = True
+                self.sleep(wait)
+        except BaseException:
+            with self._lock:
+                self._waiting[endpoint_class] -= 1
+            raise
+
+        waited = self.clock() - start
+        with self._lock:
+            metrics = self._metrics[endpoint_class]
+            metrics["calls"] += 1
+            metrics["total_wait"] += waited
+            if waited > metrics["max_wait"]:
+                metrics["max_wait"] = waited
+            if throttled:
+                metrics["throttled"] += 1
+
+        if throttled:
+            log_wp.log(9, f"{self.broker_name}: {endpoint_class} call throttled for {waited:.3f}s")
+
+        return waited
+
+    def metrics(self) -> dict:
+        with self._lock:
+            report = {}
+            for endpoint_class, metrics in self._metrics.items():
+                report[endpoint_class] = metrics.copy()
+                if metrics["calls"] > 0:
+                    report[endpoint_class]["mean_wait"] = metrics["total_wait"] / metrics["calls"]
+                else:
+                    report[endpoint_class]["mean_wait"] = 0.0
+            return report
+
+
+def meter_session(session, governor: RateLimitGovernor):
+    """Makes every request sent through session wait on governor first
+
+    The broker adapters all send through their shared http_sessions session, so this catches
+    every request they make - including the ones an adapter makes internally. Calling it again
+    swaps in the new governor rather than stacking a second one on top
+    """
+    request = getattr(session, "_unmetered_request", session.request)
+
+    def metered_request(method, url, *args, **kwargs):
+        governor.acquire(endpoint_class_for_request(method, url))
+        return request(method, url, *args, **kwargs)
+
+    session._unmetered_request = request
+    session.request = metered_request
+    return session
+
+
+class RateLimitedAPI:
+    """An ITradeAPI whose HTTP session is metered by a RateLimitGovernor
+
+    Calls are passed straight through to the wrapped api - the limiting happens a layer down on
+    the session (see meter_session) - this just keeps hold of the governor for metrics
+    """
+
+    def __init__(self, api: ITradeAPI, governor: RateLimitGovernor):
+        self._api = api
+        self._governor = governor
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    @property
+    def wrapped_api(self) -> ITradeAPI:
+        return self._api
+
+    @property
+    def governor(self) -> RateLimitGovernor:
+        return self._governor
+
+
+def wrap_api(
+    api: ITradeAPI, limits: dict = None, clock=time.monotonic, sleep=time.sleep, session=None
+):
+    """Meters api's HTTP session with a governor using BROKER_LIMITS, or returns api untouched if
+    the broker has no limits
+
+    session defaults to the shared http_sessions session the api sends through (see
+    ITradeAPI.get_session_name)
+    """
+    broker_name = api.get_broker_name()
+    if limits is None:
+        limits = BROKER_LIMITS.get(broker_name)
+
+    if limits is None:
+        # back_test and anything else without published limits
+        return api
+
+    if session is None:
+        session = http_sessions.get_session(api.get_session_name())
+
+    governor = RateLimitGovernor(broker_name=broker_name, limits=limits, clock=clock, sleep=sleep)
+    meter_session(session, governor)
+    return RateLimitedAPI(api=api, governor=governor)
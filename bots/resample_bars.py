@@ -0,0 +1,287 @@
+# external packages
+from datetime import datetime
+import pandas as pd
+import pytz
+
+# my modules
+import log_setup
+import utils
+
+log_wp = log_setup.get_logger("resample_bars")
+
+# 1m bars are the source of truth - 5m/15m/30m get built from them here rather than each being
+# fetched (and stored) separately. buckets are labelled by their start, like yahoo's, and line up
+# with the session open in the exchange's own timezone so daylight saving doesn't shift them
+#
+#   resampler = BarResampler(session=resample_bars.session_for("AAPL"))
+#   resampler.update(new_1m_bars)       # only redoes buckets the new bars landed in
+#   resampler.get("5m")                 # closed buckets only
+#
+# or as a market_data_source (--derive_intervals), so every interval comes out of one 1m fetch:
+#
+#   source = ResampledMarketData(utils.YahooMarketData())
+#   source.Ticker("BTC-USD").history(start=start, interval="15m")
+
+BASE_INTERVAL = "1m"
+DERIVED_INTERVALS = ["5m", "15m", "30m"]
+AGGREGATIONS = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+# (timezone, session open) - buckets count from the open. crypto just counts from midnight UTC
+US_MARKET_SESSION = ("America/New_York", pd.Timedelta(hours=9, minutes=30))
+UTC_SESSION = ("UTC", pd.Timedelta(0))
+
+# a week of 1m bars - anything later than that doesn't get back into the derived bars
+DEFAULT_MAX_BASE_BARS = 60 * 24 * 7
+
+
+def session_for(symbol: str) -> tuple:
+    # same fast and loose rule as MacdWorker.get_market
+    if symbol[-4:] == "-USD":
+        return UTC_SESSION
+    return US_MARKET_SESSION
+
+
+def interval_delta(interval: str) -> pd.Timedelta:
+    return pd.Timedelta(minutes=utils.get_interval_integer(interval))
+
+
+def bucket_starts(index: pd.DatetimeIndex, interval: str, session: tuple = UTC_SESSION):
+    """The start of the interval bucket each timestamp falls in, in UTC"""
+    tz, session_open = session
+    local = index.tz_convert(tz)
+    # count from the session open on the local clock, so buckets move with daylight saving
+    day_start = local.normalize() + session_open
+    step = interval_delta(interval).value
+    offsets = (local - day_start).asi8 // step * step
+    return (day_start + pd.to_timedelta(offsets)).tz_convert("UTC")
+
+
+def resample(
+    bars: pd.DataFrame,
+    interval: str,
+    session: tuple = UTC_SESSION,
+    closed_only: bool = True,
+    now: pd.Timestamp = None,
+) -> pd.DataFrame:
+    """Builds interval bars from 1m bars. With closed_only, a bucket is left out until there's a
+    1m bar for its last minute (or a later bar, or now is past its end)"""
+    if len(bars) == 0:
+        return pd.DataFrame(columns=list(AGGREGATIONS), index=pd.DatetimeIndex([], tz="UTC"))
+
+    bars = bars.tz_convert("UTC") if bars.index.tz is not None else bars.tz_localize("UTC")
+    starts = bucket_starts(bars.index, interval, session)
+    resampled = bars[list(AGGREGATIONS)].groupby(starts).agg(AGGREGATIONS)
+    resampled.index.name = bars.index.name
+
+    if closed_only:
+        last_minute = bars.index[-1] + interval_delta(BASE_INTERVAL)
+        if now is not None:
+            last_minute = max(last_minute, now)
+        resampled = resampled.loc[resampled.index + interval_delta(interval) <= last_minute]
+
+    return resampled
+
+
+class BarResampler:
+    def __init__(
+        self,
+        intervals: list = None,
+        session: tuple = UTC_SESSION,
+        max_base_bars: int = DEFAULT_MAX_BASE_BARS,
+    ):
+        self.intervals = intervals or DERIVED_INTERVALS
+        self.session = session
+        self.max_base_bars = max_base_bars
+        self.base = None
+        self.derived = {}
+
+    def get(self, interval: str) -> pd.DataFrame:
+        if interval == BASE_INTERVAL:
+            return self.base
+        return self.derived.get(interval)
+
+    def update(self, new_bars: pd.DataFrame) -> dict:
+        """Merges in new 1m bars and rebuilds only the buckets from the earliest one they landed
+        in (or the earliest one that wasn't closed yet). Returns {interval: rebuilt bars}"""
+        if len(new_bars) == 0:
+            return {}
+        new_bars = new_bars[list(AGGREGATIONS)].tz_convert("UTC")
+
+        if self.base is None:
+            self.base = new_bars.sort_index()
+            first_new = self.base.index[0]
+        else:
+            # newer bars replace what we had - yahoo's last bar fills in as the minute goes on
+            self.base = pd.concat(
+                [self.base.loc[~self.base.index.isin(new_bars.index)], new_bars]
+            ).sort_index()
+            first_new = new_bars.index.min()
+        if self.max_base_bars is not None:
+            self.base = self.base.iloc[-self.max_base_bars :]
+
+        rebuilt = {}
+        for interval in self.intervals:
+            start = bucket_starts(pd.DatetimeIndex([first_new]), interval, self.session)[0]
+            derived = self.derived.get(interval)
+            if derived is not None and len(derived) > 0:
+                # the bucket after the last closed one might have closed since
+                start = min(start, derived.index[-1] + interval_delta(interval))
+
+            fresh = resample(self.base.loc[self.base.index >= start], interval, self.session)
+            if derived is not None:
+                fresh = pd.concat([derived.loc[derived.index < start], fresh])
+            self.derived[interval] = fresh
+            rebuilt[interval] = fresh.loc[fresh.index >= start]
+
+        return rebuilt
+
+
+class ResampledMarketData:
+    """A market_data_source that only ever asks its source for 1m bars, and builds whatever
+    interval is asked for out of them. Keeps a BarResampler per symbol so each fetch only has to
+    cover what's new"""
+
+    def __init__(self, source, max_base_bars: int = DEFAULT_MAX_BASE_BARS):
+        self.source = source
+        self.max_base_bars = max_base_bars
+        self.resamplers = {}
+
+    def Ticker(self, symbol: str):
+        return _ResampledTicker(self, symbol)
+
+    def history(self, symbol: str, start=None, interval: str = "5m", **kwargs) -> pd.DataFrame:
+        if interval != BASE_INTERVAL and interval not in DERIVED_INTERVALS:
+            raise ValueError(f"Can't build {interval} bars from {BASE_INTERVAL} bars")
+
+        resampler = self.resamplers.get(symbol)
+        if resampler is None:
+            resampler = BarResampler(session=session_for(symbol), max_base_bars=self.max_base_bars)
+            self.resamplers[symbol] = resampler
+
+        # yahoo only has the last few days of 1m bars
+        __, max_range = utils.get_interval_settings(BASE_INTERVAL)
+        oldest_start = datetime.now(pytz.utc) - max_range
+        fetch_start = _utc(start) if start is not None else oldest_start
+        if resampler.base is not None and len(resampler.base) > 0:
+            fetch_start = max(fetch_start, resampler.base.index[-1] - interval_delta(interval))
+        if fetch_start < oldest_start:
+            log_wp.warning(
+                f"{symbol}: 1m bars only go back to {oldest_start}, not {fetch_start} - saved bars "
+                f"will have to cover the rest"
+            )
+            fetch_start = oldest_start
+
+        new_bars = self.source.Ticker(symbol).history(
+            start=fetch_start, interval=BASE_INTERVAL, **kwargs
+        )
+        if len(new_bars) > 0:
+            resampler.update(new_bars)
+
+        bars = resampler.get(interval)
+        if bars is None:
+            return pd.DataFrame(columns=list(AGGREGATIONS), index=pd.DatetimeIndex([], tz="UTC"))
+        if start is not None:
+            bars = bars.loc[bars.index >= _utc(start)]
+        return bars.copy()
+
+
+class _ResampledTicker:
+    def __init__(self, market_data: ResampledMarketData, symbol: str):
+        self.market_data = market_data
+        self.symbol = symbol
+
+    def history(self, start=None, interval: str = "5m", **kwargs) -> pd.DataFrame:
+        return self.market_data.history(self.symbol, start=start, interval=interval, **kwargs)
+
+
+def _utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tz is None:
+        return timestamp.tz_localize(datetime.now().astimezone().tzinfo).tz_convert("UTC")
+    return timestamp.tz_convert("UTC")
+
+
+def save_derived_bars(symbols: list, bucket: str, key_base: str, intervals: list = None) -> bool:
+    """Builds each interval from the saved 1m bars ({key_base}1m/) and merges them into what's
+    already saved under {key_base}{interval}/ - older derived bars the 1m bars don't reach back
+    to are kept"""
+    intervals = intervals or DERIVED_INTERVALS
+    for symbol in symbols:
+        base_bars = utils.load_bars(symbol, bucket=bucket, key_base=f"{key_base}{BASE_INTERVAL}/")
+        if base_bars is None or len(base_bars) == 0:
+            log_wp.warning(f"{symbol}: No saved 1m bars to build intervals from - skipping")
+            continue
+        base_bars.index = pd.to_datetime(base_bars.index, utc=True)
+
+        for interval in intervals:
+            derived = resample(base_bars, interval, session_for(symbol))
+            if len(derived) == 0:
+                continue
+            # the first bucket may be missing minutes from before the 1m bars start
+            derived = derived.iloc[1:]
+
+            existing = utils.load_bars(symbol, bucket=bucket, key_base=f"{key_base}{interval}/")
+            if existing is not None and len(existing) > 0:
+                existing.index = pd.to_datetime(existing.index, utc=True)
+                existing = existing.loc[existing.index < derived.index[0], list(AGGREGATIONS)]
+                derived = pd.concat([existing, derived]).sort_index()
+
+            # signals get worked out again from scratch - the old ones near the join would be off
+            bars_with_signals = utils.add_signals(bars=derived, interval=interval)
+            if utils.upload_to_s3(
+                pickle=bars_with_signals.to_csv(),
+                bucket=bucket,
+                key_base=f"{key_base}{interval}/",
+                key=f"{symbol}.csv",
+            ):
+                log_wp.info(f"{symbol}: Saved {len(derived):,} {interval} bars built from 1m bars")
+            else:
+                log_wp.error(f"{symbol}: Failed to save {interval} bars")
+
+    return True
+
+
+def sync_derived_partitions(symbols: list, base, derived: dict):
+    """Builds the derived intervals' partitions ({interval: bar_partitions.PartitionedBars}) from
+    the base (1m) partitions. Only base partitions that have changed since the last sync - new
+    days, or ones that have had 1m bars backfilled - get resampled again"""
+    for symbol in symbols:
+        base_manifest = base.manifest(symbol)
+        if base_manifest is None:
+            log_wp.warning(f"{symbol}: No partitioned 1m bars to build intervals from - skipping")
+            continue
+        base_entries = base_manifest["partitions"]
+        base_first, base_last = base.date_range(symbol)
+        session = session_for(symbol)
+        # everything up to the last 1m bar is finished with
+        now = base_last + interval_delta(BASE_INTERVAL)
+
+        for interval, partitions in derived.items():
+            # which version of each base partition the derived bars were built from
+            sources = dict((partitions.manifest(symbol) or {}).get("sources", {}))
+            changed = [
+                entry
+                for entry in base_entries
+                if sources.get(entry["partition"]) != entry["version"]
+            ]
+            if len(changed) == 0:
+                continue
+
+            # buckets never straddle partitions - intervals divide a day, and sessions are in one
+            rebuilt = []
+            for entry in changed:
+                base_bars = base.read(symbol, start=entry["first"], end=entry["last"])
+                rebuilt.append(resample(base_bars, interval, session, now=now))
+                sources[entry["partition"]] = entry["version"]
+            rebuilt = pd.concat(rebuilt)
+
+            # the first bucket is missing minutes if the 1m bars start part way through it
+            first_bucket = bucket_starts(pd.DatetimeIndex([base_first]), interval, session)[0]
+            if first_bucket != base_first:
+                rebuilt = rebuilt.loc[rebuilt.index != first_bucket]
+
+            added = partitions.sync(symbol, rebuilt, replace=True, sources=sources)
+            log_wp.info(
+                f"{symbol}: Rebuilt {interval} bars from {len(changed)} 1m partitions - "
+                f"{added:,} new bars"
+            )
@@ -0,0 +1,185 @@
+# external packages
+from collections import deque
+from contextlib import contextmanager
+import time
+from typing import Callable
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("scheduler")
+
+# phases of a live cycle, in the order they happen
+FETCH = "fetch"
+SIGNALS = "signals"
+STATE_MACHINE = "state_machine"
+TELEMETRY = "telemetry"
+PERSISTENCE = "persistence"
+PHASES = [FETCH, SIGNALS, STATE_MACHINE, TELEMETRY, PERSISTENCE]
+
+# polling for a new bar starts fast and backs off - yahoo usually has the bar within a few
+# seconds of the close, but can take a minute or two
+DEFAULT_INITIAL_POLL = 2
+DEFAULT_MAX_POLL = 30
+DEFAULT_MAX_WAIT = 180
+DEFAULT_HISTORY = 288
+
+
+class CycleTimer:
+    """Wall clock time spent in each phase of one cycle
+
+    with cycle.phase(scheduler.FETCH):
+        ...
+    """
+
+    def __init__(self, clock: Callable = time.monotonic, bar_delay: float = None):
+        self.clock = clock
+        self.started = clock()
+        self.bar_delay = bar_delay
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + self.clock() - start
+
+    def elapsed(self) -> float:
+        return self.clock() - self.started
+
+
+class BarScheduler:
+    """Works out when the live loop should run next
+
+    Rather than sleeping to the next interval and then a fixed 90 seconds for Yahoo to catch up,
+    it sleeps to the bar close and then polls bar_ready with exponential backoff, so we act on a
+    new bar as soon as it shows up. It also keeps per-cycle phase timings and flags cycles that
+    take longer than the interval - when that happens the bars we slept through are skipped and
+    we go straight to waiting for the next close
+
+    clock and sleep are injectable so tests can drive it with a fake clock
+    """
+
+    def __init__(
+        self,
+        interval_seconds: int,
+        initial_poll: float = DEFAULT_INITIAL_POLL,
+        max_poll: float = DEFAULT_MAX_POLL,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        history: int = DEFAULT_HISTORY,
+        clock: Callable = time.time,
+        sleep: Callable = time.sleep,
+    ):
+        self.interval_seconds = interval_seconds
+        self.initial_poll = initial_poll
+        self.max_poll = max_poll
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+
+        self.cycles = deque(maxlen=history)
+        self.overruns = 0
+        self.skipped_bars = 0
+        self._last_bar_delay = None
+        self._cycle_bar_close = None
+
+    def next_bar_close(self, now: float = None) -> float:
+        if now is None:
+            now = self.clock()
+        return now - (now % self.interval_seconds) + self.interval_seconds
+
+    def _last_bar_close(self, now: float) -> float:
+        return now - (now % self.interval_seconds)
+
+    def start_cycle(self) -> CycleTimer:
+        self._cycle_bar_close = self._last_bar_close(self.clock())
+        return CycleTimer(clock=self.clock, bar_delay=self._last_bar_delay)
+
+    def finish_cycle(self, cycle: CycleTimer) -> dict:
+        now = self.clock()
+        total = cycle.elapsed()
+
+        # how many bar closes went past while we were busy
+        skipped = int((self._last_bar_close(now) - self._cycle_bar_close) // self.interval_seconds)
+        overran = total > self.interval_seconds or skipped > 0
+
+        record = {
+            "started": cycle.started,
+            "total": total,
+            "bar_delay": cycle.bar_delay,
+            "phases": dict(cycle.phases),
+            "overran": overran,
+            "skipped_bars": skipped,
+        }
+        self.cycles.append(record)
+
+        if overran:
+            self.overruns += 1
+            self.skipped_bars += skipped
+            log_wp.warning(
+                f"Cycle took {round(total,1)}s against an interval of {self.interval_seconds}s "
+                f"and missed {skipped} bar closes - skipping ahead to the next close. "
+                f"Phases: {self._format_phases(record['phases'])}"
+            )
+        else:
+            log_wp.log(
+                9,
+                f"Cycle took {round(total,1)}s, bar arrived {cycle.bar_delay}s after close. "
+                f"Phases: {self._format_phases(record['phases'])}",
+            )
+
+        return record
+
+    def _format_phases(self, phases: dict) -> str:
+        return ", ".join(f"{name}={round(seconds,2)}s" for name, seconds in phases.items())
+
+    def wait_for_bar(self, bar_ready: Callable) -> float:
+        """Sleeps until the next bar close, then polls bar_ready() until it returns True
+
+        Returns how many seconds after the close the bar turned up. Gives up after max_wait, since
+        markets that are shut (or a symbol that didn't trade) never produce a new bar
+        """
+        bar_close = self.next_bar_close()
+        pause = bar_close - self.clock()
+        if pause > 0:
+            log_wp.log(9, f"Sleeping {round(pause,1)}s until the next bar close")
+            self.sleep(pause)
+
+        poll = self.initial_poll
+        while not bar_ready():
+            waited = self.clock() - bar_close
+            if waited >= self.max_wait:
+                log_wp.warning(f"No new bar {round(waited,1)}s after close - carrying on anyway")
+                break
+            self.sleep(min(poll, self.max_wait - waited))
+            poll = min(poll * 2, self.max_poll)
+
+        self._last_bar_delay = round(self.clock() - bar_close, 3)
+        return self._last_bar_delay
+
+    def summary(self) -> dict:
+        """Mean and max seconds per phase over the recent cycles, plus overrun counts"""
+        phases = {}
+        for record in self.cycles:
+            for name, seconds in record["phases"].items():
+                phases.setdefault(name, []).append(seconds)
+
+        report = {
+            "cycles": len(self.cycles),
+            "overruns": self.overruns,
+            "skipped_bars": self.skipped_bars,
+            "phases": {},
+        }
+        for name, timings in phases.items():
+            report["phases"][name] = {
+                "mean": sum(timings) / len(timings),
+                "max": max(timings),
+            }
+
+        delays = [record["bar_delay"] for record in self.cycles if record["bar_delay"] is not None]
+        if delays:
+            report["bar_delay"] = {"mean": sum(delays) / len(delays), "max": max(delays)}
+
+        return report
@@ -0,0 +1,180 @@
+# external packages
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from pandas.arrays import DatetimeArray
+from pandas.core.internals import BlockManager, api as internals_api
+
+# my modules
+import log_setup
+
+log_wp = log_setup.get_logger("shared_bars")
+
+# one copy of every symbol's bars for all the processes in a back test pool, rather than each
+# worker getting its own pickled copy of the whole universe. the parent publishes each symbol's
+# columns once into multiprocessing.shared_memory blocks - the index, one 2-D block per dtype and
+# the codes for categorical (or string) columns - and hands the workers the small, picklable
+# handles. workers attach read only frames straight over those blocks, without copying them
+#
+#   with shared_bars.SharedBarRegistry() as registry:
+#       for symbol, bars in all_bars.items():
+#           registry.publish(symbol, bars)
+#       pool.map(run_back_test, [registry.handles] * workers)
+#
+#   # in the worker
+#   config.shared_bars = handles      # MacdWorker and BackTestAPI then use shared_bars.attach()
+#
+# only the registry that created the blocks unlinks them, when it's closed. attached frames are
+# read only - anything that needs to change bars has to copy them first
+
+
+class SharedBarsHandle:
+    """Where to find one symbol's bars in shared memory - what gets pickled to the workers"""
+
+    def __init__(
+        self,
+        symbol: str,
+        rows: int,
+        index_block: str,
+        tz: str,
+        index_name: str,
+        columns: list,
+        groups: list,
+        categories: list,
+    ):
+        self.symbol = symbol
+        self.rows = rows
+        self.index_block = index_block
+        self.tz = tz
+        self.index_name = index_name
+        self.columns = columns
+        # [(block name, dtype, [column positions])] - one 2-D block for each dtype
+        self.groups = groups
+        # [(block name, codes dtype, column position, categories)]
+        self.categories = categories
+
+    @property
+    def block_names(self) -> list:
+        names = [self.index_block] + [group[0] for group in self.groups]
+        return names + [category[0] for category in self.categories]
+
+
+class SharedBarRegistry:
+    def __init__(self):
+        self.handles = {}
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _new_block(self, values: np.ndarray) -> str:
+        # shared memory can't be 0 bytes
+        block = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        np.ndarray(values.shape, dtype=values.dtype, buffer=block.buf)[:] = values
+        self._blocks.append(block)
+        return block.name
+
+    def publish(self, symbol: str, bars: pd.DataFrame) -> SharedBarsHandle:
+        """Copies bars into shared memory, once. Strings (like macd_cycle) are stored as category
+        codes, and the index as UTC nanoseconds"""
+        index = bars.index
+        tz = str(index.tz) if index.tz is not None else None
+        if tz is not None:
+            index = index.tz_convert("UTC")
+
+        groups = {}
+        categories = []
+        for position, column in enumerate(bars.columns):
+            values = bars[column]
+            if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+                categorical = pd.Categorical(values)
+                categories.append(
+                    (
+                        self._new_block(categorical.codes),
+                        categorical.codes.dtype.str,
+                        position,
+                        list(categorical.categories),
+                    )
+                )
+            else:
+                groups.setdefault(values.dtype.str, []).append(position)
+
+        handle = SharedBarsHandle(
+            symbol=symbol,
+            rows=len(bars),
+            index_block=self._new_block(index.asi8),
+            tz=tz,
+            index_name=bars.index.name,
+            columns=list(bars.columns),
+            groups=[
+                (self._new_block(bars.iloc[:, positions].to_numpy().T.copy()), dtype, positions)
+                for dtype, positions in groups.items()
+            ],
+            categories=categories,
+        )
+        self.handles[symbol] = handle
+        log_wp.log(9, f"{symbol}: Published {len(bars):,} bars to shared memory")
+        return handle
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+        self.handles = {}
+
+
+# blocks and frames this process has attached to, so every worker in the process shares them
+_attached_blocks = {}
+_attached_frames = {}
+
+
+def _view(name: str, shape: tuple, dtype: str) -> np.ndarray:
+    if name not in _attached_blocks:
+        _attached_blocks[name] = shared_memory.SharedMemory(name=name)
+    view = np.ndarray(shape, dtype=np.dtype(dtype), buffer=_attached_blocks[name].buf)
+    view.flags.writeable = False
+    return view
+
+
+def attach(handle: SharedBarsHandle) -> pd.DataFrame:
+    """A read only frame over a symbol's shared bars. Nothing is copied"""
+    if handle.index_block in _attached_frames:
+        return _attached_frames[handle.index_block]
+
+    rows = handle.rows
+    index_values = _view(handle.index_block, (rows,), "<i8").view("M8[ns]")
+    index_dtype = pd.DatetimeTZDtype(tz=handle.tz) if handle.tz is not None else index_values.dtype
+    index = pd.DatetimeIndex(DatetimeArray(index_values, dtype=index_dtype), name=handle.index_name)
+
+    # build the frame's blocks ourselves - going through the DataFrame constructor would copy
+    blocks = [
+        internals_api.make_block(_view(name, (len(positions), rows), dtype), placement=positions)
+        for name, dtype, positions in handle.groups
+    ]
+    for name, dtype, position, categories in handle.categories:
+        categorical = pd.Categorical.from_codes(
+            _view(name, (rows,), dtype), dtype=pd.CategoricalDtype(categories)
+        )
+        blocks.append(internals_api.make_block(categorical, placement=[position], ndim=2))
+
+    frame = pd.DataFrame(BlockManager(blocks, [pd.Index(handle.columns), index]))
+    _attached_frames[handle.index_block] = frame
+    return frame
+
+
+def detach(handle: SharedBarsHandle):
+    """Lets go of a symbol's shared bars in this process. Frames from attach() can't be used
+    afterwards"""
+    _attached_frames.pop(handle.index_block, None)
+    for name in handle.block_names:
+        block = _attached_blocks.pop(name, None)
+        if block is not None:
+            try:
+                block.close()
+            except BufferError:
+                # something still has a view on it - it goes when that does
+                ...
@@ -1,4 +1,10 @@
+import sys
+
+import bar_gaps
+import bar_partitions
+import object_stores
 import utils
+import resample_bars
 import sample_symbols
 
 import warnings
@@ -12,7 +18,19 @@ symbols = []
 for s in the_symbols:
     symbols.append(s["symbol"])
 
-interval = "5m"
+# only 1m bars come from yahoo - 5m/15m/30m get built from the saved 1m bars
+interval = resample_bars.BASE_INTERVAL
 interval_delta, max_range = utils.get_interval_settings(interval)
 
-utils.save_bars(symbols=symbols, interval=interval, max_range=max_range, bucket="mfers-tabot", key_base=f"symbol_data/{interval}/")
\ No newline at end of file
+if "--partitioned" in sys.argv:
+    # daily partitions - each night only writes the days that got new bars
+    store = object_stores.S3ObjectStore("mfers-tabot")
+    base = bar_partitions.PartitionedBars(store, f"symbol_data/partitioned/{interval}/")
+    derived = {i: bar_partitions.PartitionedBars(store, f"symbol_data/partitioned/{i}/") for i in resample_bars.DERIVED_INTERVALS}
+
+    report = bar_gaps.backfill_bars(symbols=symbols, interval=interval, partitions=base)
+    print(report.to_string())
+    resample_bars.sync_derived_partitions(symbols=symbols, base=base, derived=derived)
+else:
+    utils.save_bars(symbols=symbols, interval=interval, max_range=max_range, bucket="mfers-tabot", key_base=f"symbol_data/{interval}/")
+    resample_bars.save_derived_bars(symbols=symbols, bucket="mfers-tabot", key_base="symbol_data/")
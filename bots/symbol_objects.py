@@ -1,12 +1,11 @@
-from numpy import NaN
 import logging
 import pandas as pd
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
-import yfinance as yf
 import pytz
 import time
 import utils
+import log_setup
 
 
 class SymbolAlreadyInCollectionError(Exception):
@@ -27,20 +26,11 @@ class SymbolCollection:
         self.interval_minutes = int(interval[:-1])
         self.interval_delta = relativedelta(minutes=self.interval_minutes)
         self.symbols = {}
+        self._panel = BarPanel()
         self._do_add_symbols(symbols)
 
     def _configure_logging(self, level):
-        log_wp = logging.getLogger("SymbolCollection")
-        hdlr = logging.StreamHandler()
-        fhdlr = logging.FileHandler(f"SymbolCollection.log")
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-        )
-        hdlr.setFormatter(formatter)
-        log_wp.addHandler(hdlr)
-        log_wp.addHandler(fhdlr)
-        log_wp.setLevel(level)
-        self.log_wp = log_wp
+        self.log_wp = log_setup.get_logger("SymbolCollection", level=level)
 
     def __contains__(self, symbol):
         return symbol in self.symbols.keys()
@@ -119,32 +109,97 @@ class SymbolCollection:
 
         return return_dict
 
-    def get_all(self, foward_fill: bool = True):
-        # first make a superset of the indexes
-        indexes = set()
+    def _update_panel(self):
         for k, s in self.symbols.items():
             s.refresh_cache()
-            this_index = set(s.bars.index)
-            indexes = indexes.union(this_index)
+        self._panel.update({k: s.bars for k, s in self.symbols.items()})
+        return self._panel
 
-        # now now make sure that each symbol has an index for every one of those superset of records
-        return_dict = {}
-        for k, s in self.symbols.items():
-            missing_indexes = indexes.symmetric_difference(s.bars.index)
-            self.log_wp.info(
-                f"Plugging {len(missing_indexes)} missing timestamp indexes for {k} using ffill"
-            )
+    def get_all(self, foward_fill: bool = True):
+        # every symbol's bars on the same index, with gaps forward filled
+        panel = self._update_panel()
+        return {k: panel.symbol_bars(k) for k in self.symbols}
+
+    def get_panel(self, column: str = "Close") -> pd.DataFrame:
+        """One column (eg. Close) of every symbol's aligned bars, as a timestamp x symbol frame"""
+        return self._update_panel().column(column)
+
+
+class BarPanel:
+    """Every symbol's bars on a single shared DatetimeIndex, forward filled, in one frame with
+    (symbol, column) columns
+
+    update() only redoes the rows from the earliest new bar onwards, as long as the symbols' bars
+    have only been added to since last time - otherwise it starts again from scratch
+    """
+
+    def __init__(self):
+        self.df = None
+        self._seen = {}
+
+    def update(self, bars_by_symbol: dict) -> bool:
+        """Brings the panel up to date with bars_by_symbol. Returns False if nothing changed"""
+        rebuild = self.df is None or list(bars_by_symbol) != list(self._seen)
+        changed_from = None
+
+        if not rebuild:
+            for symbol, bars in bars_by_symbol.items():
+                old_length, old_last = self._seen[symbol]
+                if len(bars) == old_length and bars.index[-1] == old_last:
+                    continue
+                if len(bars) < old_length or bars.index[old_length - 1] != old_last:
+                    rebuild = True
+                    break
+                first_new = bars.index[old_length]
+                if changed_from is None or first_new < changed_from:
+                    changed_from = first_new
+
+        if rebuild:
+            self._build(bars_by_symbol)
+        elif changed_from is not None:
+            self._extend(bars_by_symbol, changed_from)
+        else:
+            return False
 
-            # blank rows to insert into the symbol's bars so we can use ffill til plug the gaps
-            new_rows = pd.DataFrame(
-                [[NaN, NaN, NaN, NaN, NaN]], columns=s.bars.columns, index=missing_indexes
-            )
-            filled_bars = s.merge_bars(s.bars, new_rows)
-            filled_bars = filled_bars.fillna(method="ffill")
+        self._seen = {symbol: (len(bars), bars.index[-1]) for symbol, bars in bars_by_symbol.items()}
+        return True
 
-            return_dict[k] = filled_bars
+    def _build(self, bars_by_symbol: dict):
+        index = None
+        for bars in bars_by_symbol.values():
+            index = bars.index if index is None else index.union(bars.index)
 
-        return return_dict
+        self.df = pd.concat(
+            {symbol: bars.reindex(index) for symbol, bars in bars_by_symbol.items()}, axis=1
+        ).ffill()
+
+    def _extend(self, bars_by_symbol: dict, changed_from):
+        # rows before the first new bar can't have changed, so keep them and redo the rest
+        kept = self.df.loc[self.df.index < changed_from]
+
+        index = self.df.index[self.df.index >= changed_from]
+        new_bars = {}
+        for symbol, bars in bars_by_symbol.items():
+            new_bars[symbol] = bars.loc[bars.index >= changed_from]
+            index = index.union(new_bars[symbol].index)
+
+        tail = pd.concat(
+            {symbol: bars.reindex(index) for symbol, bars in new_bars.items()}, axis=1
+        ).reindex(columns=self.df.columns)
+
+        # carry the last kept row forward into the new rows
+        if len(kept) > 0:
+            tail = pd.concat([kept.iloc[-1:], tail]).ffill().iloc[1:]
+        else:
+            tail = tail.ffill()
+
+        self.df = pd.concat([kept, tail])
+
+    def symbol_bars(self, symbol: str) -> pd.DataFrame:
+        return self.df[symbol].copy()
+
+    def column(self, column: str) -> pd.DataFrame:
+        return self.df.xs(column, axis=1, level=1)
 
 
 class SymbolData:
@@ -189,18 +244,13 @@ class SymbolData:
             raise SymbolError(error_message)
 
     def _configure_logging(self, level):
-        logger = logging.getLogger(self.yf_symbol)  # or pass an explicit name here, e.g. "mylogger"
-        log_wp = logging.LoggerAdapter(logger)
-        hdlr = logging.StreamHandler()
-        fhdlr = logging.FileHandler(f"symbol_objects_{self.yf_symbol}.log")
-        formatter = logging.Formatter(
-            "%(asctime)s - %(name)9s - %(levelname)s - %(funcName)20s - %(message)s"
+        logger = log_setup.get_logger(
+            self.yf_symbol,
+            level=level,
+            log_file=f"symbol_objects_{self.yf_symbol}.log",
+            log_format="%(asctime)s - %(name)9s - %(levelname)s - %(funcName)20s - %(message)s",
         )
-        hdlr.setFormatter(formatter)
-        logger.addHandler(hdlr)
-        logger.addHandler(fhdlr)
-        logger.setLevel(level)
-        self.log_wp = log_wp
+        self.log_wp = logging.LoggerAdapter(logger)
 
     def __repr__(self):
         return self.yf_symbol
@@ -285,7 +335,7 @@ class SymbolData:
 
             # self.log_wp.debug(f"Cache miss")
             self.log_wp.debug(f"  - pulling from yf from {yf_start}")
-            new_bars = yf.Ticker(self.yf_symbol).history(
+            new_bars = utils.YahooMarketData().Ticker(self.yf_symbol).history(
                 start=yf_start,
                 interval=self.interval,
                 actions=False,
@@ -0,0 +1,123 @@
+# external packages
+import numpy as np
+import pandas as pd
+
+# my modules
+import utils
+
+# seeded, reproducible OHLC bars for benchmarks and tests. prices are a random walk with a
+# slow drift, with a few overlapping sine waves on top so MACD crosses its signal line every
+# cycle_bars or so - both above and below zero, which is what the buy signal looks for
+#
+#   bars = synthetic_bars.make_bars(symbols=10, bars=5000, seed=1)
+#   bars["SYM0-USD"]
+
+DEFAULT_START = "2022-01-03"
+DEFAULT_CYCLE_BARS = 120
+DEFAULT_VOLATILITY = 0.0015
+
+
+def symbol_names(count: int) -> list:
+    return [f"SYM{i}-USD" for i in range(count)]
+
+
+def make_symbol_bars(
+    rng: np.random.Generator,
+    bars: int,
+    index: pd.DatetimeIndex,
+    start_price: float = 100,
+    cycle_bars: int = DEFAULT_CYCLE_BARS,
+    volatility: float = DEFAULT_VOLATILITY,
+) -> pd.DataFrame:
+    steps = np.arange(bars)
+
+    # the random walk, with a drift that changes every ~1000 bars so the 200 SMA trends both ways
+    drift_changes = rng.normal(0, 0.0002, size=bars // 1000 + 1)
+    drift = np.repeat(drift_changes, 1000)[:bars]
+    walk = np.cumsum(rng.normal(0, volatility, size=bars) + drift)
+
+    # cycles - one main one at cycle_bars plus a shorter and a longer one, with random phases
+    cycles = np.zeros(bars)
+    for period_ratio, amplitude in [(1, 0.012), (0.37, 0.004), (3.1, 0.02)]:
+        period = cycle_bars * period_ratio * rng.uniform(0.85, 1.15)
+        phase = rng.uniform(0, 2 * np.pi)
+        cycles += amplitude * np.sin(2 * np.pi * steps / period + phase)
+
+    close = start_price * np.exp(walk + cycles)
+    open_ = np.concatenate([[start_price], close[:-1]])
+
+    # wicks stick out past the body by a bit of noise
+    wick = np.abs(rng.normal(0, volatility / 2, size=(2, bars)))
+    high = np.maximum(open_, close) * (1 + wick[0])
+    low = np.minimum(open_, close) * (1 - wick[1])
+    volume = rng.integers(1000, 100000, size=bars).astype(float)
+
+    return pd.DataFrame(
+        {"Open": open_, "High": high, "Low": low, "Close": close, "Volume": volume},
+        index=index,
+    )
+
+
+def make_bars(
+    symbols: int = 1,
+    bars: int = 2000,
+    interval: str = "5m",
+    seed: int = 42,
+    start: str = DEFAULT_START,
+    cycle_bars: int = DEFAULT_CYCLE_BARS,
+    volatility: float = DEFAULT_VOLATILITY,
+) -> dict:
+    """{symbol: bars} for symbols made up symbols, all on the same UTC index
+
+    The same arguments always give the same bars
+    """
+    rng = np.random.default_rng(seed)
+    interval_minutes = utils.get_interval_integer(interval)
+    index = pd.date_range(start, periods=bars, freq=f"{interval_minutes}min", tz="UTC")
+
+    all_bars = {}
+    for symbol in symbol_names(symbols):
+        start_price = rng.uniform(5, 500)
+        all_bars[symbol] = make_symbol_bars(
+            rng=rng,
+            bars=bars,
+            index=index,
+            start_price=start_price,
+            cycle_bars=cycle_bars,
+            volatility=volatility,
+        )
+
+    return all_bars
+
+
+class SyntheticMarketData:
+    """Stands in for yfinance as MacdConfig.market_data_source, serving bars from make_bars"""
+
+    def __init__(self, all_bars: dict):
+        self.all_bars = all_bars
+
+    def Ticker(self, symbol: str):
+        return _SyntheticTicker(self.all_bars.get(symbol))
+
+
+class _SyntheticTicker:
+    def __init__(self, bars: pd.DataFrame):
+        self.bars = bars
+
+    def history(self, start=None, end=None, interval=None, actions=False, debug=False, **kwargs):
+        if self.bars is None:
+            return pd.DataFrame(columns=["Open", "High", "Low", "Close", "Volume"])
+
+        bars = self.bars
+        if start is not None:
+            bars = bars.loc[bars.index >= _to_utc(start)]
+        if end is not None:
+            bars = bars.loc[bars.index < _to_utc(end)]
+        return bars
+
+
+def _to_utc(timestamp) -> pd.Timestamp:
+    timestamp = pd.Timestamp(timestamp)
+    if timestamp.tzinfo is None:
+        return timestamp.tz_localize("UTC")
+    return timestamp.tz_convert("UTC")
@@ -23,31 +23,29 @@
 
 # external packages
 import argparse
+import asyncio
 from datetime import datetime
-import logging
 import pytz
-import time
 
 # my modules
-from macd import MacdBot
-from macd_config import MacdConfig
+import log_setup
+import play_logs
+import profiling
+import http_sessions
 import sample_symbols
-import utils
+import scheduler
 
 
-log_wp = logging.getLogger("tabot")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("tabot.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("tabot")
 
 
 def main(args):
+    # the engine pulls in pandas, btalib and friends - not worth paying for just to print --help
+    # or complain about an argument
+    from macd import MacdBot
+    from macd_config import MacdConfig
+    import utils
+
     # shut this thing down if the user doesn't acknowledge
     if args.run_type == "prod":
         print("****************************")
@@ -62,8 +60,22 @@ def main(args):
 
     run_id = utils.generate_id()
     config = MacdConfig(args=args)
+    # back tests drop sub INFO logging unless --log_levels asks for it
+    log_setup.configure(
+        back_testing=config.back_testing, levels=log_setup.parse_levels(args.log_levels)
+    )
     symbols = sample_symbols.input_symbols[args.symbols]
 
+    # back tests keep play logs local rather than sending them to CloudWatch
+    if config.back_testing:
+        play_logs.set_writer(
+            play_logs.PlayLogWriter(sink=play_logs.LocalSink(directory=config.play_log_path))
+        )
+
+    # has to be on before MacdBot is built so broker and store calls get wrapped
+    if args.profile:
+        profiling.enable(dump_interval=int(args.profile_interval), dump_path=args.profile_path)
+
     log_wp.debug(
         f"Starting up run ID {run_id}: interval={config.interval}, run_type={config.run_type}"
     )
@@ -81,119 +93,254 @@ def main(args):
         # no loop needed
         # TODO i think i can nest this into the while, avoid duplicating code
         bot_handler.process_bars()
+        if profiling.is_enabled():
+            profiling.dump()
 
         bot_handler.bot_telemetry.generate_df()
-        utils.upload_to_s3(
-            bucket=config.telemetry_s3_bucket,
-            key_base=f"{config.telemetry_s3_prefix}/",
-            key=f"{run_id}_plays.csv",
-            pickle=bot_handler.bot_telemetry.plays_df.to_csv(),
-        )
-        utils.upload_to_s3(
-            bucket=config.telemetry_s3_bucket,
-            key_base=f"{config.telemetry_s3_prefix}/",
-            key=f"{run_id}_orders.csv",
-            pickle=bot_handler.bot_telemetry.orders_df.to_csv(),
-        )
-        utils.upload_to_s3(
-            bucket=config.telemetry_s3_bucket,
-            key_base=f"{config.telemetry_s3_prefix}/",
-            key=f"{run_id}_symbols.csv",
-            pickle=bot_handler.bot_telemetry.symbols_df.to_csv(),
-        )
+        telemetry = {
+            "plays": bot_handler.bot_telemetry.plays_df,
+            "orders": bot_handler.bot_telemetry.orders_df,
+            "symbols": bot_handler.bot_telemetry.symbols_df,
+        }
+        for name, df in telemetry.items():
+            if config.telemetry_path:
+                df.to_csv(f"{config.telemetry_path}/{run_id}_{name}.csv")
+            else:
+                utils.upload_to_s3(
+                    bucket=config.telemetry_s3_bucket,
+                    key_base=f"{config.telemetry_s3_prefix}/",
+                    key=f"{run_id}_{name}.csv",
+                    pickle=df.to_csv(),
+                )
         print("banana")
 
     else:
         last_orders_df = []
+        bar_scheduler = scheduler.BarScheduler(
+            interval_seconds=utils.get_interval_in_seconds(config.interval)
+        )
         while True:
+            cycle = bar_scheduler.start_cycle()
+
             # do heartbeating
-            config.store.put(path=config.heartbeat, value=str(datetime.now().astimezone(pytz.utc)))
+            with cycle.phase(scheduler.PERSISTENCE):
+                config.store.put(
+                    path=config.heartbeat, value=str(datetime.now().astimezone(pytz.utc))
+                )
 
             # process data
-            bot_handler.process_bars()
+            if config.async_processing:
+                asyncio.run(bot_handler.process_bars_async(cycle=cycle))
+            else:
+                bot_handler.process_bars(cycle=cycle)
 
             # update report and if its changed upload it to S3
-            bot_handler.bot_telemetry.generate_df()
+            with cycle.phase(scheduler.TELEMETRY):
+                bot_handler.bot_telemetry.generate_df()
             new_orders_df = bot_handler.bot_telemetry.orders_df
             if len(new_orders_df) != len(last_orders_df):
-                utils.upload_to_s3(
-                    bucket=config.telemetry_s3_bucket,
-                    key_base=f"{config.telemetry_s3_prefix}/",
-                    key=f"{run_id}_plays.csv",
-                    pickle=bot_handler.bot_telemetry.plays_df.to_json(),
-                )
-                utils.upload_to_s3(
-                    bucket=config.telemetry_s3_bucket,
-                    key_base=f"{config.telemetry_s3_prefix}/",
-                    key=f"{run_id}_orders.csv",
-                    pickle=bot_handler.bot_telemetry.orders_df.to_json(),
-                )
-                utils.upload_to_s3(
-                    bucket=config.telemetry_s3_bucket,
-                    key_base=f"{config.telemetry_s3_prefix}/",
-                    key=f"{run_id}_symbols.csv",
-                    pickle=bot_handler.bot_telemetry.symbols_df.to_csv(),
-                )
+                with cycle.phase(scheduler.PERSISTENCE):
+                    utils.upload_to_s3(
+                        bucket=config.telemetry_s3_bucket,
+                        key_base=f"{config.telemetry_s3_prefix}/",
+                        key=f"{run_id}_plays.csv",
+                        pickle=bot_handler.bot_telemetry.plays_df.to_json(),
+                    )
+                    utils.upload_to_s3(
+                        bucket=config.telemetry_s3_bucket,
+                        key_base=f"{config.telemetry_s3_prefix}/",
+                        key=f"{run_id}_orders.csv",
+                        pickle=bot_handler.bot_telemetry.orders_df.to_json(),
+                    )
+                    utils.upload_to_s3(
+                        bucket=config.telemetry_s3_bucket,
+                        key_base=f"{config.telemetry_s3_prefix}/",
+                        key=f"{run_id}_symbols.csv",
+                        pickle=bot_handler.bot_telemetry.symbols_df.to_csv(),
+                    )
 
             last_orders_df = new_orders_df
 
-            # and now sleep til the next interval
+            bar_scheduler.finish_cycle(cycle)
+
+            # and now wait for the next bar to turn up
             start, end = bot_handler.get_date_range()
-            pause = utils.get_pause(config.interval)
-            log_wp.debug(f"Finished analysing {end}, sleeping for {round(pause,0)}s")
-            time.sleep(pause)
+            log_wp.debug(f"Finished analysing {end}, waiting for the next bar")
+            log_wp.debug(f"HTTP connection reuse: {http_sessions.connection_stats()}")
+            log_wp.debug(f"Broker rate limit waits: {bot_handler.get_rate_limit_metrics()}")
+            log_wp.debug(f"Cycle timings: {bar_scheduler.summary()}")
+            log_wp.debug(f"Play log writer: {play_logs.get_writer().stats()}")
+            bar_delay = bar_scheduler.wait_for_bar(bot_handler.new_bar_available)
+            log_wp.debug(f"New bar arrived {bar_delay}s after close")
 
     print("banana")
 
 
-parser = argparse.ArgumentParser(description="TA bot orchestrator")
-# parser.add_argument("--back_testing", default=True, help="Back testing toggle")
-parser.add_argument(
-    "--back_testing_balance", default=100000, help="Starting balance when back testing"
-)
-parser.add_argument(
-    "--back_testing_override_broker",
-    action=argparse.BooleanOptionalAction,
-    default=False,
-    help="Use paper API when backtesting. Don't do this",
-)
-parser.add_argument(
-    "--back_testing_skip_bar_update",
-    action=argparse.BooleanOptionalAction,
-    default=False,
-    help="TA bot orchestrator will attempt to download saved bars from S3 and then update them "
-    "with the latest from Yahoo Finance. Setting this to False will prevent the update",
-)
-parser.add_argument(
-    "--interval",
-    default="5m",
-    choices=["1m", "5m", "30m"],
-    help="Intervals between executions/data resolution",
-)
-
-parser.add_argument(
-    "--notification_service",
-    default="slack",
-    choices=["pushover", "slack"],
-    help="Send notifications using this service",
-)
-parser.add_argument(
-    "--symbols",
-    default="crypto_symbols_all",
-    choices=list(sample_symbols.input_symbols.keys()),
-)
-parser.add_argument(
-    "--run_type",
-    default="paper",
-    choices=list(["prod", "paper", "back_test"]),
-)
-parser.add_argument(
-    "--buy_market",
-    action=argparse.BooleanOptionalAction,
-    default=False,
-)
-
-args = parser.parse_args()
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="TA bot orchestrator")
+    # parser.add_argument("--back_testing", default=True, help="Back testing toggle")
+    parser.add_argument(
+        "--back_testing_balance", default=100000, help="Starting balance when back testing"
+    )
+    parser.add_argument(
+        "--back_testing_override_broker",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Use paper API when backtesting. Don't do this",
+    )
+    parser.add_argument(
+        "--back_testing_skip_bar_update",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="TA bot orchestrator will attempt to download saved bars from S3 and then update them "
+        "with the latest from Yahoo Finance. Setting this to False will prevent the update",
+    )
+    parser.add_argument(
+        "--parameters_file",
+        default=None,
+        help="JSON file of {parameter path: value} to use instead of SSM when back testing, eg. "
+        '{"/tabot/order_size": "1000"}',
+    )
+    parser.add_argument(
+        "--bars_path",
+        default=None,
+        help="Back test from {symbol}.csv files in this directory instead of S3. Implies "
+        "--back_testing_skip_bar_update",
+    )
+    parser.add_argument(
+        "--telemetry_path",
+        default=None,
+        help="Write back test results to this directory instead of S3",
+    )
+    parser.add_argument(
+        "--play_log_path",
+        default=None,
+        help="Append back test play logs to {play_id}.log files in this directory",
+    )
+    parser.add_argument(
+        "--partitioned_bars",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Read saved bars from daily partitions (see bar_partitions) - from S3, or from "
+        "--bars_path if it's set",
+    )
+    parser.add_argument(
+        "--bars_start",
+        default=None,
+        help="With --partitioned_bars, back test from this date (UTC) - only the partitions from "
+        "then on (plus a few before, for the signals to warm up) are read",
+    )
+    parser.add_argument(
+        "--bars_end",
+        default=None,
+        help="With --partitioned_bars, back test up to this date (UTC)",
+    )
+    parser.add_argument(
+        "--archive_path",
+        default=None,
+        help="Back test from a bar_archive in this directory, paging through it rather than "
+        "loading every bar at once",
+    )
+    parser.add_argument(
+        "--archive_chunk_bars",
+        default=None,
+        help="Bars per symbol to hold in memory at a time when using --archive_path (10000)",
+    )
+    parser.add_argument(
+        "--interval",
+        default="5m",
+        choices=["1m", "5m", "15m", "30m"],
+        help="Intervals between executions/data resolution",
+    )
+    parser.add_argument(
+        "--derive_intervals",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Only fetch 1m bars from the market data source and build --interval bars from them",
+    )
+
+    parser.add_argument(
+        "--notification_service",
+        default="slack",
+        choices=["pushover", "slack"],
+        help="Send notifications using this service",
+    )
+    parser.add_argument(
+        "--symbols",
+        default="crypto_symbols_all",
+        choices=list(sample_symbols.input_symbols.keys()),
+    )
+    parser.add_argument(
+        "--run_type",
+        default="paper",
+        choices=list(["prod", "paper", "back_test"]),
+    )
+    parser.add_argument(
+        "--buy_market",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+    )
+    parser.add_argument(
+        "--profit_target",
+        default=None,
+        help="Take profit at this multiple of the stop loss distance. Defaults to 1.5 - see "
+        "walk_forward for picking one",
+    )
+    parser.add_argument(
+        "--async_processing",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Fetch bars and run each symbol's state machine concurrently when running live",
+    )
+    parser.add_argument(
+        "--max_concurrency",
+        default=8,
+        help="Maximum number of symbols fetched/processed at once when using --async_processing",
+    )
+    parser.add_argument(
+        "--max_bars",
+        default=None,
+        help="Bars (and signals) each symbol keeps in memory when running live. Defaults to "
+        "1000, back tests always keep everything",
+    )
+    parser.add_argument(
+        "--compact_bars",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Keep bars in smaller dtypes (categorical macd_cycle, bool flags) and log how much "
+        "memory they use",
+    )
+    parser.add_argument(
+        "--float32_bars",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Keep prices and indicators as float32 (within about 1e-6 of float64). Implies "
+        "--compact_bars",
+    )
+    parser.add_argument(
+        "--profile",
+        action=argparse.BooleanOptionalAction,
+        default=False,
+        help="Time the state machine, bar updates, signals, broker and store calls",
+    )
+    parser.add_argument(
+        "--profile_interval",
+        default=300,
+        help="Seconds between profiling dumps",
+    )
+    parser.add_argument(
+        "--profile_path",
+        default=None,
+        help="Also write each profiling dump to this JSON file",
+    )
+    parser.add_argument(
+        "--log_levels",
+        default=None,
+        help="Per module log levels, eg. macd_worker=INFO,backtest_api=WARNING",
+    )
+
+    return parser
+
 
 if __name__ == "__main__":
-    main(args)
+    main(build_parser().parse_args())
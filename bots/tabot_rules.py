@@ -1,24 +1,16 @@
 # external packages
 import json
 import pandas as pd
+import threading
 import utils
 
 # my modules
+import log_setup
 from buyplan import BuyPlan
 from iparameter_store import IParameterStore
 from itradeapi import IOrderResult
-import logging
 
-log_wp = logging.getLogger("tabot_rules")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("tabot_rules.log")
-log_wp.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(fhdlr)
-log_wp.addHandler(hdlr)
+log_wp = log_setup.get_logger("tabot_rules")
 
 
 class TABotRules:
@@ -26,6 +18,9 @@ class TABotRules:
         self.store = store
         self.rules_path = rules_path
         self.state_path = state_path
+        # every change is a read-modify-write of the whole rules/state blob, so concurrent
+        # symbols (MacdBot.process_bars_async) have to take turns or they overwrite each other
+        self._lock = threading.RLock()
 
     # STATE AND RULE FUNCTIONS
     def get_state(self, symbol: str):
@@ -47,120 +42,124 @@ class TABotRules:
 
     # writes the symbol to state
     def write_to_state(self, new_state: dict):
-        symbol = new_state["symbol"]
-        broker = new_state["broker"]
-        stored_state = self.get_state_all()
-        state_to_write = []
+        with self._lock:
+            symbol = new_state["symbol"]
+            broker = new_state["broker"]
+            stored_state = self.get_state_all()
+            state_to_write = []
 
-        for this_state in stored_state:
-            # needs to match broker and symbol
-            s_symbol = this_state["symbol"]
-            s_broker = this_state["broker"]
+            for this_state in stored_state:
+                # needs to match broker and symbol
+                s_symbol = this_state["symbol"]
+                s_broker = this_state["broker"]
 
-            # no need for validation - its done in stock_symbol since rules has no access to API to query
-            if s_symbol == symbol and s_broker == broker:
-                log_wp.error(f"{symbol} ({broker}): Found this symbol in state already!")
+                # no need for validation - its done in stock_symbol since rules has no access to API to query
+                if s_symbol == symbol and s_broker == broker:
+                    log_wp.error(f"{symbol} ({broker}): Found this symbol in state already!")
 
-            else:
-                # it's not the state we're looking for so keep it
-                state_to_write.append(this_state)
+                else:
+                    # it's not the state we're looking for so keep it
+                    state_to_write.append(this_state)
 
-        state_to_write.append(new_state)
+            state_to_write.append(new_state)
 
-        self.put_stored_state(new_state=state_to_write)
+            self.put_stored_state(new_state=state_to_write)
 
-        log_wp.log(9, f"{symbol}: Successfully wrote order to state")
+            log_wp.log(9, f"{symbol}: Successfully wrote order to state")
 
     # removes this symbol from the state
     def remove_from_state(self, symbol: str, broker: str):
-        stored_state = self.get_state_all()
-        found_in_state = False
+        with self._lock:
+            stored_state = self.get_state_all()
+            found_in_state = False
+
+            new_state = []
+
+            for this_state in stored_state:
+                # needs to match broker and symbol
+                s_symbol = this_state["symbol"]
+                s_broker = this_state["broker"]
+                if s_symbol == symbol and s_broker == broker:
+                    found_in_state = True
+                else:
+                    # it's not the state we're looking for so keep it
+                    new_state.append(this_state)
 
-        new_state = []
+            self.put_stored_state(new_state=new_state)
 
-        for this_state in stored_state:
-            # needs to match broker and symbol
-            s_symbol = this_state["symbol"]
-            s_broker = this_state["broker"]
-            if s_symbol == symbol and s_broker == broker:
-                found_in_state = True
+            if found_in_state:
+                log_wp.log(9, f"{symbol}: Successfully wrote updated state")
+                return True
             else:
-                # it's not the state we're looking for so keep it
-                new_state.append(this_state)
-
-        self.put_stored_state(new_state=new_state)
-
-        if found_in_state:
-            log_wp.log(9, f"{symbol}: Successfully wrote updated state")
-            return True
-        else:
-            log_wp.warning(f"{symbol}: Tried to remove symbol from state but did not find it")
-            return False
+                log_wp.warning(f"{symbol}: Tried to remove symbol from state but did not find it")
+                return False
 
     # replaces the rule for this symbol
     def replace_rule(self, new_rule: dict, symbol: str):
-        stored_rules = self.get_rules()
+        with self._lock:
+            stored_rules = self.get_rules()
 
-        new_rules = []
+            new_rules = []
 
-        for rule in stored_rules:
-            if rule["symbol"] == symbol:
-                new_rules.append(new_rule)
-            else:
-                new_rules.append(rule)
+            for rule in stored_rules:
+                if rule["symbol"] == symbol:
+                    new_rules.append(new_rule)
+                else:
+                    new_rules.append(rule)
 
-        write_result = self.put_rules(symbol=symbol, new_rules=new_rules)
+            write_result = self.put_rules(symbol=symbol, new_rules=new_rules)
 
-        return write_result
+            return write_result
 
     # adds sybol to rules - will barf if one already exists
     def write_to_rules(self, buy_plan: BuyPlan, order_result: IOrderResult):
-        stored_rules = self.get_rules()
+        with self._lock:
+            stored_rules = self.get_rules()
 
-        new_rules = []
+            new_rules = []
 
-        for this_state in stored_rules:
-            s_symbol = this_state["symbol"]
-            if s_symbol == order_result.symbol:
-                raise ValueError(
-                    f"Tried to add {order_result.symbol} rules, but it already existed"
-                )
-            else:
-                # it's not the state we're looking for so keep it
-                new_rules.append(this_state)
-
-        # if we got here, the symbol does not exist in rules so we are okay to add it
-        new_rule = {
-            "symbol": buy_plan.symbol,  #
-            "play_id": buy_plan.play_id,  #
-            "original_stop_loss": buy_plan.stop_unit,  #
-            "current_stop_loss": buy_plan.stop_unit,  #
-            "original_target_price": buy_plan.target_price,  #
-            "current_target_price": buy_plan.target_price,  #
-            "steps": 0,
-            "original_risk": buy_plan.risk_unit,
-            "current_risk": buy_plan.risk_unit,
-            "purchase_date": buy_plan.blue_cycle_start,
-            "purchase_price": order_result.filled_unit_price,
-            "units_held": order_result.filled_unit_quantity,
-            "units_sold": 0,
-            "units_bought": order_result.filled_unit_quantity,
-            "order_id": order_result.order_id,
-            "sales": [],
-            "win_point_sell_down_pct": 0.75,
-            "win_point_new_stop_loss_pct": 0.995,
-            "risk_point_sell_down_pct": 0.5,
-            "risk_point_new_stop_loss_pct": 0.99,
-        }
-
-        new_rules.append(new_rule)
-
-        self.put_rules(
-            symbol=buy_plan.symbol,
-            new_rules=new_rules,
-        )
-
-        log_wp.log(9, f"{buy_plan.symbol}: Successfully wrote new buy order to rules")
+            for this_state in stored_rules:
+                s_symbol = this_state["symbol"]
+                if s_symbol == order_result.symbol:
+                    raise ValueError(
+                        f"Tried to add {order_result.symbol} rules, but it already existed"
+                    )
+                else:
+                    # it's not the state we're looking for so keep it
+                    new_rules.append(this_state)
+
+            # if we got here, the symbol does not exist in rules so we are okay to add it
+            new_rule = {
+                "symbol": buy_plan.symbol,  #
+                "play_id": buy_plan.play_id,  #
+                "original_stop_loss": buy_plan.stop_unit,  #
+                "current_stop_loss": buy_plan.stop_unit,  #
+                "original_target_price": buy_plan.target_price,  #
+                "current_target_price": buy_plan.target_price,  #
+                "steps": 0,
+                "original_risk": buy_plan.risk_unit,
+                "current_risk": buy_plan.risk_unit,
+                "purchase_date": buy_plan.blue_cycle_start,
+                "purchase_price": order_result.filled_unit_price,
+                "units_held": order_result.filled_unit_quantity,
+                "units_sold": 0,
+                "units_bought": order_result.filled_unit_quantity,
+                "order_id": order_result.order_id,
+                "sales": [],
+                "win_point_sell_down_pct": 0.75,
+                "win_point_new_stop_loss_pct": 0.995,
+                "risk_point_sell_down_pct": 0.5,
+                "risk_point_new_stop_loss_pct": 0.99,
+            }
+
+            new_rules.append(new_rule)
+
+            self.put_rules(
+                symbol=buy_plan.symbol,
+                new_rules=new_rules,
+            )
+
+            log_wp.log(9, f"{buy_plan.symbol}: Successfully wrote new buy order to rules")
 
     # gets rule for this symbol
     def get_rule(self, symbol: str):
@@ -174,28 +173,29 @@ class TABotRules:
 
     # removes the symbol from the buy rules in store
     def remove_from_rules(self, symbol: str):
-        stored_state = self.get_rules()
-        found_in_rules = False
+        with self._lock:
+            stored_state = self.get_rules()
+            found_in_rules = False
 
-        new_rules = []
+            new_rules = []
 
-        for this_rule in stored_state:
-            if this_rule["symbol"] == symbol:
-                found_in_rules = True
-            else:
-                # not the rule we're looking to remove, so retain it
-                new_rules.append(this_rule)
+            for this_rule in stored_state:
+                if this_rule["symbol"] == symbol:
+                    found_in_rules = True
+                else:
+                    # not the rule we're looking to remove, so retain it
+                    new_rules.append(this_rule)
 
-        if found_in_rules:
-            self.put_rules(
-                symbol=symbol,
-                new_rules=new_rules,
-            )
-            log_wp.log(9, f"{symbol}: Successfully wrote updated rules")
-            return True
-        else:
-            log_wp.warning(f"{symbol}: Tried to remove symbol from rules but did not find it")
-            return False
+            if found_in_rules:
+                self.put_rules(
+                    symbol=symbol,
+                    new_rules=new_rules,
+                )
+                log_wp.log(9, f"{symbol}: Successfully wrote updated rules")
+                return True
+            else:
+                log_wp.warning(f"{symbol}: Tried to remove symbol from rules but did not find it")
+                return False
 
     def validate_rule(rule: dict):
         required_keys = [
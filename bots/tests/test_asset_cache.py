@@ -0,0 +1,81 @@
+import pytest
+import asset_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def clock(self):
+        return self.now
+
+
+class FakeLoader:
+    def __init__(self):
+        self.calls = 0
+
+    def load(self):
+        self.calls += 1
+        return [{"symbol": "BTC/USD", "version": self.calls}]
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def loader():
+    return FakeLoader()
+
+
+def make_cache(tmp_path, loader, clock, on_refresh=None):
+    return asset_cache.AssetCache(
+        broker_name="fake",
+        loader=loader.load,
+        on_refresh=on_refresh,
+        cache_dir=str(tmp_path),
+        ttl=60,
+        clock=clock.clock,
+    )
+
+
+def test_first_load_downloads_and_saves(tmp_path, loader, clock):
+    cache = make_cache(tmp_path, loader, clock)
+    assert cache.load() == [{"symbol": "BTC/USD", "version": 1}]
+    assert loader.calls == 1
+    assert (tmp_path / "fake_assets.json").exists()
+
+
+def test_fresh_cache_skips_download(tmp_path, loader, clock):
+    make_cache(tmp_path, loader, clock).load()
+
+    # a new process starting up inside the ttl
+    clock.now += 30
+    cache = make_cache(tmp_path, loader, clock)
+    assert cache.load() == [{"symbol": "BTC/USD", "version": 1}]
+    assert loader.calls == 1
+    assert cache.refresh_if_stale() == False
+
+
+def test_stale_cache_is_used_and_refreshed_in_background(tmp_path, loader, clock):
+    make_cache(tmp_path, loader, clock).load()
+
+    refreshed = []
+    clock.now += 120
+    cache = make_cache(tmp_path, loader, clock, on_refresh=refreshed.append)
+
+    # the stale copy comes back straight away
+    assert cache.load() == [{"symbol": "BTC/USD", "version": 1}]
+
+    cache.wait_for_refresh(timeout=5)
+    assert loader.calls == 2
+    assert refreshed == [[{"symbol": "BTC/USD", "version": 2}]]
+    assert cache.is_stale() == False
+
+
+def test_corrupt_cache_is_downloaded_again(tmp_path, loader, clock):
+    (tmp_path / "fake_assets.json").write_text("not json")
+    cache = make_cache(tmp_path, loader, clock)
+    assert cache.load() == [{"symbol": "BTC/USD", "version": 1}]
+    assert loader.calls == 1
@@ -0,0 +1,145 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_archive
+import bench_suite
+import synthetic_bars
+import utils
+from bar_archive import BarArchive
+
+
+@pytest.fixture
+def f_bars():
+    bars = synthetic_bars.make_bars(symbols=1, bars=2000, seed=8)["SYM0-USD"]
+    return utils.add_signals(bars, "5m")
+
+
+def check_frame(archived, expected):
+    pd.testing.assert_frame_equal(
+        archived.drop(columns="macd_cycle"),
+        expected.drop(columns="macd_cycle"),
+        check_freq=False,
+        check_dtype=False,
+    )
+    # only the colours matter - "" and None both come back as missing
+    assert (archived.macd_cycle == expected.macd_cycle).equals(
+        expected.macd_cycle.isin(["blue", "red"])
+    )
+
+
+def test_streaming_appends_round_trip(f_bars, tmp_path):
+    archive = BarArchive(str(tmp_path), "5m")
+
+    for end in list(range(100, 2000, 150)) + [2000]:
+        # each lot overlaps the last few bars that are already archived
+        archive.append("SYM0-USD", f_bars.iloc[max(0, end - 160) : end])
+
+    assert archive.meta("SYM0-USD")["rows"] == 2000
+    assert os.path.getsize(tmp_path / "5m" / "SYM0-USD" / "Close.bin") == 2000 * 8
+    check_frame(archive.read("SYM0-USD"), f_bars)
+
+
+def test_range_reads(f_bars, tmp_path):
+    archive = BarArchive(str(tmp_path), "5m")
+    archive.append("SYM0-USD", f_bars)
+
+    start, end = f_bars.index[500], f_bars.index[700]
+    check_frame(archive.read("SYM0-USD", start, end), f_bars.loc[start:end])
+    check_frame(archive.read("SYM0-USD", start, end, lookback=300), f_bars.iloc[200:701])
+    # timestamps between bars
+    check_frame(
+        archive.read("SYM0-USD", start + pd.Timedelta("1min"), end - pd.Timedelta("1min")),
+        f_bars.iloc[501:700],
+    )
+    assert archive.date_range("SYM0-USD") == (f_bars.index[0], f_bars.index[-1])
+    assert archive.read("SYM1-USD") is None
+
+
+def test_chunks_cover_everything(f_bars, tmp_path):
+    archive = BarArchive(str(tmp_path), "5m")
+    archive.append("SYM0-USD", f_bars)
+
+    chunks = list(archive.chunks("SYM0-USD", chunk_bars=600, lookback=50))
+
+    assert [len(chunk) for chunk in chunks] == [600, 650, 650, 250]
+    assert chunks[1].index[0] == f_bars.index[550]
+
+
+def test_late_bars_rewrite_in_order(f_bars, tmp_path):
+    archive = BarArchive(str(tmp_path), "5m")
+    archive.append("SYM0-USD", f_bars.iloc[:1000].drop(f_bars.index[[10, 500]]))
+
+    assert archive.append("SYM0-USD", f_bars.iloc[[10, 500, 1000]]) == 3
+    check_frame(archive.read("SYM0-USD"), f_bars.iloc[:1001])
+
+
+def test_unfinished_append_is_ignored(f_bars, tmp_path):
+    archive = BarArchive(str(tmp_path), "5m")
+    archive.append("SYM0-USD", f_bars.iloc[:1000])
+    # a crash half way through an append leaves extra bytes but no new row count
+    with open(tmp_path / "5m" / "SYM0-USD" / "Close.bin", "ab") as f:
+        f.write(np.zeros(3).tobytes())
+
+    check_frame(BarArchive(str(tmp_path), "5m").read("SYM0-USD"), f_bars.iloc[:1000])
+    archive.append("SYM0-USD", f_bars.iloc[1000:1100])
+    check_frame(archive.read("SYM0-USD"), f_bars.iloc[:1100])
+
+
+def test_unfinished_rewrite_keeps_the_old_bars(f_bars, tmp_path, monkeypatch):
+    archive = BarArchive(str(tmp_path), "5m")
+    archive.append("SYM0-USD", f_bars.iloc[:1000].drop(f_bars.index[500]))
+    expected = f_bars.iloc[:1000].drop(f_bars.index[500])
+
+    # the process dies after a few of the new column files have been written
+    opened = []
+
+    def dying_open(path, mode="r", *args, **kwargs):
+        if mode == "ab":
+            opened.append(path)
+            if len(opened) > 3:
+                raise OSError("killed")
+        return open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(bar_archive, "open", dying_open, raising=False)
+    with pytest.raises(OSError):
+        archive.append("SYM0-USD", f_bars.iloc[[500]])
+    monkeypatch.undo()
+
+    check_frame(BarArchive(str(tmp_path), "5m").read("SYM0-USD"), expected)
+    check_frame(archive.read("SYM0-USD"), expected)
+
+    # and the next rewrite still goes through, tidying up the old generation
+    assert archive.append("SYM0-USD", f_bars.iloc[[500, 1000]]) == 2
+    check_frame(BarArchive(str(tmp_path), "5m").read("SYM0-USD"), f_bars.iloc[:1001])
+    assert not os.path.exists(tmp_path / "5m" / "SYM0-USD" / "Close.bin")
+
+
+def test_back_test_pages_through_archive(tmp_path):
+    all_bars = synthetic_bars.make_bars(symbols=2, bars=1500, seed=9)
+    archive = BarArchive(str(tmp_path), "5m")
+    for symbol, bars in all_bars.items():
+        archive.append(symbol, utils.add_signals(bars, "5m"))
+
+    results = {}
+    for archive_path in [None, str(tmp_path)]:
+        config = bench_suite.make_config(all_bars)
+        config.archive_path = archive_path
+        config.archive_chunk_bars = 400
+        symbols = [{"symbol": symbol, "api": "back_test"} for symbol in all_bars]
+        bot = bench_suite.SyntheticBot(symbols=symbols, config=config, run_id="test")
+        bot.process_bars()
+        results[archive_path] = bot
+
+    paged = results[str(tmp_path)]
+    assert len(paged.symbols["back_testSYM0-USD"].bars) <= 400 + 300
+    orders = [
+        (order.symbol, order.order_type, order.create_time)
+        for order in results[None].bot_telemetry.orders
+    ]
+    assert len(orders) > 0
+    assert [
+        (order.symbol, order.order_type, order.create_time) for order in paged.bot_telemetry.orders
+    ] == orders
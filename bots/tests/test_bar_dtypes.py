@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import bar_dtypes
+import bench_suite
+import synthetic_bars
+import utils
+from bar_history import BarHistory
+
+
+@pytest.fixture
+def f_bars():
+    bars = synthetic_bars.make_bars(symbols=1, bars=1000, seed=2)["SYM0-USD"]
+    return utils.add_signals(bars, "5m")
+
+
+def test_compact_dtypes(f_bars):
+    compacted = bar_dtypes.compact(f_bars)
+
+    assert compacted.macd_cycle.dtype == bar_dtypes.CYCLE_DTYPE
+    assert compacted.macd_crossover.dtype == bool
+    assert compacted.Close.dtype == np.float64
+    assert (compacted.macd_cycle.astype(object) == f_bars.macd_cycle).sum() > 0
+    assert (compacted.macd_crossover == f_bars.macd_crossover).all()
+
+    report = bar_dtypes.memory_report(
+        {
+            "original": f_bars,
+            "compact": compacted,
+            "float32": bar_dtypes.compact(f_bars, float32=True),
+        }
+    )
+    assert report.loc["compact", "bytes"] < report.loc["original", "bytes"] * 0.7
+    assert report.loc["float32", "bytes"] < report.loc["original", "bytes"] / 2
+
+
+def test_float32_within_tolerance(f_bars):
+    compacted = bar_dtypes.compact(f_bars, float32=True)
+
+    for column in bar_dtypes.FLOAT_COLUMNS:
+        assert compacted[column].dtype == np.float32
+        np.testing.assert_allclose(
+            compacted[column], f_bars[column], rtol=bar_dtypes.FLOAT32_RTOL, equal_nan=True
+        )
+
+
+def test_load_bars_compacts_csv(tmp_path):
+    # bars either side of daylight saving, which read_csv leaves as an object index
+    bars = synthetic_bars.make_bars(symbols=1, bars=1000, start="2022-03-11")["SYM0-USD"]
+    f_bars = utils.add_signals(bars, "5m")
+    saved = f_bars.copy()
+    saved.index = saved.index.tz_convert("America/New_York")
+    saved.to_csv(tmp_path / "SYM0-USD.csv")
+
+    assert utils.load_bars("SYM0-USD", path=str(tmp_path)).index.dtype == object
+    loaded = utils.load_bars("SYM0-USD", path=str(tmp_path), compact=True)
+
+    assert isinstance(loaded.index, pd.DatetimeIndex)
+    assert (loaded.index == f_bars.index).all()
+    assert loaded.macd_cycle.dtype == bar_dtypes.CYCLE_DTYPE
+
+
+def test_bar_history_keeps_categories(f_bars):
+    compacted = bar_dtypes.compact(f_bars)
+    history = BarHistory(compacted.iloc[:500])
+
+    history.append(compacted.iloc[500:600])
+    pd.testing.assert_frame_equal(history.frame, compacted.iloc[:600], check_freq=False)
+
+    # a value that isn't a category can't go in the codes, so it gets merged in as objects
+    odd_bar = compacted.iloc[600:601].astype({"macd_cycle": object})
+    odd_bar.loc[:, "macd_cycle"] = "green"
+    history.append(odd_bar)
+    assert history.frame.macd_cycle.iloc[-1] == "green"
+
+
+def test_worker_signals_unchanged_by_compact_bars():
+    all_bars = synthetic_bars.make_bars(symbols=1, bars=1300, seed=5)
+    full_bars = all_bars["SYM0-USD"]
+    workers = {}
+    for compact in [False, True]:
+        config = bench_suite.make_config({"SYM0-USD": full_bars.iloc[:1000]})
+        config.compact_bars = config.float32_bars = compact
+        bot = bench_suite.SyntheticBot(
+            symbols=[{"symbol": "SYM0-USD", "api": "back_test"}], config=config, run_id="test"
+        )
+        workers[compact] = bot.symbols["back_testSYM0-USD"]
+        for end in range(1001, 1300, 13):
+            workers[compact].apply_new_bars(full_bars.iloc[end - 15 : end])
+
+    original, compacted = workers[False].bars, workers[True].bars
+    assert compacted.macd_cycle.dtype == bar_dtypes.CYCLE_DTYPE
+    assert compacted.Close.dtype == np.float32
+    for column in bar_dtypes.FLAG_COLUMNS:
+        assert (compacted[column] == original[column].astype(bool)).all()
+    assert (compacted.macd_cycle.astype(object) == original.macd_cycle).sum() == (
+        original.macd_cycle.isin(["blue", "red"]).sum()
+    )
@@ -0,0 +1,136 @@
+import pandas as pd
+import pytest
+
+import bar_gaps
+import synthetic_bars
+import utils
+
+
+def new_york(timestamp):
+    return pd.Timestamp(timestamp, tz="America/New_York").tz_convert("UTC")
+
+
+def test_expected_index_follows_the_nyse():
+    # good friday 2022-04-15 is a holiday, and the sessions are 78 5m bars long
+    index = bar_gaps.expected_index(
+        new_york("2022-04-11 00:00"), new_york("2022-04-17 00:00"), "5m", "us_market"
+    )
+    assert len(index) == 4 * 78
+    assert index[0] == new_york("2022-04-11 09:30")
+    assert index[-1] == new_york("2022-04-14 15:55")
+
+    # the day after thanksgiving closes at 13:00
+    black_friday = bar_gaps.expected_index(
+        new_york("2022-11-25 00:00"), new_york("2022-11-25 23:00"), "5m", "us_market"
+    )
+    assert len(black_friday) == 42
+
+    # the open stays at 9:30 in new york when daylight saving starts
+    either_side = bar_gaps.expected_index(
+        new_york("2022-03-11 00:00"), new_york("2022-03-14 23:00"), "30m", "us_market"
+    )
+    assert [str(timestamp.time()) for timestamp in either_side[[0, 13]]] == [
+        "14:30:00",
+        "13:30:00",
+    ]
+
+
+def test_crypto_never_closes():
+    index = bar_gaps.expected_index(
+        pd.Timestamp("2022-01-01 00:02", tz="UTC"), pd.Timestamp("2022-01-02", tz="UTC"), "5m", "x"
+    )
+    assert len(index) == 288
+    assert index[0] == pd.Timestamp("2022-01-01 00:05", tz="UTC")
+
+
+def test_find_gaps_ignores_closed_market():
+    expected = bar_gaps.expected_index(
+        new_york("2022-04-04 00:00"), new_york("2022-04-09 00:00"), "5m", "us_market"
+    )
+    # all of tuesday and an hour on thursday are missing
+    tuesday = expected[(expected >= new_york("2022-04-05")) & (expected < new_york("2022-04-06"))]
+    thursday = expected[
+        (expected >= new_york("2022-04-07 11:00")) & (expected < new_york("2022-04-07 12:00"))
+    ]
+    index = expected.drop(tuesday).drop(thursday)
+
+    gaps = bar_gaps.find_gaps(index, "5m", "us_market")
+
+    assert gaps == [(tuesday[0], tuesday[-1], 78), (thursday[0], thursday[-1], 12)]
+    report = bar_gaps.coverage(index, "5m", "us_market", end=index[-1])
+    assert report["missing"] == 90
+    assert report["coverage"] == pytest.approx(1 - 90 / len(expected))
+
+
+def test_plan_merges_close_gaps():
+    now = pd.Timestamp("2022-06-30 12:00", tz="UTC")
+    day = pd.Timedelta(days=1)
+    gaps = [
+        # from before the source's history
+        (now - 70 * day, now - 65 * day, 100),
+        (now - 60 * day, now - 58 * day, 100),
+        # two gaps a few hours apart, then one days later
+        (now - 10 * day, now - 9.9 * day, 30),
+        (now - 9.7 * day, now - 9.5 * day, 60),
+        (now - 3 * day, now - 2 * day, 288),
+    ]
+
+    windows, unfillable = bar_gaps.plan_backfill(gaps, "5m", now=now)
+
+    oldest = now - 59 * day
+    assert unfillable == [gaps[0][:2], (gaps[1][0], oldest - pd.Timedelta("5min"))]
+    assert windows == [
+        (oldest, gaps[1][1]),
+        (gaps[2][0], gaps[3][1]),
+        (gaps[4][0], gaps[4][1]),
+    ]
+
+
+def test_backfill_only_fetches_what_is_missing(tmp_path):
+    now = pd.Timestamp.now(tz="UTC").floor("5min") + pd.Timedelta(minutes=2)
+    start = now.floor("5min") - pd.Timedelta(days=10)
+    all_bars = synthetic_bars.make_bars(symbols=1, bars=2880, seed=12, start=start)
+    bars = all_bars["SYM0-USD"]
+    fetches = []
+
+    class RecordingSource(synthetic_bars.SyntheticMarketData):
+        def Ticker(self, symbol):
+            ticker = super().Ticker(symbol)
+            history = ticker.history
+
+            def recorded(start=None, end=None, **kwargs):
+                fetches.append((start, end))
+                return history(start=start, end=end, **kwargs)
+
+            ticker.history = recorded
+            return ticker
+
+    # a hole in the middle, and the last day hasn't been saved yet
+    saved = bars.iloc[:2500].drop(bars.index[1000:1100])
+    utils.add_signals(saved, "5m").to_csv(tmp_path / "SYM0-USD.csv")
+
+    report = bar_gaps.backfill_bars(
+        ["SYM0-USD"],
+        "5m",
+        path=str(tmp_path),
+        market_data_source=RecordingSource(all_bars),
+        now=now,
+    )
+
+    assert fetches == [(bars.index[1000], bars.index[1100]), (bars.index[2500], now.floor("5min"))]
+    assert report.loc["SYM0-USD", "added"] == 100 + 2880 - 2500
+    assert report.loc["SYM0-USD", "coverage"] == 1.0
+    assert report.loc["SYM0-USD", "requests"] == 2
+
+    backfilled = utils.load_bars("SYM0-USD", path=str(tmp_path))
+    backfilled.index = pd.to_datetime(backfilled.index, utc=True)
+    pd.testing.assert_frame_equal(
+        backfilled[list(bars.columns)], bars, check_freq=False, check_names=False
+    )
+
+    fetches.clear()
+    report = bar_gaps.backfill_bars(
+        ["SYM0-USD"], "5m", path=str(tmp_path), market_data_source=RecordingSource(all_bars), now=now
+    )
+    assert fetches == []
+    assert report.loc["SYM0-USD", "added"] == 0
@@ -0,0 +1,84 @@
+import pandas as pd
+import pytest
+
+import bench_suite
+import synthetic_bars
+import utils
+from bar_history import BarHistory
+
+
+@pytest.fixture
+def f_bars():
+    bars = synthetic_bars.make_bars(symbols=1, bars=1500, seed=3)["SYM0-USD"]
+    return utils.add_signals(bars, "5m")
+
+
+def test_appends_match_merge_bars(f_bars):
+    history = BarHistory(f_bars.iloc[:500])
+    expected = f_bars.iloc[:500]
+
+    for end in range(501, 800, 7):
+        # every fetch overlaps the last couple of bars we've already got
+        new_bars = f_bars.iloc[end - 9 : end]
+        history.append(new_bars.loc[new_bars.index > history.last_index])
+        expected = utils.merge_bars(expected, new_bars)
+
+    pd.testing.assert_frame_equal(history.frame, expected, check_freq=False)
+
+
+def test_history_is_bounded(f_bars):
+    history = BarHistory(f_bars.iloc[:400], max_bars=300)
+    assert len(history) == 300
+
+    for i in range(400, 1500):
+        history.append(f_bars.iloc[i : i + 1])
+        assert len(history) == 300
+        assert history._capacity <= 600
+
+    pd.testing.assert_frame_equal(history.frame, f_bars.iloc[-300:], check_freq=False)
+
+
+def test_late_bars_are_merged_in_order(f_bars):
+    history = BarHistory(f_bars.iloc[:500].drop(f_bars.index[[100, 200]]))
+
+    history.append(f_bars.iloc[[100, 200, 499, 500]])
+
+    pd.testing.assert_frame_equal(history.frame, f_bars.iloc[:501], check_freq=False)
+
+
+def test_frame_is_a_copy(f_bars):
+    history = BarHistory(f_bars.iloc[:500])
+
+    history.frame.loc[:, "Close"] = 0
+    history.append(f_bars.iloc[500:501])
+
+    assert (history.frame.Close > 0).all()
+
+
+def legacy_apply_new_bars(bars, new_bars):
+    # apply_new_bars as it was before BarHistory, to check against
+    if len(new_bars) < 300:
+        new_bars = utils.merge_bars(new_bars=new_bars, bars=bars.iloc[-300:])
+    new_bars = utils.add_signals(new_bars, interval="5m")
+    return utils.merge_bars(bars, new_bars)
+
+
+@pytest.mark.parametrize("max_bars", [None, 600])
+def test_worker_applies_new_bars_like_before(max_bars):
+    all_bars = synthetic_bars.make_bars(symbols=1, bars=1300, seed=5)
+    full_bars = all_bars["SYM0-USD"]
+    config = bench_suite.make_config({"SYM0-USD": full_bars.iloc[:1000]})
+    config.max_bars = max_bars
+    symbols = [{"symbol": "SYM0-USD", "api": "back_test"}]
+    bot = bench_suite.SyntheticBot(symbols=symbols, config=config, run_id="test")
+    worker = bot.symbols["back_testSYM0-USD"]
+    expected = worker.bars.copy()
+
+    for end in range(1001, 1300, 13):
+        new_bars = full_bars.iloc[end - 15 : end]
+        worker.apply_new_bars(new_bars)
+        expected = legacy_apply_new_bars(expected, new_bars)
+
+    if max_bars:
+        expected = expected.iloc[-max_bars:]
+    pd.testing.assert_frame_equal(worker.bars, expected, check_dtype=False, check_freq=False)
@@ -0,0 +1,151 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+import bar_gaps
+import resample_bars
+import synthetic_bars
+from bar_partitions import PartitionedBars
+from macd_worker import MacdWorker
+from object_stores import LocalObjectStore
+
+
+@pytest.fixture
+def f_bars():
+    # five days of 5m bars, starting at midnight
+    return synthetic_bars.make_bars(symbols=1, bars=288 * 5, seed=13)["SYM0-USD"]
+
+
+@pytest.fixture
+def f_store(tmp_path):
+    return LocalObjectStore(str(tmp_path))
+
+
+def keys(store_keys):
+    return sorted(key.split("/")[-1] for key in store_keys)
+
+
+def test_sync_only_writes_new_partitions(f_bars, f_store):
+    partitions = PartitionedBars(f_store, "symbol_data/partitioned/5m/")
+    assert partitions.sync("SYM0-USD", f_bars.iloc[: 288 * 3 + 100]) == 288 * 3 + 100
+    assert len(f_store.writes) == 4 + 1
+
+    f_store.writes.clear()
+    # overlaps what's saved, finishes the fourth day and starts the fifth
+    added = PartitionedBars(f_store, "symbol_data/partitioned/5m/").sync(
+        "SYM0-USD", f_bars.iloc[288 * 3 : 288 * 4 + 10]
+    )
+
+    assert added == 188 + 10
+    assert keys(f_store.writes) == ["2022-01-06.v2.csv", "2022-01-07.v1.csv", "manifest.json"]
+    assert f_store.get("symbol_data/partitioned/5m/SYM0-USD/2022-01-06.v1.csv") is None
+    # the first one's manifest is out of date, and the partition it points at is gone
+    pd.testing.assert_frame_equal(
+        partitions.read("SYM0-USD"), f_bars.iloc[: 288 * 4 + 10], check_freq=False
+    )
+    assert partitions.sync("SYM0-USD", f_bars.iloc[:100]) == 0
+
+
+def test_read_window_only_reads_its_partitions(f_bars, f_store):
+    partitions = PartitionedBars(f_store, "symbol_data/partitioned/5m/")
+    partitions.sync("SYM0-USD", f_bars)
+    start, end = f_bars.index[288 * 3 + 5], f_bars.index[288 * 4 - 1]
+
+    f_store.reads.clear()
+    bars = partitions.read("SYM0-USD", start, end, lookback=300)
+
+    pd.testing.assert_frame_equal(bars, f_bars.iloc[288 * 3 + 5 - 300 : 288 * 4], check_freq=False)
+    # enough days before for the lookback, the day itself, and not the rest
+    assert keys(f_store.reads) == ["2022-01-04.v1.csv", "2022-01-05.v1.csv", "2022-01-06.v1.csv"]
+
+    f_store.reads.clear()
+    tail = partitions.tail("SYM0-USD", 300)
+    pd.testing.assert_frame_equal(tail, f_bars.iloc[-300:], check_freq=False)
+    assert len(f_store.reads) == 2
+
+
+def test_weekly_partitions(f_bars, f_store):
+    partitions = PartitionedBars(f_store, "symbol_data/partitioned/5m/", partitioning="weekly")
+    partitions.sync("SYM0-USD", f_bars)
+
+    assert [entry["partition"] for entry in partitions.manifest("SYM0-USD")["partitions"]] == [
+        "2022-01-03"
+    ]
+    with pytest.raises(ValueError):
+        PartitionedBars(f_store, "symbol_data/partitioned/5m/").sync("SYM0-USD", f_bars)
+
+
+def test_gaps_only_read_short_partitions(f_bars, f_store):
+    partitions = PartitionedBars(f_store, "symbol_data/partitioned/5m/")
+    holed = f_bars.drop(f_bars.index[300:320])
+    partitions.sync("SYM0-USD", holed)
+    end = f_bars.index[-1] + pd.Timedelta(hours=2)
+
+    f_store.reads.clear()
+    gaps = partitions.find_gaps("SYM0-USD", "5m", "ccc_market", end=end)
+
+    assert gaps == bar_gaps.find_gaps(holed.index, "5m", "ccc_market", end=end)
+    assert keys(f_store.reads) == ["2022-01-04.v1.csv"]
+
+
+def test_backfill_into_partitions(f_store):
+    now = pd.Timestamp.now(tz="UTC").floor("D") + pd.Timedelta(minutes=2)
+    start = now.floor("D") - pd.Timedelta(days=4)
+    all_bars = synthetic_bars.make_bars(symbols=1, bars=288 * 4, seed=14, start=start)
+    bars = all_bars["SYM0-USD"]
+    partitions = PartitionedBars(f_store, "symbol_data/partitioned/5m/")
+    partitions.sync("SYM0-USD", bars.iloc[: 288 * 3].drop(bars.index[10:20]))
+
+    f_store.writes.clear()
+    report = bar_gaps.backfill_bars(
+        ["SYM0-USD"],
+        "5m",
+        partitions=partitions,
+        market_data_source=synthetic_bars.SyntheticMarketData(all_bars),
+        now=now,
+    )
+
+    assert report.loc["SYM0-USD", "added"] == 10 + 288
+    assert report.loc["SYM0-USD", "coverage"] == 1.0
+    # the day with the hole, the new day and the manifest
+    assert len(f_store.writes) == 3
+    pd.testing.assert_frame_equal(partitions.read("SYM0-USD"), bars, check_freq=False)
+
+
+def test_derived_partitions_follow_the_base(f_store):
+    bars = synthetic_bars.make_bars(symbols=1, bars=2897, interval="1m", seed=15)["SYM0-USD"]
+    base = PartitionedBars(f_store, "symbol_data/partitioned/1m/")
+    derived = {
+        interval: PartitionedBars(f_store, f"symbol_data/partitioned/{interval}/")
+        for interval in resample_bars.DERIVED_INTERVALS
+    }
+
+    base.sync("SYM0-USD", bars.iloc[:1440].drop(bars.index[100:200]))
+    resample_bars.sync_derived_partitions(["SYM0-USD"], base, derived)
+    # the rest of the bars, and the hole filled in
+    base.sync("SYM0-USD", bars)
+    resample_bars.sync_derived_partitions(["SYM0-USD"], base, derived)
+
+    for interval, partitions in derived.items():
+        expected = resample_bars.resample(bars, interval)
+        pd.testing.assert_frame_equal(partitions.read("SYM0-USD"), expected, check_freq=False)
+
+
+def test_back_test_reads_its_window(f_bars, f_store):
+    partitions = PartitionedBars(f_store, "symbol_data/partitioned/5m/")
+    partitions.sync("SYM0-USD", f_bars)
+    config = SimpleNamespace(
+        bar_partitions=partitions,
+        bars_start=f_bars.index[288 * 2],
+        bars_end=f_bars.index[288 * 3 - 1],
+        max_bars=500,
+    )
+    worker = SimpleNamespace(config=config, symbol="SYM0-USD", back_testing=True)
+
+    bars = MacdWorker._load_saved_bars(worker)
+
+    pd.testing.assert_frame_equal(bars, f_bars.iloc[288 * 2 - 300 : 288 * 3], check_freq=False)
+
+    worker.back_testing = False
+    assert len(MacdWorker._load_saved_bars(worker)) == 500
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pandas as pd
+
+import bench_suite
+import synthetic_bars
+import utils
+
+
+def test_same_seed_same_bars():
+    first = synthetic_bars.make_bars(symbols=2, bars=500, seed=7)
+    second = synthetic_bars.make_bars(symbols=2, bars=500, seed=7)
+    other = synthetic_bars.make_bars(symbols=2, bars=500, seed=8)
+
+    for symbol in first:
+        pd.testing.assert_frame_equal(first[symbol], second[symbol])
+    assert not first["SYM0-USD"].equals(other["SYM0-USD"])
+
+
+def test_bars_are_sane():
+    bars = synthetic_bars.make_bars(symbols=1, bars=1000, interval="15m")["SYM0-USD"]
+
+    assert len(bars) == 1000
+    assert str(bars.index.tz) == "UTC"
+    assert (bars.index[1] - bars.index[0]) == pd.Timedelta(minutes=15)
+    assert (bars.High >= bars[["Open", "Close"]].max(axis=1)).all()
+    assert (bars.Low <= bars[["Open", "Close"]].min(axis=1)).all()
+
+
+def test_bars_have_buy_signals():
+    bars = synthetic_bars.make_bars(symbols=1, bars=3000)["SYM0-USD"]
+    bars = utils.add_signals(bars, "5m")
+
+    assert len(bench_suite.signal_dates(bars, limit=1000)) > 10
+
+
+def test_market_data_source_filters_by_date():
+    all_bars = synthetic_bars.make_bars(symbols=1, bars=100)
+    source = synthetic_bars.SyntheticMarketData(all_bars)
+
+    start = all_bars["SYM0-USD"].index[50]
+    history = source.Ticker("SYM0-USD").history(start=start.tz_convert(None))
+    assert len(history) == 50
+    assert source.Ticker("NOPE").history().empty
+
+
+def test_compare_flags_regressions():
+    baseline = {"results": {"fast": {"median": 1.0}, "slow": {"median": 1.0}}}
+    results = {
+        "results": {
+            "fast": {"median": 1.2},
+            "slow": {"median": 1.3},
+            "new": {"median": 5.0},
+        }
+    }
+
+    regressions = bench_suite.compare(results, baseline, thresholds={})
+    assert [name for name, ratio, threshold in regressions] == ["slow"]
+
+    assert bench_suite.compare(results, baseline, thresholds={"slow": 1.5}) == []
+
+
+def test_run_benchmark():
+    params = SimpleNamespace(symbols=3, bars=300, seed=1, interval="5m", repeat=2)
+    result = bench_suite.run_benchmark("rules_round_trip", params)
+
+    assert result["operations"] == 24
+    assert result["repeat"] == 2
+    assert result["min"] <= result["median"] <= result["max"]
@@ -0,0 +1,101 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import broker_registry
+from broker_back_test import BackTestAPI
+from macd import MacdBot
+
+
+class FakeAPI:
+    def __init__(self, name, config):
+        self.name = name
+        self.config = config
+
+
+@pytest.fixture
+def f_registry():
+    modules = dict(broker_registry.MODULES)
+    factories = dict(broker_registry._factories)
+    built = []
+
+    def add_fake(name, delay=0):
+        @broker_registry.register(name)
+        def make_api(config):
+            time.sleep(delay)
+            built.append(name)
+            return FakeAPI(name, config)
+
+    yield add_fake, built
+
+    broker_registry.MODULES.clear()
+    broker_registry.MODULES.update(modules)
+    broker_registry._factories.clear()
+    broker_registry._factories.update(factories)
+
+
+def test_only_referenced_brokers_are_built(f_registry):
+    add_fake, built = f_registry
+    for name in ["fake_a", "fake_b", "fake_c"]:
+        add_fake(name)
+
+    apis, timings = broker_registry.build(["fake_a", "fake_b", "fake_a"], config="config")
+
+    assert sorted(built) == ["fake_a", "fake_b"]
+    assert apis["fake_a"].config == "config"
+    assert set(timings) == {"fake_a", "fake_b"}
+
+
+def test_brokers_are_built_in_parallel(f_registry):
+    add_fake, built = f_registry
+    names = ["slow_a", "slow_b", "slow_c"]
+    for name in names:
+        add_fake(name, delay=0.2)
+
+    start_time = time.perf_counter()
+    apis, timings = broker_registry.build(names, config=None)
+
+    assert time.perf_counter() - start_time < 0.45
+    assert all(seconds >= 0.2 for seconds in timings.values())
+
+
+def test_unknown_broker(f_registry):
+    with pytest.raises(ValueError):
+        broker_registry.build(["nope"], config=None)
+
+
+def test_back_test_does_not_stop_other_brokers(f_registry):
+    add_fake, built = f_registry
+    add_fake("fake_a")
+    bot = SimpleNamespace(
+        api_list=["back_test", "fake_a", "back_test"],
+        config=SimpleNamespace(back_testing=True, back_testing_balance=1000),
+    )
+
+    api_dict = MacdBot.setup_brokers(bot)
+
+    assert isinstance(api_dict["back_test"], BackTestAPI)
+    assert api_dict["fake_a"].name == "fake_a"
+    assert set(bot.broker_setup_times) == {"back_test", "fake_a"}
+
+
+def test_plugin_module_is_imported_on_first_use(f_registry, tmp_path, monkeypatch):
+    (tmp_path / "broker_plugin_for_test.py").write_text(
+        "import broker_registry\n\n"
+        "@broker_registry.register('plugin')\n"
+        "def make_api(config):\n"
+        "    return ('plugin', config)\n"
+    )
+    monkeypatch.syspath_prepend(str(tmp_path))
+    broker_registry.register_module("plugin", "broker_plugin_for_test")
+
+    apis, timings = broker_registry.build(["plugin"], config="config")
+
+    assert apis["plugin"] == ("plugin", "config")
+
+
+def test_binance_is_not_offered_until_it_can_be_built(f_registry):
+    assert "binance" not in broker_registry.available()
+    with pytest.raises(ValueError):
+        broker_registry.get_factory("binance")
@@ -0,0 +1,61 @@
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import http_sessions
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        body = b"banana"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        ...
+
+
+@pytest.fixture
+def f_local_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/"
+    server.shutdown()
+    server.server_close()
+
+
+def test_session_is_shared():
+    factory = http_sessions.SessionFactory()
+    assert factory.get_session("alpaca") is factory.get_session("alpaca")
+    assert factory.get_session("alpaca") is not factory.get_session("swyftx")
+
+
+def test_session_headers_set_once():
+    factory = http_sessions.SessionFactory()
+    factory.get_session("swyftx_demo", headers={"Authorization": "Bearer demo"})
+    factory.get_session("swyftx_live", headers={"Authorization": "Bearer live"})
+    session = factory.get_session("swyftx_demo", headers={"Authorization": "Bearer other"})
+    assert session.headers["Authorization"] == "Bearer demo"
+    assert factory.get_session("swyftx_live").headers["Authorization"] == "Bearer live"
+
+
+def test_connections_reused(f_local_server):
+    factory = http_sessions.SessionFactory()
+    session = factory.get_session("local")
+    for i in range(5):
+        assert session.get(f_local_server).text == "banana"
+
+    stats = factory.connection_stats()["local"]
+    assert stats["requests"] == 5
+    assert stats["connections"] == 1
+    assert stats["reused"] == 4
+
+
+def test_default_timeout_applied():
+    factory = http_sessions.SessionFactory(timeout=(1, 2))
+    adapter = factory.get_session("local").get_adapter("https://example.com")
+    assert adapter.timeout == (1, 2)
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+
+BOTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# seconds, cumulative, as reported by -X importtime. tabot should only need argparse and the
+# logging/http plumbing until main() runs - about 0.15s on a laptop, so there's plenty of room
+TABOT_IMPORT_BUDGET = 0.75
+
+BROKER_SDKS = ["alpaca_trade_api", "pyswyft", "yfinance", "boto3", "botocore", "cloudwatch"]
+ENGINE_MODULES = ["pandas", "btalib", "macd", "macd_worker"]
+
+
+def import_times(module: str) -> dict:
+    """{module: cumulative seconds} for everything importing module pulls in, in a fresh
+    interpreter"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BOTS_DIR,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        __, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1000000
+    return times
+
+
+def test_tabot_import_is_within_budget():
+    times = import_times("tabot")
+
+    assert times["tabot"] < TABOT_IMPORT_BUDGET
+    for module in BROKER_SDKS + ENGINE_MODULES:
+        assert module not in times, f"importing tabot pulled in {module}"
+
+
+def test_macd_does_not_import_brokers():
+    times = import_times("macd")
+
+    for module in BROKER_SDKS + ["broker_alpaca", "broker_swyftx"]:
+        assert module not in times, f"importing macd pulled in {module}"
+
+
+def test_tabot_help_does_not_run_anything():
+    result = subprocess.run(
+        [sys.executable, "tabot.py", "--help"],
+        cwd=BOTS_DIR,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+
+    assert result.returncode == 0
+    assert "--run_type" in result.stdout
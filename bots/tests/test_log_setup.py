@@ -0,0 +1,107 @@
+import logging
+
+import pytest
+
+import log_setup
+
+
+@pytest.fixture
+def reset_levels():
+    yield
+    log_setup._level_overrides.clear()
+    log_setup._default_level = None
+    log_setup._back_testing = False
+
+
+def test_records_are_written_by_the_listener(tmp_path, reset_levels):
+    log_file = tmp_path / "routed.log"
+    logger = log_setup.get_logger("test_routed", log_file=str(log_file), console=False)
+
+    logger.info("hello from the queue")
+    log_setup.flush()
+
+    assert "hello from the queue" in log_file.read_text()
+    log_setup.release_logger("test_routed")
+
+
+def test_loggers_only_get_their_own_records(tmp_path, reset_levels):
+    first_file = tmp_path / "first.log"
+    second_file = tmp_path / "second.log"
+    first = log_setup.get_logger("test_first", log_file=str(first_file), console=False)
+    second = log_setup.get_logger("test_second", log_file=str(second_file), console=False)
+
+    first.info("first message")
+    second.info("second message")
+    log_setup.flush()
+
+    assert "second message" not in first_file.read_text()
+    assert "first message" not in second_file.read_text()
+    log_setup.release_logger("test_first")
+    log_setup.release_logger("test_second")
+
+
+def test_back_testing_drops_debug(tmp_path, reset_levels):
+    log_file = tmp_path / "back_test.log"
+    logger = log_setup.get_logger("test_back_test", log_file=str(log_file), console=False)
+
+    log_setup.configure(back_testing=True)
+    assert not logger.isEnabledFor(logging.DEBUG)
+    logger.debug("dropped")
+    logger.info("kept")
+    log_setup.flush()
+
+    contents = log_file.read_text()
+    assert "dropped" not in contents
+    assert "kept" in contents
+
+    # an explicit level wins over back testing
+    log_setup.configure(levels={"test_back_test": logging.DEBUG})
+    assert logger.isEnabledFor(logging.DEBUG)
+    log_setup.release_logger("test_back_test")
+
+
+def test_release_logger_stops_writing(tmp_path, reset_levels):
+    log_file = tmp_path / "released.log"
+    logger = log_setup.get_logger("test_released", log_file=str(log_file), console=False)
+    logger.info("before")
+    log_setup.flush()
+
+    log_setup.release_logger("test_released")
+    logger.info("after")
+    log_setup.flush()
+
+    contents = log_file.read_text()
+    assert "before" in contents
+    assert "after" not in contents
+
+
+def test_parse_levels():
+    assert log_setup.parse_levels("macd_worker=INFO, utils=warning,macd=9") == {
+        "macd_worker": logging.INFO,
+        "utils": logging.WARNING,
+        "macd": 9,
+    }
+    assert log_setup.parse_levels(None) == {}
+
+
+def test_broken_handler_does_not_stop_the_listener(tmp_path, reset_levels):
+    class BrokenHandler(logging.Handler):
+        def handle(self, record):
+            raise RuntimeError("broken")
+
+        def handleError(self, record):
+            ...
+
+    log_file = tmp_path / "survivor.log"
+    broken = log_setup.get_logger(
+        "test_broken", log_file=False, console=False, handlers=[BrokenHandler()]
+    )
+    survivor = log_setup.get_logger("test_survivor", log_file=str(log_file), console=False)
+
+    broken.info("goes nowhere")
+    survivor.info("still written")
+    log_setup.flush()
+
+    assert "still written" in log_file.read_text()
+    log_setup.release_logger("test_broken")
+    log_setup.release_logger("test_survivor")
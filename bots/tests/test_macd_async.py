@@ -0,0 +1,140 @@
+import asyncio
+import threading
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from macd import MacdBot
+from parameter_stores import BackTestStore
+import scheduler
+from scheduler import CycleTimer
+from tabot_rules import TABotRules
+
+
+class FakeTelemetry:
+    def __init__(self):
+        self.cycles = 0
+        self.saved = 0
+
+    def next_cycle(self, timestamp):
+        self.cycles += 1
+
+    def save_cycle(self):
+        self.saved += 1
+
+
+class FakeWorker:
+    def __init__(self, tracker, delay):
+        self.tracker = tracker
+        self.delay = delay
+        self.bars = pd.DataFrame(
+            {"Close": [1.0, 2.0, 3.0]},
+            index=pd.date_range("2022-01-01", periods=3, freq="5min"),
+        )
+        self._analyse_date = None
+        self.processed = []
+
+    def _call(self):
+        with self.tracker["lock"]:
+            self.tracker["running"] += 1
+            self.tracker["max_running"] = max(self.tracker["max_running"], self.tracker["running"])
+        time.sleep(self.delay)
+        with self.tracker["lock"]:
+            self.tracker["running"] -= 1
+
+    def fetch_new_bars(self):
+        self._call()
+        return []
+
+    def get_bars_range(self):
+        return self.bars.index.min(), self.bars.index.max()
+
+    def apply_new_bars(self, new_bars):
+        ...
+
+    def process(self, datestamp):
+        self._call()
+        self.processed.append(datestamp)
+        self._analyse_date = datestamp
+
+
+def make_bot(symbol_count, max_concurrency, delay=0.1):
+    tracker = {"lock": threading.Lock(), "running": 0, "max_running": 0}
+    bot = MacdBot.__new__(MacdBot)
+    bot.config = SimpleNamespace(back_testing=False, max_concurrency=max_concurrency)
+    bot.interval_delta = timedelta(minutes=5)
+    bot.bot_telemetry = FakeTelemetry()
+    bot._executor = None
+    bot.symbols = {f"fake{i}": FakeWorker(tracker, delay) for i in range(symbol_count)}
+    return bot, tracker
+
+
+def test_symbols_run_concurrently():
+    bot, tracker = make_bot(symbol_count=5, max_concurrency=5)
+
+    start_time = time.time()
+    asyncio.run(bot.process_bars_async())
+    elapsed = time.time() - start_time
+
+    # one update and one process per symbol - sequentially this would take 1s
+    assert elapsed < 0.6
+    assert tracker["max_running"] == 5
+    assert bot.bot_telemetry.cycles == 1
+    assert bot.bot_telemetry.saved == 1
+
+
+def test_cycle_phases_are_timed():
+    bot, tracker = make_bot(symbol_count=2, max_concurrency=2, delay=0.05)
+    cycle = CycleTimer()
+    asyncio.run(bot.process_bars_async(cycle=cycle))
+
+    for phase in [scheduler.FETCH, scheduler.SIGNALS, scheduler.STATE_MACHINE, scheduler.PERSISTENCE]:
+        assert phase in cycle.phases
+    assert cycle.phases[scheduler.FETCH] >= 0.05
+
+
+def test_concurrency_is_bounded():
+    bot, tracker = make_bot(symbol_count=6, max_concurrency=2, delay=0.05)
+    asyncio.run(bot.process_bars_async())
+    assert tracker["max_running"] == 2
+
+
+def test_live_processes_only_the_latest_record():
+    bot, tracker = make_bot(symbol_count=3, max_concurrency=3, delay=0)
+    asyncio.run(bot.process_bars_async())
+
+    latest = pd.Timestamp("2022-01-01 00:10")
+    for worker in bot.symbols.values():
+        assert worker.processed == [latest]
+
+    # nothing new next cycle, so nothing gets processed again
+    asyncio.run(bot.process_bars_async())
+    for worker in bot.symbols.values():
+        assert worker.processed == [latest]
+
+
+class SlowStore(BackTestStore):
+    # widens the gap between reading and writing the state blob so unserialised writers collide
+    def get(self, path: str, with_decryption: bool = True) -> dict:
+        value = super().get(path=path)
+        time.sleep(0.01)
+        return value
+
+
+def test_concurrent_state_writes_are_not_lost():
+    rules = TABotRules(store=SlowStore(), rules_path="/rules", state_path="/state")
+    symbols = [f"fake{i}" for i in range(8)]
+
+    def write(symbol):
+        rules.write_to_state(new_state={"symbol": symbol, "broker": "back_test"})
+
+    threads = [threading.Thread(target=write, args=(symbol,)) for symbol in symbols]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(state["symbol"] for state in rules.get_state_all()) == symbols
@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+import macd_worker
+from macd_worker import MacdWorker
+
+
+class FakeAPI:
+    def __init__(self, status_summary):
+        self.order = SimpleNamespace(order_id="sell-1", status_summary=status_summary)
+        self.cancelled = []
+
+    def get_order(self, order_id, back_testing_date):
+        return self.order
+
+    def cancel_order(self, order_id, back_testing_date):
+        self.cancelled.append(order_id)
+        return self.order
+
+
+def make_worker(api):
+    return SimpleNamespace(
+        api=api,
+        active_order_id="sell-1",
+        active_order_result=object(),
+        buy_plan=object(),
+        play_id="play-1",
+        _analyse_date=None,
+        bot_telemetry=SimpleNamespace(add_order=lambda order_result, play_id: None),
+        remove_from_rules=lambda: None,
+        close_play_log=lambda: None,
+        check_state_no_position_taken=object(),
+    )
+
+
+@pytest.mark.parametrize("status_summary", ["open", "pending"])
+def test_externally_liquidated_cancels_a_live_take_profit(status_summary):
+    api = FakeAPI(status_summary)
+    worker = make_worker(api)
+
+    MacdWorker.trans_externally_liquidated(worker)
+
+    assert api.cancelled == ["sell-1"]
+    assert worker.active_order_id is None
+    assert worker.buy_plan is None
+    assert worker.state_const == macd_worker.NO_POSITION_TAKEN
+    assert worker.current_check is worker.check_state_no_position_taken
+
+
+@pytest.mark.parametrize("status_summary", ["filled", "cancelled"])
+def test_externally_liquidated_leaves_a_finished_order(status_summary):
+    api = FakeAPI(status_summary)
+    worker = make_worker(api)
+
+    MacdWorker.trans_externally_liquidated(worker)
+
+    assert api.cancelled == []
+    assert worker.active_order_id is None
+    assert worker.state_const == macd_worker.NO_POSITION_TAKEN
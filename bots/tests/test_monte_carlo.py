@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import monte_carlo
+
+
+@pytest.fixture
+def f_plays():
+    rng = np.random.default_rng(30)
+    ends = pd.date_range("2022-01-01", periods=200, freq="3h", tz="UTC")
+    return pd.DataFrame(
+        {"profit": rng.normal(5, 40, size=200).round(2), "end": ends}
+    ).sample(frac=1, random_state=1)
+
+
+def looped_metrics(profits, balance):
+    equity = peak = balance
+    drawdown = drawdown_pct = 0
+    streak = longest = 0
+    for profit in profits:
+        equity += profit
+        peak = max(peak, equity)
+        drawdown = max(drawdown, peak - equity)
+        drawdown_pct = max(drawdown_pct, (peak - equity) / peak)
+        streak = streak + 1 if profit < 0 else 0
+        longest = max(longest, streak)
+    return [equity - balance, drawdown, drawdown_pct, longest]
+
+
+def test_metrics_match_a_loop():
+    rng = np.random.default_rng(31)
+    paths = rng.normal(-1, 20, size=(50, 40))
+
+    metrics = monte_carlo.path_metrics(paths, balance=1000)
+
+    for row, profits in enumerate(paths):
+        assert [
+            metrics[name][row]
+            for name in ["final_pnl", "max_drawdown", "max_drawdown_pct", "losing_streak"]
+        ] == pytest.approx(looped_metrics(profits, 1000))
+
+
+def test_permutation_keeps_the_final_pnl(f_plays):
+    result = monte_carlo.simulate(f_plays, simulations=2000, method="permutation", seed=1)
+
+    assert result.metrics["final_pnl"] == pytest.approx(f_plays.profit.sum())
+    # plays in the order they ended
+    ordered = f_plays.sort_values("end").profit
+    assert [result.observed[name] for name in result.metrics] == pytest.approx(
+        looped_metrics(ordered, 100000)
+    )
+    assert result.metrics["losing_streak"].min() < result.metrics["losing_streak"].max()
+
+
+def test_bootstrap_in_chunks(f_plays, monkeypatch):
+    whole = monte_carlo.simulate(f_plays, simulations=3000, seed=2)
+    # 7 simulations a chunk, the last one short
+    monkeypatch.setattr(monte_carlo, "CHUNK_CELLS", 7 * 200)
+    chunked = monte_carlo.simulate(f_plays, simulations=3000, seed=2)
+
+    assert chunked.simulations == 3000
+    assert chunked.metrics["final_pnl"].mean() == pytest.approx(f_plays.profit.sum(), rel=0.1)
+    assert chunked.metrics["final_pnl"].std() > 0
+    summary = chunked.summary()
+    assert list(summary.index) == list(whole.metrics)
+    assert summary.loc["final_pnl", "p50"] == pytest.approx(
+        whole.summary().loc["final_pnl", "p50"], rel=0.1
+    )
+    assert 0 < chunked.probability_of_loss() < 1
+
+    with pytest.raises(ValueError):
+        monte_carlo.simulate(f_plays.iloc[:0])
@@ -0,0 +1,84 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import synthetic_bars
+import tabot
+from macd_config import MacdConfig
+from parameter_stores import BackTestStore
+
+BOTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# none of these should be imported by a back test run from local bars
+CLOUD_MODULES = ["yfinance", "boto3", "botocore", "cloudwatch", "alpaca_trade_api", "pyswyft"]
+
+RUN_TABOT = """
+import json, runpy, sys
+sys.argv = ["tabot.py"] + sys.argv[1:]
+runpy.run_path("{tabot}", run_name="__main__")
+print(json.dumps(sorted(m for m in {cloud_modules} if m in sys.modules)))
+"""
+
+
+def test_back_test_runs_offline(tmp_path):
+    bars_path = tmp_path / "bars"
+    telemetry_path = tmp_path / "telemetry"
+    bars_path.mkdir()
+    telemetry_path.mkdir()
+
+    bars = synthetic_bars.make_bars(symbols=1, bars=1500)["SYM0-USD"]
+    bars.to_csv(bars_path / "AAVE-USD.csv")
+
+    parameters_file = tmp_path / "parameters.json"
+    parameters_file.write_text(json.dumps({"/tabot/order_size": "2000"}))
+
+    script = RUN_TABOT.format(
+        tabot=os.path.join(BOTS_DIR, "tabot.py"), cloud_modules=CLOUD_MODULES
+    )
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            script,
+            "--run_type=back_test",
+            "--symbols=crypto_symbol",
+            "--back_testing_override_broker",
+            f"--parameters_file={parameters_file}",
+            f"--bars_path={bars_path}",
+            f"--telemetry_path={telemetry_path}",
+        ],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        timeout=300,
+    )
+
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []
+    assert sorted(os.listdir(telemetry_path))[0].endswith("_orders.csv")
+    assert len(os.listdir(telemetry_path)) == 3
+
+
+@pytest.mark.parametrize(
+    "extra_args,bootstrapped",
+    [
+        ([], True),
+        (["--back_testing_override_broker"], False),
+        (["--parameters_file={parameters_file}"], False),
+    ],
+)
+def test_only_real_broker_back_tests_read_ssm(tmp_path, monkeypatch, extra_args, bootstrapped):
+    parameters_file = tmp_path / "parameters.json"
+    parameters_file.write_text(json.dumps({"/tabot/order_size": "2000"}))
+    paths = []
+    monkeypatch.setattr(BackTestStore, "_bootstrap", lambda store, *args: paths.extend(args))
+
+    args = [arg.format(parameters_file=parameters_file) for arg in extra_args]
+    config = MacdConfig(tabot.build_parser().parse_args(["--run_type=back_test"] + args))
+
+    assert (config.path_alpaca_api_key in paths) == bootstrapped
+    assert (config.path_order_size in paths) == bootstrapped
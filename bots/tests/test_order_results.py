@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from broker_back_test import OrderResult
+from itradeapi import Position, order_columns
+
+
+def make_order(order_id="buy-1", order_type=3):
+    return OrderResult(
+        response={
+            "order_type": order_type,
+            "orderUuid": order_id,
+            "symbol": "CHRIS",
+            "quantity": 10,
+            "limit_price": 1.5,
+            "status": 1,
+            "feeAmount": 0,
+            "created_time": pd.Timestamp("2022-01-03", tz="UTC"),
+            "updated_time": pd.Timestamp("2022-01-03", tz="UTC"),
+        }
+    )
+
+
+def test_order_results_are_slotted():
+    order = make_order()
+
+    assert not hasattr(order, "__dict__")
+    with pytest.raises(AttributeError):
+        order.something_new = 1
+
+    assert not hasattr(Position(symbol="CHRIS", quantity=1), "__dict__")
+
+
+def test_raw_response_is_dropped_after_validation(monkeypatch):
+    assert make_order()._raw_response is None
+
+    monkeypatch.setattr(OrderResult, "keep_raw_response", True)
+    assert make_order()._raw_response["orderUuid"] == "buy-1"
+
+
+def test_order_columns_match_as_dict():
+    orders = [make_order(f"buy-{i}") for i in range(3)] + [make_order("sell-1", order_type=4)]
+    for order in orders:
+        order.play_id = "play"
+
+    from_columns = pd.DataFrame(order_columns(orders))
+    from_dicts = pd.DataFrame([order.as_dict() for order in orders])
+
+    pd.testing.assert_frame_equal(from_columns, from_dicts)
+    assert list(pd.DataFrame(order_columns([])).columns) == list(from_dicts.columns)
@@ -0,0 +1,98 @@
+import logging
+
+import pytest
+
+import log_setup
+import play_logs
+from play_logs import LocalSink, PlayLogWriter
+
+
+@pytest.fixture
+def writer():
+    # long flush interval so the test decides when things get sent
+    writer = PlayLogWriter(sink=LocalSink(), flush_interval=60)
+    yield writer
+    writer.close()
+
+
+def open_play(writer, play_id):
+    return log_setup.get_logger(play_id, console=False, log_file=False, handlers=[writer])
+
+
+def test_plays_get_their_own_streams(writer):
+    first = open_play(writer, "play-test-first")
+    second = open_play(writer, "play-test-second")
+
+    first.info("bought")
+    second.info("sold")
+    first.info("took profit")
+    log_setup.flush()
+    writer.flush()
+
+    first_messages = writer.sink.messages("play-test-first")
+    assert len(first_messages) == 2
+    assert "bought" in first_messages[0]
+    assert "took profit" in first_messages[1]
+    assert len(writer.sink.messages("play-test-second")) == 1
+
+    # one batch per stream rather than one call per record
+    assert writer.sink.put_calls == 2
+
+    log_setup.release_logger("play-test-first")
+    log_setup.release_logger("play-test-second")
+
+
+def test_release_sends_the_rest_and_forgets_the_play(writer):
+    play_log = open_play(writer, "play-test-release")
+    play_log.info("last words")
+    log_setup.release_logger("play-test-release")
+    log_setup.flush()
+    writer.flush()
+
+    assert "last words" in writer.sink.messages("play-test-release")[0]
+    assert writer.sink.released == ["play-test-release"]
+    assert writer.stats()["open_streams"] == 0
+    assert "play-test-release" not in logging.Logger.manager.loggerDict
+    assert "play-test-release" not in log_setup._router._routes
+
+
+def test_buffer_is_bounded():
+    writer = PlayLogWriter(sink=LocalSink(), flush_interval=60, max_buffered=5)
+    play_log = open_play(writer, "play-test-bounded")
+    for i in range(8):
+        play_log.info(f"message {i}")
+    log_setup.flush()
+
+    assert writer.stats()["buffered"] == 5
+    assert writer.stats()["dropped"] == 3
+
+    log_setup.release_logger("play-test-bounded")
+    log_setup.flush()
+    writer.close()
+    assert len(writer.sink.messages("play-test-bounded")) == 5
+
+
+def test_batches_respect_the_event_limit():
+    writer = PlayLogWriter(sink=LocalSink(), flush_interval=60, batch_size=3)
+    events = [{"timestamp": 0, "message": "x"} for i in range(7)]
+    assert [len(batch) for batch in writer._batches(events)] == [3, 3, 1]
+    writer.close()
+
+
+def test_failed_sends_are_dropped():
+    class BrokenSink(LocalSink):
+        def put_events(self, stream, events):
+            raise ConnectionError("no network")
+
+    writer = PlayLogWriter(sink=BrokenSink(), flush_interval=60)
+    play_log = open_play(writer, "play-test-broken")
+    play_log.info("lost")
+    log_setup.flush()
+    writer.flush()
+
+    assert writer.stats()["failed"] == 1
+    assert writer.stats()["buffered"] == 0
+
+    log_setup.release_logger("play-test-broken")
+    log_setup.flush()
+    writer.close()
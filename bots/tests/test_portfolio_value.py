@@ -0,0 +1,77 @@
+import numpy as np
+from numpy import NaN
+import pandas as pd
+import pytest
+
+from portfolio_value import PortfolioValue
+
+
+def legacy_add_sma(portfolio_df, sma_intervals, sma_period):
+    # add_sma as it was before it went to rolling windows, to check against
+    slice_length = sma_intervals + sma_period
+    df = portfolio_df.iloc[-slice_length:].copy()
+    sma = []
+    for index in df.index:
+        if index <= df.index[sma_period]:
+            sma.append(NaN)
+        else:
+            sma_end = df.index.get_loc(index) + 1
+            sma_start = sma_end - sma_period
+            sma.append(df.iloc[sma_start:sma_end].mean().Close_value)
+
+    df["sma"] = sma
+    df = df.loc[df.sma.isna() == False]
+    return portfolio_df.assign(sma=df["sma"])
+
+
+def make_sums(rows, seed=1):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2022-01-03", periods=rows, freq="5min", tz="UTC")
+    close_values = 1000 + np.cumsum(rng.normal(0, 5, size=rows))
+    return pd.DataFrame({"Close_value": close_values}, index=index)
+
+
+class FakePortfolio(PortfolioValue):
+    # serves sum_all from a frame we control rather than yfinance
+    sums = None
+
+    def sum_all(self):
+        return self.sums.copy()
+
+
+@pytest.mark.parametrize("rows", [100, 119, 120, 121, 500])
+def test_add_sma_matches_legacy(rows):
+    portfolio = FakePortfolio(portfolio={})
+    sums = make_sums(rows)
+    sums.iloc[3:6, 0] = NaN
+
+    pd.testing.assert_frame_equal(
+        portfolio.add_sma(sums), legacy_add_sma(sums, sma_intervals=100, sma_period=20)
+    )
+
+
+def test_incremental_matches_full_recalculation():
+    full = FakePortfolio(portfolio={})
+    incremental = FakePortfolio(portfolio={}, incremental=True)
+    all_sums = make_sums(400)
+
+    for rows in [150, 151, 151, 170, 300, 400]:
+        sums = all_sums.iloc[:rows].copy()
+        if rows == 170:
+            # a late bar changes a row we've already seen
+            sums.iloc[160, 0] += 50
+        full.sums = incremental.sums = sums
+
+        pd.testing.assert_frame_equal(incremental.portfolio_df, full.portfolio_df)
+
+
+def test_incremental_starts_again_if_history_changes():
+    full = FakePortfolio(portfolio={})
+    incremental = FakePortfolio(portfolio={}, incremental=True)
+    all_sums = make_sums(400)
+
+    incremental.sums = all_sums.iloc[:200]
+    incremental.portfolio_df
+
+    full.sums = incremental.sums = all_sums.iloc[50:300]
+    pd.testing.assert_frame_equal(incremental.portfolio_df, full.portfolio_df)
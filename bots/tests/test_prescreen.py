@@ -0,0 +1,58 @@
+from functools import partial
+
+import numpy as np
+import pytest
+
+import bench_suite
+import prescreen
+import synthetic_bars
+import utils
+
+
+@pytest.fixture
+def f_bars():
+    return synthetic_bars.make_bars(symbols=2, bars=1500, seed=40)
+
+
+def test_signals_match_a_loop(f_bars):
+    bars = utils.add_signals(f_bars["SYM0-USD"], "5m")
+
+    signals = prescreen.find_signals(bars)
+
+    crossovers = np.flatnonzero(bars.macd_crossover.to_numpy(dtype=bool))
+    expected = []
+    for previous, current in zip(crossovers, crossovers[1:]):
+        if current < 200 or previous < current - 200 or bars.macd_macd.iloc[current] >= 0:
+            continue
+        stop = bars.Close.iloc[previous : current + 1].min()
+        expected.append((current, bars.Close.iloc[current], stop))
+    assert len(expected) > 0
+    assert list(signals.itertuples(index=False, name=None)) == expected
+
+
+def test_screen_sorts_by_profit(f_bars):
+    report, plays = prescreen.screen(f_bars, profit_target=1.5, order_size=5000)
+
+    assert list(report.columns) == ["plays", "win_rate", "profit", "mean_return"]
+    assert sorted(report.index) == sorted(f_bars)
+    assert report.profit.is_monotonic_decreasing
+    assert report.plays.sum() == len(plays) > 0
+    assert (plays.end >= plays.start).all()
+    assert (plays.units == (5000 // plays.entry)).all()
+    assert plays.groupby("symbol").profit.sum().to_dict() == pytest.approx(
+        report.profit.to_dict()
+    )
+
+
+def test_calibrate_against_the_back_test(f_bars):
+    symbols = [{"symbol": symbol, "api": "back_test"} for symbol in f_bars]
+
+    report, summary = prescreen.calibrate(
+        f_bars, symbols, partial(bench_suite.make_config, f_bars), max_workers=2
+    )
+
+    assert summary["symbols"] == 2
+    assert summary["engine_plays"] > 0
+    assert summary["recall"] == 1.0
+    assert summary["outcome_agreement"] >= 0.9
+    assert (report.matched_plays <= report.engine_plays).all()
@@ -0,0 +1,113 @@
+import json
+
+import pytest
+
+import profiling
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeBroker:
+    def get_order(self, order_id):
+        return order_id
+
+    name = "fake"
+
+
+@pytest.fixture
+def f_clock():
+    clock = FakeClock()
+    profiling.reset()
+    profiling.enable(dump_interval=None, clock=clock)
+    yield clock
+    profiling.disable()
+    profiling.reset()
+
+
+def test_disabled_costs_nothing():
+    profiling.disable()
+    broker = FakeBroker()
+
+    assert profiling.wrap(broker, "broker") is broker
+    assert profiling.timer("anything") is profiling.timer("something else")
+
+    with profiling.timer("anything", symbol="CHRIS"):
+        ...
+    assert profiling.report() == {}
+
+
+def test_timer_records_per_symbol_and_phase(f_clock):
+    for i in range(3):
+        with profiling.timer("process", symbol="CHRIS"):
+            f_clock.now += 0.002
+
+    summary = profiling.report()["CHRIS"]["process"]
+    assert summary["count"] == 3
+    assert summary["total"] == pytest.approx(0.006)
+    assert summary["max"] == pytest.approx(0.002)
+
+
+def test_nested_timers_inherit_the_symbol(f_clock):
+    class Worker:
+        symbol = "CHRIS"
+
+        @profiling.timed(symbol_from_self=True)
+        def process(self):
+            f_clock.now += 1
+            add_signals()
+
+    @profiling.timed()
+    def add_signals():
+        f_clock.now += 0.5
+
+    Worker().process()
+
+    report = profiling.report()
+    assert report["CHRIS"]["process"]["total"] == pytest.approx(1.5)
+    assert report["CHRIS"]["add_signals"]["total"] == pytest.approx(0.5)
+
+
+def test_proxy_times_broker_calls(f_clock):
+    broker = profiling.wrap(FakeBroker(), "broker")
+    assert broker.get_order("abc") == "abc"
+    assert broker.name == "fake"
+
+    assert profiling.report()[profiling.NO_SYMBOL]["broker.get_order"]["count"] == 1
+
+
+def test_percentiles():
+    histogram = profiling.Histogram()
+    for i in range(99):
+        histogram.add(0.0001)
+    histogram.add(1)
+
+    assert histogram.percentile(50) <= 0.00016
+    assert histogram.percentile(100) == 1
+
+
+def test_periodic_dump(tmp_path):
+    clock = FakeClock()
+    dump_path = tmp_path / "profile.json"
+    profiling.reset()
+    profiling.enable(dump_interval=60, dump_path=str(dump_path), clock=clock)
+
+    with profiling.timer("process", symbol="CHRIS"):
+        clock.now += 1
+    assert not dump_path.exists()
+
+    clock.now += 60
+    with profiling.timer("process", symbol="CHRIS"):
+        clock.now += 1
+
+    dumped = json.loads(dump_path.read_text())
+    assert dumped["phases"]["process"]["count"] == 2
+    assert dumped["symbols"]["CHRIS"]["process"]["count"] == 2
+
+    profiling.disable()
+    profiling.reset()
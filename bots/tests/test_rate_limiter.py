@@ -0,0 +1,189 @@
+import pytest
+
+import http_sessions
+import rate_limiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeBroker:
+    def __init__(self):
+        self.calls = []
+
+    def get_broker_name(self):
+        return "fake"
+
+    def get_session_name(self):
+        return "fake_demo"
+
+    def get_order(self, order_id, back_testing_date=None):
+        self.calls.append(("get_order", order_id))
+        return order_id
+
+    def buy_order_market(self, symbol, units, back_testing_date=None):
+        self.calls.append(("buy_order_market", symbol))
+        return symbol
+
+    def _put_bars(self, symbol, bars):
+        self.calls.append(("_put_bars", symbol))
+
+
+LIMITS = {
+    "shared": {"rate": 1, "capacity": 4},
+    rate_limiter.ORDERS: {"rate": 1, "capacity": 4},
+    rate_limiter.ACCOUNT: {"rate": 1, "capacity": 4},
+    rate_limiter.READS: {"rate": 1, "capacity": 4},
+    "reserve": 2,
+}
+
+
+@pytest.fixture
+def f_clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def f_governor(f_clock):
+    return rate_limiter.RateLimitGovernor(
+        broker_name="fake", limits=LIMITS, clock=f_clock.clock, sleep=f_clock.sleep
+    )
+
+
+def test_burst_within_capacity_does_not_wait(f_clock, f_governor):
+    for i in range(4):
+        assert f_governor.acquire(rate_limiter.ORDERS) == 0
+    assert f_clock.sleeps == []
+
+
+def test_reads_leave_reserve_for_orders(f_clock, f_governor):
+    # capacity 4, reserve 2 - only two reads get through without waiting
+    assert f_governor.acquire(rate_limiter.READS) == 0
+    assert f_governor.acquire(rate_limiter.READS) == 0
+    waited = f_governor.acquire(rate_limiter.READS)
+    assert waited == pytest.approx(1)
+
+    # but orders can still use the reserve immediately
+    assert f_governor.acquire(rate_limiter.ORDERS) == 0
+
+
+def test_orders_paced_at_rate(f_clock, f_governor):
+    for i in range(4):
+        f_governor.acquire(rate_limiter.ORDERS)
+    waited = f_governor.acquire(rate_limiter.ORDERS)
+    assert waited == pytest.approx(1)
+    waited = f_governor.acquire(rate_limiter.ORDERS)
+    assert waited == pytest.approx(1)
+
+
+def test_reads_yield_to_waiting_orders(f_clock, f_governor):
+    f_governor._waiting[rate_limiter.ORDERS] = 1
+    assert f_governor._try_take(rate_limiter.READS, 1) == f_governor.PRIORITY_YIELD
+    f_governor._waiting[rate_limiter.ORDERS] = 0
+    assert f_governor._try_take(rate_limiter.READS, 1) == 0
+
+
+def test_metrics(f_clock, f_governor):
+    for i in range(3):
+        f_governor.acquire(rate_limiter.READS)
+
+    metrics = f_governor.metrics()[rate_limiter.READS]
+    assert metrics["calls"] == 3
+    assert metrics["throttled"] == 1
+    assert metrics["total_wait"] == pytest.approx(1)
+    assert metrics["max_wait"] == pytest.approx(1)
+    assert metrics["mean_wait"] == pytest.approx(1 / 3)
+    assert f_governor.metrics()[rate_limiter.ORDERS]["calls"] == 0
+
+
+class FakeSession:
+    def __init__(self):
+        self.requests = []
+
+    def request(self, method, url, *args, **kwargs):
+        self.requests.append((method, url))
+        return url
+
+    def get(self, url, **kwargs):
+        # like requests.Session.get, goes through self.request
+        return self.request("GET", url, **kwargs)
+
+
+@pytest.mark.parametrize(
+    "method, url, endpoint_class",
+    [
+        ("POST", "https://paper-api.alpaca.markets/v2/orders", rate_limiter.ORDERS),
+        ("DELETE", "https://paper-api.alpaca.markets/v2/orders/abc", rate_limiter.ORDERS),
+        ("DELETE", "https://paper-api.alpaca.markets/v2/positions/BTCUSD", rate_limiter.ORDERS),
+        ("GET", "https://paper-api.alpaca.markets/v2/orders/abc", rate_limiter.READS),
+        ("GET", "https://paper-api.alpaca.markets/v2/account", rate_limiter.ACCOUNT),
+        ("GET", "https://paper-api.alpaca.markets/v2/positions", rate_limiter.ACCOUNT),
+        ("POST", "https://api.demo.swyftx.com.au/orders/", rate_limiter.ORDERS),
+        ("GET", "https://api.demo.swyftx.com.au/orders/byId/123", rate_limiter.READS),
+        ("GET", "https://api.demo.swyftx.com.au/orders/rate/", rate_limiter.READS),
+        ("GET", "https://api.demo.swyftx.com.au/user/balance/", rate_limiter.ACCOUNT),
+        ("GET", "https://api.demo.swyftx.com.au/markets/assets/", rate_limiter.READS),
+    ],
+)
+def test_endpoint_class_for_request(method, url, endpoint_class):
+    assert rate_limiter.endpoint_class_for_request(method, url) == endpoint_class
+
+
+def test_wrapped_api_meters_every_request(f_clock):
+    broker = FakeBroker()
+    session = FakeSession()
+    api = rate_limiter.wrap_api(
+        broker, limits=LIMITS, clock=f_clock.clock, sleep=f_clock.sleep, session=session
+    )
+
+    # adapter calls pass straight through
+    assert api.get_broker_name() == "fake"
+    assert api.buy_order_market("CHRIS", 1) == "CHRIS"
+    api._put_bars("CHRIS", None)
+    assert len(broker.calls) == 2
+
+    # an order submit followed by the status check the adapter does internally is two requests
+    session.request("POST", "https://api.demo.swyftx.com.au/orders/")
+    session.get("https://api.demo.swyftx.com.au/orders/byId/123")
+
+    metrics = api.governor.metrics()
+    assert metrics[rate_limiter.ORDERS]["calls"] == 1
+    assert metrics[rate_limiter.READS]["calls"] == 1
+    assert len(session.requests) == 2
+
+
+def test_metering_twice_does_not_double_charge(f_clock, f_governor):
+    session = FakeSession()
+    rate_limiter.meter_session(session, f_governor)
+    rate_limiter.meter_session(session, f_governor)
+
+    session.get("https://api.demo.swyftx.com.au/orders/byId/123")
+    assert f_governor.metrics()[rate_limiter.READS]["calls"] == 1
+
+
+def test_unknown_broker_not_wrapped():
+    broker = FakeBroker()
+    assert rate_limiter.wrap_api(broker) is broker
+
+
+def test_wrap_api_meters_the_api_session(f_clock, monkeypatch):
+    factory = http_sessions.SessionFactory()
+    monkeypatch.setattr(http_sessions, "_factory", factory)
+    factory.get_session("fake_demo")
+    factory.get_session("fake_live")
+
+    rate_limiter.wrap_api(FakeBroker(), limits=LIMITS, clock=f_clock.clock, sleep=f_clock.sleep)
+
+    assert hasattr(factory.get_session("fake_demo"), "_unmetered_request")
+    assert not hasattr(factory.get_session("fake_live"), "_unmetered_request")
+    assert "fake" not in factory._sessions
@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+import pytz
+
+import resample_bars
+import synthetic_bars
+from resample_bars import BarResampler, ResampledMarketData
+
+
+@pytest.fixture
+def f_bars():
+    # a few minutes short of a whole 30m bucket at the end
+    return synthetic_bars.make_bars(symbols=1, bars=3000 - 7, interval="1m", seed=10)["SYM0-USD"]
+
+
+def pandas_resample(bars, interval):
+    minutes = resample_bars.interval_delta(interval)
+    return bars.resample(minutes).agg(resample_bars.AGGREGATIONS).dropna()
+
+
+@pytest.mark.parametrize("interval", resample_bars.DERIVED_INTERVALS)
+def test_resample_matches_pandas(f_bars, interval):
+    resampled = resample_bars.resample(f_bars, interval)
+    expected = pandas_resample(f_bars, interval)
+
+    # the unfinished bucket at the end is left out
+    assert resampled.index[-1] + resample_bars.interval_delta(interval) <= f_bars.index[-1]
+    pd.testing.assert_frame_equal(
+        resampled, expected.loc[: resampled.index[-1]], check_freq=False, check_names=False
+    )
+    # but comes through once now is past it
+    now = f_bars.index[-1] + pd.Timedelta(minutes=30)
+    assert len(resample_bars.resample(f_bars, interval, now=now)) == len(expected)
+
+
+def test_session_alignment_across_daylight_saving():
+    new_york = pytz.timezone("America/New_York")
+    days = []
+    # a session either side of the march switch to daylight saving
+    for day in ["2022-03-11", "2022-03-14"]:
+        opening = new_york.localize(datetime.strptime(f"{day} 09:30", "%Y-%m-%d %H:%M"))
+        days.append(pd.date_range(opening, periods=390, freq="1min").tz_convert("UTC"))
+    index = days[0].append(days[1])
+    bars = synthetic_bars.make_symbol_bars(rng=np.random.default_rng(1), bars=len(index), index=index)
+
+    resampled = resample_bars.resample(bars, "30m", resample_bars.US_MARKET_SESSION)
+    local_times = resampled.index.tz_convert("America/New_York").strftime("%H:%M")
+
+    assert len(resampled) == 26
+    assert list(local_times[:2]) == ["09:30", "10:00"]
+    assert list(local_times[13:15]) == ["09:30", "10:00"]
+    assert local_times[-1] == "15:30"
+    assert resampled.Volume.sum() == bars.Volume.sum()
+
+
+def test_incremental_updates_match_a_full_resample(f_bars):
+    resampler = BarResampler()
+    rebuilt_counts = []
+    for start in range(0, len(f_bars), 97):
+        # each lot repeats the last couple of minutes, like a refresh does
+        rebuilt = resampler.update(f_bars.iloc[max(0, start - 2) : start + 97])
+        rebuilt_counts.append(len(rebuilt["30m"]))
+
+    for interval in resample_bars.DERIVED_INTERVALS:
+        pd.testing.assert_frame_equal(
+            resampler.get(interval), resample_bars.resample(f_bars, interval), check_freq=False
+        )
+    # only the buckets the new bars touched get built again
+    assert max(rebuilt_counts[1:]) <= 5
+
+
+def test_late_bar_rebuilds_its_bucket(f_bars):
+    resampler = BarResampler()
+    resampler.update(f_bars.drop(f_bars.index[100]))
+    assert resampler.get("5m").loc[f_bars.index[100].floor("5min"), "Volume"] < (
+        f_bars.Volume.iloc[100:105].sum()
+    )
+
+    resampler.update(f_bars.iloc[[100]])
+
+    pd.testing.assert_frame_equal(
+        resampler.get("5m"), resample_bars.resample(f_bars, "5m"), check_freq=False
+    )
+
+
+def test_every_interval_from_one_fetch():
+    start = (pd.Timestamp.now(tz="UTC") - pd.Timedelta(days=2)).floor("30min")
+    all_bars = synthetic_bars.make_bars(symbols=1, bars=1000, interval="1m", seed=11, start=start)
+    fetched = []
+
+    class CountingSource(synthetic_bars.SyntheticMarketData):
+        def Ticker(self, symbol):
+            fetched.append(symbol)
+            return super().Ticker(symbol)
+
+    source = ResampledMarketData(CountingSource(all_bars))
+    bars_5m = source.Ticker("SYM0-USD").history(start=start, interval="5m")
+    bars_15m = source.Ticker("SYM0-USD").history(start=start, interval="15m")
+
+    assert len(bars_5m) == 200
+    assert len(bars_15m) == 66
+    assert bars_15m.High.iloc[0] == all_bars["SYM0-USD"].High.iloc[:15].max()
+    # the second interval only had to ask for the last few minutes again
+    assert source.resamplers["SYM0-USD"].base.index[0] == start
+    assert len(fetched) == 2
+
+    with pytest.raises(ValueError):
+        source.Ticker("SYM0-USD").history(start=start, interval="60m")
@@ -0,0 +1,83 @@
+import pytest
+import scheduler
+
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    # 100s into a 5 minute bar
+    return FakeClock(now=300 * 10 + 100)
+
+
+def make_scheduler(clock, **kwargs):
+    return scheduler.BarScheduler(
+        interval_seconds=300, clock=clock.clock, sleep=clock.sleep, **kwargs
+    )
+
+
+def test_next_bar_close(clock):
+    bar_scheduler = make_scheduler(clock)
+    assert bar_scheduler.next_bar_close() == 300 * 11
+    assert bar_scheduler.next_bar_close(now=300 * 11) == 300 * 12
+
+
+def test_bar_already_there_at_close(clock):
+    bar_scheduler = make_scheduler(clock)
+    delay = bar_scheduler.wait_for_bar(lambda: True)
+
+    # slept straight to the close, and no fixed 90 second gap after it
+    assert clock.sleeps == [200]
+    assert delay == 0
+
+
+def test_polling_backs_off(clock):
+    bar_scheduler = make_scheduler(clock, initial_poll=2, max_poll=8)
+    polls = iter([False, False, False, False, True])
+    delay = bar_scheduler.wait_for_bar(lambda: next(polls))
+
+    assert clock.sleeps == [200, 2, 4, 8, 8]
+    assert delay == 22
+
+
+def test_gives_up_after_max_wait(clock):
+    bar_scheduler = make_scheduler(clock, initial_poll=10, max_poll=10, max_wait=25)
+    delay = bar_scheduler.wait_for_bar(lambda: False)
+    assert delay == 25
+
+
+def test_cycle_phases_and_overrun(clock):
+    bar_scheduler = make_scheduler(clock)
+
+    cycle = bar_scheduler.start_cycle()
+    with cycle.phase(scheduler.FETCH):
+        clock.now += 5
+    with cycle.phase(scheduler.STATE_MACHINE):
+        clock.now += 2
+    record = bar_scheduler.finish_cycle(cycle)
+    assert record["phases"] == {scheduler.FETCH: 5, scheduler.STATE_MACHINE: 2}
+    assert record["overran"] == False
+
+    # this one runs through two bar closes
+    cycle = bar_scheduler.start_cycle()
+    with cycle.phase(scheduler.FETCH):
+        clock.now += 700
+    record = bar_scheduler.finish_cycle(cycle)
+    assert record["overran"] == True
+    assert record["skipped_bars"] == 2
+
+    summary = bar_scheduler.summary()
+    assert summary["cycles"] == 2
+    assert summary["overruns"] == 1
+    assert summary["phases"][scheduler.FETCH]["max"] == 700
@@ -0,0 +1,99 @@
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import pickle
+
+import pandas as pd
+import pytest
+
+import bar_dtypes
+import bench_suite
+import shared_bars
+import synthetic_bars
+import utils
+
+
+@pytest.fixture
+def f_bars():
+    bars = synthetic_bars.make_bars(symbols=2, bars=800, seed=6)
+    return {symbol: utils.add_signals(symbol_bars, "5m") for symbol, symbol_bars in bars.items()}
+
+
+@pytest.fixture
+def f_registry():
+    registry = shared_bars.SharedBarRegistry()
+    yield registry
+    for handle in registry.handles.values():
+        shared_bars.detach(handle)
+    registry.close()
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_attached_frame_matches_published(f_bars, f_registry, compact):
+    bars = f_bars["SYM0-USD"]
+    if compact:
+        bars = bar_dtypes.compact(bars, float32=True)
+    handle = f_registry.publish("SYM0-USD", bars)
+
+    attached = shared_bars.attach(handle)
+
+    # strings come back as categories, everything else as it went in
+    pd.testing.assert_frame_equal(
+        attached, bars, check_categorical=False, check_dtype=False, check_freq=False
+    )
+    assert attached.Close.dtype == bars.Close.dtype
+    assert not attached.Close.to_numpy().flags.writeable
+    assert shared_bars.attach(handle) is attached
+
+
+def test_handles_are_small(f_bars, f_registry):
+    for symbol, bars in f_bars.items():
+        f_registry.publish(symbol, bars)
+
+    assert len(pickle.dumps(f_registry.handles)) < len(pickle.dumps(f_bars)) / 20
+
+
+def sum_closes(handles):
+    return {symbol: shared_bars.attach(handle).Close.sum() for symbol, handle in handles.items()}
+
+
+def test_workers_share_bars(f_bars, f_registry):
+    for symbol, bars in f_bars.items():
+        f_registry.publish(symbol, bars)
+
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(sum_closes, [f_registry.handles] * 2))
+
+    for result in results:
+        assert result == pytest.approx({symbol: bars.Close.sum() for symbol, bars in f_bars.items()})
+
+
+def test_blocks_are_gone_after_close(f_bars):
+    registry = shared_bars.SharedBarRegistry()
+    handle = registry.publish("SYM0-USD", f_bars["SYM0-USD"])
+    registry.close()
+
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=handle.index_block)
+
+
+def run_back_test(all_bars, handles=None):
+    config = bench_suite.make_config(all_bars)
+    config.shared_bars = handles
+    symbols = [{"symbol": symbol, "api": "back_test"} for symbol in all_bars]
+    bot = bench_suite.SyntheticBot(symbols=symbols, config=config, run_id="test")
+    bot.process_bars()
+    return bot
+
+
+def test_back_test_on_shared_bars(f_bars, f_registry):
+    all_bars = synthetic_bars.make_bars(symbols=2, bars=800, seed=6)
+    for symbol, bars in f_bars.items():
+        f_registry.publish(symbol, bars)
+
+    copied = run_back_test(all_bars)
+    shared = run_back_test(all_bars, handles=f_registry.handles)
+
+    worker = shared.symbols["back_testSYM0-USD"]
+    assert worker.bars is shared_bars.attach(f_registry.handles["SYM0-USD"])
+    assert worker.api._bars["SYM0-USD"] is worker.bars
+    assert len(shared.bot_telemetry.orders) == len(copied.bot_telemetry.orders) > 0
@@ -0,0 +1,99 @@
+from numpy import NaN
+import pandas as pd
+import pytest
+
+import synthetic_bars
+from portfolio_value import PortfolioValue
+from symbol_objects import SymbolCollection, SymbolData
+
+
+def legacy_get_all(collection):
+    # get_all as it was before the shared panel, to check against
+    indexes = None
+    for k, s in collection.symbols.items():
+        indexes = s.bars.index if indexes is None else indexes.union(s.bars.index)
+
+    return_dict = {}
+    for k, s in collection.symbols.items():
+        missing = indexes.symmetric_difference(s.bars.index)
+        new_rows = pd.DataFrame(NaN, index=missing, columns=s.bars.columns)
+        return_dict[k] = pd.concat([s.bars, new_rows]).sort_index().fillna(method="ffill")
+    return return_dict
+
+
+def legacy_sum_all(portfolio):
+    return_df = None
+    for k, s in legacy_get_all(portfolio).items():
+        close_value = (s["Close"] * portfolio.portfolio[k]).to_frame("Close_value")
+        return_df = close_value if return_df is None else return_df + close_value
+    return return_df
+
+
+@pytest.fixture
+def f_symbols(monkeypatch):
+    # symbols with bars we control, rather than bars from yfinance
+    monkeypatch.setattr(SymbolData, "refresh_cache", lambda self: None)
+    all_bars = synthetic_bars.make_bars(symbols=3, bars=300, seed=4)
+
+    symbols = []
+    for i, (name, bars) in enumerate(all_bars.items()):
+        symbol = SymbolData.__new__(SymbolData)
+        symbol.yf_symbol = name
+        # every symbol is missing a different set of bars
+        symbol.bars = bars.drop(bars.index[i * 7 + 5 :: 11 + i]).astype(float)
+        symbols.append(symbol)
+    return symbols, all_bars
+
+
+def check_against_legacy(collection):
+    expected = legacy_get_all(collection)
+    aligned = collection.get_all()
+
+    assert list(aligned) == list(expected)
+    for k in expected:
+        pd.testing.assert_frame_equal(aligned[k], expected[k], check_freq=False)
+
+
+def test_get_all_matches_legacy(f_symbols):
+    symbols, all_bars = f_symbols
+    collection = SymbolCollection(symbols)
+
+    check_against_legacy(collection)
+
+
+def test_panel_keeps_up_with_new_bars(f_symbols):
+    symbols, all_bars = f_symbols
+    for symbol in symbols:
+        symbol.full_bars = symbol.bars
+        symbol.bars = symbol.full_bars.iloc[:200]
+    collection = SymbolCollection(symbols)
+    check_against_legacy(collection)
+
+    # symbols catch up at different rates, and one doesn't move at all
+    for step in [1, 5, 40]:
+        for i, symbol in enumerate(symbols[:-1]):
+            symbol.bars = symbol.full_bars.iloc[: len(symbol.bars) + step * (i + 1)]
+        check_against_legacy(collection)
+
+    # history that changes under the panel means starting again
+    symbols[0].bars = symbols[0].full_bars.iloc[10:280]
+    check_against_legacy(collection)
+
+
+def test_get_all_results_can_be_changed(f_symbols):
+    symbols, all_bars = f_symbols
+    collection = SymbolCollection(symbols)
+
+    collection.get_all()[symbols[0].yf_symbol]["Close"] = 0
+
+    assert (collection.get_all()[symbols[0].yf_symbol]["Close"] > 0).all()
+
+
+def test_sum_all_matches_legacy(f_symbols):
+    symbols, all_bars = f_symbols
+    portfolio = PortfolioValue(
+        portfolio={s.yf_symbol: units for s, units in zip(symbols, [1.5, 0, 20])}, symbols=symbols
+    )
+
+    pd.testing.assert_frame_equal(portfolio.sum_all(), legacy_sum_all(portfolio), check_freq=False)
+    assert list(portfolio.get_panel("Close").columns) == [s.yf_symbol for s in symbols]
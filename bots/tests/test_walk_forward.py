@@ -0,0 +1,78 @@
+from functools import partial
+
+import pandas as pd
+import pytest
+
+import bench_suite
+import shared_bars
+import synthetic_bars
+import utils
+import walk_forward
+from walk_forward import WalkForward
+
+
+@pytest.fixture
+def f_bars():
+    # three days to walk through once the signals have warmed up
+    return synthetic_bars.make_bars(symbols=2, bars=250 + 288 * 3, seed=21)
+
+
+def test_windows_roll_forward():
+    start = pd.Timestamp("2022-01-01", tz="UTC")
+    day = pd.Timedelta(days=1)
+
+    windows = walk_forward.make_windows(start, start + 10 * day, 4 * day, 2 * day)
+
+    assert windows == [
+        (start, start + 4 * day, start + 4 * day, start + 6 * day),
+        (start + 2 * day, start + 6 * day, start + 6 * day, start + 8 * day),
+        (start + 4 * day, start + 8 * day, start + 8 * day, start + 10 * day),
+    ]
+    assert walk_forward.make_windows(start, start + 5 * day, 4 * day, 2 * day) == []
+    assert walk_forward.parameter_sets({"a": [1, 2], "b": [3]}) == [
+        {"a": 1, "b": 3},
+        {"a": 2, "b": 3},
+    ]
+
+
+def test_out_of_sample_plays_are_stitched(f_bars):
+    symbols = [{"symbol": symbol, "api": "back_test"} for symbol in f_bars]
+    config_factory = partial(bench_suite.make_config, f_bars)
+    runner = WalkForward(
+        config_factory,
+        symbols,
+        in_sample=pd.Timedelta(days=1),
+        out_of_sample=pd.Timedelta(hours=12),
+        grid={"profit_target": [1.0, 3.0]},
+        max_workers=2,
+    )
+
+    report, plays, equity = runner.run(f_bars)
+
+    assert len(report) == 4
+    assert report.out_start.iloc[1:].tolist() == report.out_end.iloc[:-1].tolist()
+    assert len(plays) == report.plays.sum() > 0
+    for number, window in report.iterrows():
+        window_plays = plays.loc[plays.window == number]
+        assert (window_plays.start >= window.out_start).all()
+        assert (window_plays.start < window.out_end).all()
+        assert (window_plays.profit_target == window.profit_target).all()
+    assert equity.index.is_monotonic_increasing
+    assert equity.iloc[-1] == pytest.approx(100000 + plays.profit.sum())
+
+    # the last out of sample back test again, on its own in this process
+    last = report.iloc[-1]
+    with shared_bars.SharedBarRegistry() as registry:
+        for symbol, bars in f_bars.items():
+            registry.publish(symbol, utils.add_signals(bars, "5m"))
+        alone = walk_forward.run_back_test(
+            config_factory,
+            registry.handles,
+            symbols,
+            {"profit_target": last.profit_target},
+            last.out_start,
+            last.out_end - pd.Timedelta(minutes=5),
+        )
+        for handle in registry.handles.values():
+            shared_bars.detach(handle)
+    assert sorted(alone.profit) == sorted(plays.loc[plays.window == report.index[-1]].profit)
@@ -8,18 +8,10 @@ import utils
 import notification_services
 from parameter_stores import Ssm
 from broker_alpaca import AlpacaAPI
+import log_setup
 
 
-log_wp = logging.getLogger("tides")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("tides.log")
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)5s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
-log_wp.setLevel(logging.DEBUG)
+log_wp = log_setup.get_logger("tides")
 
 _PREFIX = "tabot"
 PATH_PAPER_ALPACA_API_KEY = f"/{_PREFIX}/paper/alpaca/api_key"
@@ -67,8 +59,9 @@ def main(args):
         bot_key=slack_bot_key, channel=slack_announcements_channel
     )
 
+    # portfolio_df gets read every 5 minutes, so only work out what's changed since last time
     symbol_collection = PortfolioValue(
-        benchmark, [k for k, v in benchmark.items()], log_level=logging.WARNING
+        benchmark, [k for k, v in benchmark.items()], log_level=logging.WARNING, incremental=True
     )
 
     # okay so we've set our starting point, now keep grabbing data and checking if we should buy in
@@ -1,34 +1,26 @@
 # external packages
-import boto3
 import btalib
 from datetime import datetime
 from dateutil.relativedelta import relativedelta
 import json
-import logging
 from numpy import NaN
 import pandas as pd
 import pytz
 import time
 import uuid
-import yfinance as yf
 
 import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 # my modules
+import bar_dtypes
+import log_setup
+import http_sessions
+import profiling
 from iparameter_store import IParameterStore
 
-log_wp = logging.getLogger("utils")  # or pass an explicit name here, e.g. "mylogger"
-hdlr = logging.StreamHandler()
-fhdlr = logging.FileHandler("utils.log")
-log_wp.setLevel(logging.DEBUG)
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(funcName)20s - %(message)s"
-)
-hdlr.setFormatter(formatter)
-log_wp.addHandler(hdlr)
-log_wp.addHandler(fhdlr)
+log_wp = log_setup.get_logger("utils")
 
 
 def get_interval_integer(interval):
@@ -94,6 +86,7 @@ def merge_bars(bars, new_bars):
     return pd.concat([bars, new_bars[~new_bars.index.isin(bars.index)]])
 
 
+@profiling.timed()
 def add_signals(bars, interval):
     interval_delta, max_range = get_interval_settings(interval)
 
@@ -244,6 +237,7 @@ def clean(number):
 
 
 # simple function to check if a pandas series contains a macd buy signal
+@profiling.timed()
 def check_buy_signal(df, symbol, bot_telemetry):
     telemetry_reasons = []
     crossover = False
@@ -385,59 +379,33 @@ def unpickle(object):
     return json.loads(object)
 
 
-def save_bars(symbols: list, interval: str, max_range: float, bucket: str, key_base: str) -> bool:
-    for symbol in symbols:
-        existing_bars = load_bars(symbols=symbol, bucket=bucket, key_base=key_base)
-        if type(existing_bars) == pd.core.frame.DataFrame:
-            start = existing_bars.index[-1]
-            log_wp.debug(
-                f"{symbol}: {len(existing_bars):,d} existing bars found in S3 will be used as starting point"
-            )
-            existing_rows = len(existing_bars)
-        else:
-            start = datetime.now() - max_range
-            log_wp.debug(
-                f"{symbol}: No bars found in S3. Starting point will be YFinance start date {str(start)}"
-            )
-            existing_rows = 0
-
-        bars = yf.Ticker(symbol).history(start=start, interval=interval, actions=False, debug=False)
-
-        if len(bars) == 0:
-            log_wp.warning(f"{symbol}: No YF data - skipping symbol")
-            continue
-
-        bars = bars.tz_convert(pytz.utc)
+class YahooMarketData:
+    """Stands in for the yfinance module as a market_data_source, but only imports it the first
+    time bars are asked for - it's slow to import and back tests from saved bars never need it"""
 
-        # trim bars because the last ~3 are weird timestamps with big missing data
-        trimmed_bars = bars.iloc[:-4]
+    def Ticker(self, symbol: str):
+        import yfinance
 
-        # need to merge old bars with new bars
-        if type(existing_bars) == pd.core.frame.DataFrame:
-            trimmed_bars = merge_bars(bars=existing_bars, new_bars=trimmed_bars)
+        return yfinance.Ticker(symbol)
 
-        bars_with_signals = add_signals(bars=trimmed_bars, interval=interval)
-
-        # pickled_bars = utils.pickle(bars)
-        pickled_bars = bars_with_signals.to_csv()
-        if upload_to_s3(
-            pickle=pickled_bars,
-            bucket=bucket,
-            key_base=key_base,
-            key=f"{symbol}.csv",
-        ):
-            log_wp.info(
-                f"{symbol}: Saved bars to S3 ({len(bars):,d} records retrieved, {existing_rows:,d} "
-                f"were already in S3, {len(trimmed_bars):,d} records saved)"
-            )
-        else:
-            log_wp.error(f"{symbol}: Failed to save bars to S3")
 
+def save_bars(symbols: list, interval: str, max_range: float, bucket: str, key_base: str) -> bool:
+    # fills any holes in the saved bars too, not just what's happened since the last one
+    import bar_gaps
+
+    report = bar_gaps.backfill_bars(
+        symbols=symbols,
+        interval=interval,
+        bucket=bucket,
+        key_base=key_base,
+        max_range=pd.Timedelta(days=max_range.days),
+    )
+    log_wp.info(f"Saved bars coverage:\n{report.to_string()}")
     return True
 
 
 def upload_to_s3(pickle: str, bucket: str, key_base: str, key):
-    s3 = boto3.resource("s3")
+    s3 = http_sessions.get_boto3_resource("s3")
     try:
         s3object = s3.Object(bucket, key_base + key)
 
@@ -452,7 +420,21 @@ def upload_to_s3(pickle: str, bucket: str, key_base: str, key):
     return True
 
 
-def load_bars(symbols: list, bucket: str, key_base: str) -> dict:
+def load_bars(
+    symbols: list,
+    bucket: str = None,
+    key_base: str = None,
+    path: str = None,
+    compact: bool = False,
+    float32: bool = False,
+) -> dict:
+    # path is a local directory laid out like {bucket}/{key_base} - {symbol}.csv - for back tests
+    # that can't (or shouldn't) reach S3
+    if path is not None:
+        location = f"{path.rstrip('/')}/"
+    else:
+        location = f"s3://{bucket}/{key_base}"
+
     single_return = False
     if type(symbols) == str:
         symbols = [symbols]
@@ -461,7 +443,7 @@ def load_bars(symbols: list, bucket: str, key_base: str) -> dict:
     for symbol in symbols:
         try:
             loaded_csv = pd.read_csv(
-                f"s3://{bucket}/{key_base}{symbol}.csv",
+                f"{location}{symbol}.csv",
                 index_col=0,
                 parse_dates=True,
                 infer_datetime_format=True,
@@ -469,6 +451,9 @@ def load_bars(symbols: list, bucket: str, key_base: str) -> dict:
         except FileNotFoundError as e:
             loaded_csv = None
 
+        if compact and loaded_csv is not None:
+            loaded_csv = bar_dtypes.compact(loaded_csv, float32=float32)
+
         returned_bars[symbol] = loaded_csv
 
     if single_return:
@@ -0,0 +1,280 @@
+# external packages
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from functools import partial
+import io
+import itertools
+import pandas as pd
+
+# my modules
+import log_setup
+import sample_symbols
+import shared_bars
+import tabot
+import utils
+from macd import MacdBot
+from macd_config import MacdConfig
+
+log_wp = log_setup.get_logger("walk_forward")
+
+# walk forward optimisation on top of the back test engine. history is cut into rolling windows -
+# an in sample stretch followed by the out of sample stretch straight after it. every parameter
+# set gets back tested over each in sample stretch, the best one is then back tested over the out
+# of sample stretch that follows, and only those out of sample plays are kept. stitched together
+# they're what the strategy would have done if it had been re-tuned every out_of_sample days
+#
+#   |---- in sample ----|-- out --|
+#             |---- in sample ----|-- out --|
+#                       |---- in sample ----|-- out --|
+#
+# the signals don't depend on any parameter, so each symbol's bars get their signals once and go
+# into shared memory (see shared_bars) - every back test in the pool, whatever window or
+# parameters it's running, reads the same frames instead of building its own
+#
+#   python walk_forward.py --bars_path ./bars --symbols crypto_symbol --in_sample_days 60 \
+#       --out_of_sample_days 14 --profit_targets 1,1.5,2,3 --output_path ./walk_forward
+
+# what gets tuned - any MacdConfig attribute the strategy reads
+DEFAULT_GRID = {"profit_target": [1.0, 1.5, 2.0, 2.5, 3.0]}
+# bars a back test skips at the start of its data, so the signals have something to work with
+WARM_UP_BARS = 250
+
+
+def parameter_sets(grid: dict) -> list:
+    """Every combination of the values in grid, as {parameter: value} dicts"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def make_windows(
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    in_sample: pd.Timedelta,
+    out_of_sample: pd.Timedelta,
+    step: pd.Timedelta = None,
+) -> list:
+    """Rolling (in_start, in_end, out_start, out_end) windows between start and end, each end
+    excluded. Windows move on by step, which defaults to out_of_sample so the out of sample
+    stretches follow on from each other. Only whole windows are returned"""
+    step = step if step is not None else out_of_sample
+    windows = []
+    in_start = start
+    while in_start + in_sample + out_of_sample <= end:
+        in_end = in_start + in_sample
+        windows.append((in_start, in_end, in_end, in_end + out_of_sample))
+        in_start += step
+    return windows
+
+
+def total_profit(plays: pd.DataFrame) -> float:
+    return float(plays.profit.sum()) if len(plays) > 0 else 0.0
+
+
+def run_back_test(
+    config_factory, handles: dict, symbols: list, params: dict, start, end
+) -> pd.DataFrame:
+    """One back test from start up to end (included), with params set on the config. Runs in the
+    pool, so config_factory has to be picklable. Returns the plays that finished - a play still
+    open at end hasn't got a result yet, so it's left out"""
+    log_setup.configure(back_testing=True)
+    config = config_factory()
+    config.shared_bars = handles
+    config.bars_start = start
+    config.bars_end = end
+    for name, value in params.items():
+        setattr(config, name, value)
+    config.store.put(path=config.path_state, value="[]")
+    config.store.put(path=config.path_rules, value="[]")
+
+    # the state machine prints as it goes, which is just noise from a pool of them
+    with redirect_stdout(io.StringIO()):
+        bot = MacdBot(symbols=symbols, config=config, run_id=utils.generate_id())
+        bot.process_bars()
+
+    telemetry = bot.bot_telemetry
+    telemetry.generate_df()
+    plays = getattr(telemetry, "plays_df", None)
+    if plays is None:
+        return pd.DataFrame(
+            columns=["play_id", "symbol", "buy_value", "sell_value", "profit", "start", "end"]
+        )
+
+    open_plays = {worker.play_id for worker in bot.symbols.values() if worker.play_id is not None}
+    return plays.loc[~plays.play_id.isin(open_plays)].reset_index(drop=True)
+
+
+class WalkForward:
+    def __init__(
+        self,
+        config_factory,
+        symbols: list,
+        interval: str = "5m",
+        in_sample: pd.Timedelta = pd.Timedelta(days=60),
+        out_of_sample: pd.Timedelta = pd.Timedelta(days=14),
+        grid: dict = None,
+        objective=total_profit,
+        balance: float = 100000,
+        max_workers: int = None,
+    ):
+        self.config_factory = config_factory
+        self.symbols = symbols
+        self.interval = interval
+        self.interval_delta, _ = utils.get_interval_settings(interval)
+        self.in_sample = in_sample
+        self.out_of_sample = out_of_sample
+        self.parameter_sets = parameter_sets(grid if grid is not None else DEFAULT_GRID)
+        self.objective = objective
+        self.balance = balance
+        self.max_workers = max_workers
+
+    def date_range(self, all_bars: dict) -> tuple:
+        # same as a back test - from when every symbol has warmed up, to the last bar there is
+        start = max(bars.index[min(WARM_UP_BARS, len(bars) - 1)] for bars in all_bars.values())
+        end = max(bars.index[-1] for bars in all_bars.values()) + self.interval_delta
+        return start, end
+
+    def run(self, all_bars: dict) -> tuple:
+        """Walks forward through all_bars ({symbol: bars}). Returns the windows report, the
+        stitched out of sample plays and the out of sample equity curve"""
+        windows = make_windows(*self.date_range(all_bars), self.in_sample, self.out_of_sample)
+        if len(windows) == 0:
+            raise ValueError(
+                f"Not enough bars for a {self.in_sample} in sample and {self.out_of_sample} out of "
+                f"sample window"
+            )
+        log_wp.info(
+            f"Walking forward through {len(windows)} windows, {len(self.parameter_sets)} "
+            f"parameter sets each"
+        )
+
+        with shared_bars.SharedBarRegistry() as registry:
+            for symbol, bars in all_bars.items():
+                registry.publish(symbol, utils.add_signals(bars, self.interval))
+            test = partial(run_back_test, self.config_factory, registry.handles, self.symbols)
+
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                in_sample = {
+                    (window, position): pool.submit(
+                        test, params, window[0], window[1] - self.interval_delta
+                    )
+                    for window in windows
+                    for position, params in enumerate(self.parameter_sets)
+                }
+                # first best wins a tie, so an empty window keeps the first parameter set
+                best = {}
+                for (window, position), future in in_sample.items():
+                    score = self.objective(future.result())
+                    if window not in best or score > best[window][1]:
+                        best[window] = (position, score)
+
+                out_of_sample = {
+                    window: pool.submit(
+                        test,
+                        self.parameter_sets[best[window][0]],
+                        window[2],
+                        window[3] - self.interval_delta,
+                    )
+                    for window in windows
+                }
+                results = {window: future.result() for window, future in out_of_sample.items()}
+
+        return self._report(windows, best, results)
+
+    def _report(self, windows: list, best: dict, results: dict) -> tuple:
+        rows = []
+        window_plays = []
+        for number, window in enumerate(windows):
+            position, score = best[window]
+            params = self.parameter_sets[position]
+            plays = results[window]
+            rows.append(
+                {
+                    "window": number,
+                    "in_start": window[0],
+                    "in_end": window[1],
+                    "out_start": window[2],
+                    "out_end": window[3],
+                    **params,
+                    "in_sample_score": score,
+                    "out_of_sample_score": self.objective(plays),
+                    "plays": len(plays),
+                    "win_rate": (plays.profit > 0).mean() if len(plays) > 0 else None,
+                }
+            )
+            window_plays.append(plays.assign(window=number, **params))
+
+        report = pd.DataFrame(rows).set_index("window")
+        plays = pd.concat(window_plays, ignore_index=True).sort_values("end", kind="stable")
+        plays = plays.reset_index(drop=True)
+        equity = self.balance + plays.profit.astype(float).cumsum()
+        equity.index = pd.DatetimeIndex(plays.end)
+        equity.name = "equity"
+        return report, plays, equity
+
+
+def back_test_config(tabot_args: list) -> MacdConfig:
+    # what tabot would build for the same back test - one per back test, in the pool
+    return MacdConfig(tabot.build_parser().parse_args(tabot_args))
+
+
+def main(args):
+    symbols = sample_symbols.input_symbols[args.symbols]
+    all_bars = {}
+    for symbol in symbols:
+        bars = utils.load_bars(
+            symbol["symbol"],
+            bucket=MacdConfig.SAVED_SYMBOL_DATA_BUCKET,
+            key_base=f"{MacdConfig.SAVED_SYMBOL_KEY_BASE}{args.interval}/",
+            path=args.bars_path,
+        )
+        if bars is not None:
+            all_bars[symbol["symbol"]] = bars
+
+    tabot_args = [
+        "--run_type=back_test",
+        f"--interval={args.interval}",
+        f"--symbols={args.symbols}",
+        f"--back_testing_balance={args.back_testing_balance}",
+        "--back_testing_override_broker",
+        "--back_testing_skip_bar_update",
+    ]
+    if args.parameters_file:
+        tabot_args.append(f"--parameters_file={args.parameters_file}")
+
+    walk_forward = WalkForward(
+        partial(back_test_config, tabot_args),
+        symbols=symbols,
+        interval=args.interval,
+        in_sample=pd.Timedelta(days=float(args.in_sample_days)),
+        out_of_sample=pd.Timedelta(days=float(args.out_of_sample_days)),
+        grid={"profit_target": [float(value) for value in args.profit_targets.split(",")]},
+        balance=float(args.back_testing_balance),
+        max_workers=int(args.workers) if args.workers else None,
+    )
+    report, plays, equity = walk_forward.run(all_bars)
+
+    report.to_csv(f"{args.output_path}/walk_forward_windows.csv")
+    plays.to_csv(f"{args.output_path}/walk_forward_plays.csv")
+    equity.to_csv(f"{args.output_path}/walk_forward_equity.csv")
+    print(report.to_string())
+    print(f"Out of sample profit {total_profit(plays):,.2f} from {len(plays)} plays")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Walk forward optimisation of the MACD bot")
+    parser.add_argument("--bars_path", default=None, help="{symbol}.csv bars instead of S3")
+    parser.add_argument("--symbols", default="crypto_symbol")
+    parser.add_argument("--interval", default="5m")
+    parser.add_argument("--in_sample_days", default=60)
+    parser.add_argument("--out_of_sample_days", default=14)
+    parser.add_argument(
+        "--profit_targets",
+        default=",".join(str(value) for value in DEFAULT_GRID["profit_target"]),
+        help="Comma separated profit targets to try in each in sample window",
+    )
+    parser.add_argument("--back_testing_balance", default=100000)
+    parser.add_argument("--parameters_file", default=None)
+    parser.add_argument("--workers", default=None, help="Back tests run at once, default all CPUs")
+    parser.add_argument("--output_path", default=".")
+    main(parser.parse_args())